@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .models import AccountActivation, PasswordReset 
 
-admin.site.register(AccountActivation)
-admin.site.register(PasswordReset)
+@admin.register(AccountActivation, PasswordReset)
+class UserActionAdmin(admin.ModelAdmin):
+    list_select_related = ('user',)
 
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+import hashlib
+import time
+
+TOKEN_CACHE_PREFIX = 'auth_token'
+LOCAL_CACHE_MAX_ENTRIES = 1000
+
+local_token_cache = {}
+
+def generate_token_cache_key(key):
+    """
+    Returns the cache key of an authentication token, using a hash to keep the raw token out of the cache.
+    """
+    return f"{TOKEN_CACHE_PREFIX}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+def get_cached_token(key):
+    """
+    Returns the cached token (including its user) from the process-local cache or the shared cache,
+    or None if the token is not cached.
+    """
+    cache_key = generate_token_cache_key(key)
+    local_entry = local_token_cache.get(cache_key)
+    if local_entry and local_entry[0] > time.monotonic():
+        return local_entry[1]
+    token = cache.get(cache_key)
+    if token is not None:
+        set_local_token(cache_key, token)
+    return token
+
+def set_local_token(cache_key, token):
+    """
+    Stores a token in the process-local cache, which is reset once it holds too many entries.
+    """
+    if len(local_token_cache) >= LOCAL_CACHE_MAX_ENTRIES:
+        local_token_cache.clear()
+    local_token_cache[cache_key] = (time.monotonic() + getattr(settings, 'TOKEN_LOCAL_CACHE_TTL', 5), token)
+
+def cache_token(token):
+    """
+    Stores a token (including its user) in the process-local and the shared cache.
+    """
+    cache_key = generate_token_cache_key(token.key)
+    cache.set(cache_key, token, getattr(settings, 'TOKEN_CACHE_TTL', 60))
+    set_local_token(cache_key, token)
+
+async def aget_cached_token(key):
+    """
+    Async version of "get_cached_token".
+    """
+    cache_key = generate_token_cache_key(key)
+    local_entry = local_token_cache.get(cache_key)
+    if local_entry and local_entry[0] > time.monotonic():
+        return local_entry[1]
+    token = await cache.aget(cache_key)
+    if token is not None:
+        set_local_token(cache_key, token)
+    return token
+
+async def acache_token(token):
+    """
+    Async version of "cache_token".
+    """
+    cache_key = generate_token_cache_key(token.key)
+    await cache.aset(cache_key, token, getattr(settings, 'TOKEN_CACHE_TTL', 60))
+    set_local_token(cache_key, token)
+
+def invalidate_cached_tokens(keys):
+    """
+    Removes the given tokens from the shared cache and the local cache of the current process.
+    Other processes keep their local entry until it expires after "TOKEN_LOCAL_CACHE_TTL" seconds.
+    """
+    cache_keys = [generate_token_cache_key(key) for key in keys]
+    cache.delete_many(cache_keys)
+    for cache_key in cache_keys:
+        local_token_cache.pop(cache_key, None)
+
+def invalidate_cached_tokens_for_user(user):
+    """
+    Removes all tokens of a user from the caches, e.g. after a password reset or deactivation.
+    """
+    invalidate_cached_tokens(Token.objects.filter(user=user).values_list('key', flat=True))
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication keeping the token-to-user mapping in a short-lived process-local cache
+    ("TOKEN_LOCAL_CACHE_TTL") and the shared cache ("TOKEN_CACHE_TTL"), so authenticated requests
+    don't need a database query. Cached tokens are invalidated by the signals in users_app/signals.py.
+    """
+    def authenticate_credentials(self, key):
+        token = get_cached_token(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache_token(token)
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
+
+async def aauthenticate(request):
+    """
+    Authenticates a request to an async view like "CachedTokenAuthentication", using the async cache and ORM.
+    Returns the user of the token in the "Authorization" header, or None if it is missing, invalid or inactive.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    token = await aget_cached_token(auth[1])
+    if token is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=auth[1])
+        except Token.DoesNotExist:
+            return None
+        await acache_token(token)
+    return token.user if token.user.is_active else None
@@ -24,10 +24,11 @@ class LoginSerializer(serializers.Serializer):
             raise serializers.ValidationError('Invalid credentials.')
         elif not user.is_active:
             raise serializers.ValidationError('Your account is currently inactive. Please check your email.')         
+        attrs.update(user=user)
         return attrs
     
     def create(self, validated_data):
-        user = User.objects.get(email=validated_data['email'])
+        user = validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
         return get_auth_response_data(user=user, token=token)              
 
@@ -78,7 +79,7 @@ class AccountActivationSerializer(serializers.Serializer):
         return value
         
     def create(self, validated_data):
-        activation_obj = AccountActivation.objects.get(token=validated_data['token'])
+        activation_obj = AccountActivation.objects.select_related('user').get(token=validated_data['token'])
         activation_obj.user.is_active = True
         activation_obj.user.save()
         AccountActivation.delete_all_for_user(user=activation_obj.user)
@@ -122,7 +123,7 @@ class PerformPasswordResetSerializer(serializers.Serializer):
         
     def create(self, validated_data):
         new_password = validated_data['new_password']
-        reset_obj = PasswordReset.objects.get(token=validated_data['token'])
+        reset_obj = PasswordReset.objects.select_related('user').get(token=validated_data['token'])
         reset_obj.user.set_password(new_password)
         reset_obj.user.save()
         PasswordReset.delete_all_for_user(user=reset_obj.user)
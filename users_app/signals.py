@@ -0,0 +1,21 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_cached_tokens, invalidate_cached_tokens_for_user
+
+@receiver(post_delete, sender=Token)
+def delete_token(sender, instance, *args, **kwargs):
+    """
+    Removes a deleted token from the authentication cache, e.g. on logout or user deletion.
+    """
+    invalidate_cached_tokens([instance.key])
+
+@receiver(post_save, sender=User)
+def update_user(sender, instance, created, **kwargs):
+    """
+    Removes the tokens of a changed user from the authentication cache,
+    so deactivations and password resets take effect on the next request.
+    """
+    if not created:
+        invalidate_cached_tokens_for_user(instance)
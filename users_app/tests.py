@@ -6,6 +6,8 @@ from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
 from .models import AccountActivation, AccountActivationTokenGenerator, PasswordReset
+from .views import LoginView, RegistrationView, RequestPasswordReset, PerformPasswordReset
+from videos_app.tests import QueryBudgetTestMixin
 from datetime import timedelta
 
 os.environ.setdefault('FRONTEND_BASE_URL', 'http://localhost:4200/')
@@ -263,6 +265,47 @@ class UserTests(APITestCase):
         url = reverse('user')
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_get_user_cached_token_ok(self):
+        """
+        Tests user retrieval by a cached token.
+
+        Asserts:
+            - No database queries once the token is cached.
+            - 200 OK status.
+        """
+        url = reverse('user')
+        self.client.get(url, format='json')
+        with self.assertNumQueries(0):
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_user_deleted_token_unauthorized(self):
+        """
+        Tests failing user retrieval by a cached token deleted on logout.
+
+        Asserts:
+            - 401 unauthorized status.
+        """
+        url = reverse('user')
+        self.client.get(url, format='json')
+        self.token.delete()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_get_user_deactivated_unauthorized(self):
+        """
+        Tests failing user retrieval by a cached token after deactivating the user.
+
+        Asserts:
+            - 401 unauthorized status.
+        """
+        url = reverse('user')
+        self.client.get(url, format='json')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         
 class PasswordResetTests(APITestCase):
     """
@@ -397,4 +440,99 @@ class PasswordResetTests(APITestCase):
         url = reverse('perform-pw-reset')
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertIn('new_password', response.data)
\ No newline at end of file
+        self.assertIn('new_password', response.data)
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """
+    Query budget test class testing the number of queries of login, registration and password resets.
+    """
+    def setUp(self):
+        """
+        Creates a user with an authentication token.
+        """
+        self.user = User.objects.create_user(username='testuser', email='testemail@email.com', password='testpassword')
+        Token.objects.create(user=self.user)
+        self.user_count = 0
+
+    def add_users(self, count=5):
+        """
+        Creates further users, each with an authentication token, an account activation and a password reset.
+        """
+        for _ in range(count):
+            self.user_count += 1
+            user = User.objects.create_user(username=f"otheruser{self.user_count}", email=f"otheruser{self.user_count}@email.com")
+            Token.objects.create(user=user)
+            AccountActivation.objects.create(user=user, token=f"activation{self.user_count}")
+            PasswordReset.objects.create(user=user, token=f"reset{self.user_count}")
+
+    def test_login_budget(self):
+        """
+        Tests the queries of a login.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding users.
+        """
+        data = {'email': self.user.email, 'password': 'testpassword'}
+        send = lambda: self.client.post(reverse('login'), data, format='json')
+        self.assertWithinQueryBudget(LoginView, 'post', send, status.HTTP_200_OK)
+        self.assertConstantQueries(send, self.add_users)
+
+    def test_signup_budget(self):
+        """
+        Tests the queries of a registration.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding users.
+        """
+        emails = (f"newuser{index}@email.com" for index in range(3))
+        send = lambda: self.client.post(reverse('signup'), {'email': next(emails), 'password': 'asd123asd123'}, format='json')
+        self.assertWithinQueryBudget(RegistrationView, 'post', send, status.HTTP_201_CREATED)
+        self.assertConstantQueries(send, self.add_users)
+
+    def test_request_password_reset_budget(self):
+        """
+        Tests the queries of a password reset request, replacing an existing password reset.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding users.
+        """
+        send = lambda: self.client.post(reverse('request-pw-reset'), {'email': self.user.email}, format='json')
+        self.assertWithinQueryBudget(RequestPasswordReset, 'post', send, status.HTTP_200_OK)
+        self.assertConstantQueries(send, self.add_users)
+
+    def test_perform_password_reset_budget(self):
+        """
+        Tests the queries of a password reset, using a new token for each request.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding users.
+        """
+        def create_password_reset():
+            self.pw_reset_token = PasswordResetTokenGenerator().make_token(self.user)
+            PasswordReset.objects.create(user=self.user, token=self.pw_reset_token)
+
+        send = lambda: self.client.post(
+            reverse('perform-pw-reset'), {'token': self.pw_reset_token, 'new_password': 'asd123asd123'}, format='json'
+        )
+        self.assertWithinQueryBudget(PerformPasswordReset, 'post', send, status.HTTP_200_OK, prepare=create_password_reset)
+        self.assertConstantQueries(send, self.add_users, prepare=create_password_reset)
+
+    def test_admin_lists_constant(self):
+        """
+        Tests the queries of the account activation and password reset lists in the admin, which display the user of each row.
+
+        Asserts:
+            - Same number of queries after adding users.
+        """
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        for url_name in ['admin:users_app_accountactivation_changelist', 'admin:users_app_passwordreset_changelist']:
+            with self.subTest(url_name=url_name):
+                send = lambda: self.client.get(reverse(url_name))
+                self.assertEqual(send().status_code, status.HTTP_200_OK)
+                self.assertConstantQueries(send, self.add_users)
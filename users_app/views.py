@@ -1,11 +1,11 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .serializers import LoginSerializer, RegistrationSerializer, UserSerializer
 from .serializers import AccountActivationSerializer
 from .serializers import RequestPasswordResetSerializer, PerformPasswordResetSerializer
+from .authentication import CachedTokenAuthentication
 
 class LoginView(APIView):
     """
@@ -13,6 +13,7 @@ class LoginView(APIView):
     """
     authentication_classes = []
     permission_classes = [AllowAny]
+    query_budgets = {'post': 3}
 
     def post(self, request):
         """
@@ -30,6 +31,7 @@ class RegistrationView(APIView):
     """
     authentication_classes = []
     permission_classes = [AllowAny]
+    query_budgets = {'post': 5}
 
     def post(self, request):
         """
@@ -45,7 +47,7 @@ class UserView(APIView):
     """
     API endpoint for user profile access.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -78,6 +80,7 @@ class RequestPasswordReset(APIView):
     """
     authentication_classes = []
     permission_classes = [AllowAny]
+    query_budgets = {'post': 3}
 
     def post(self, request):
         """
@@ -95,6 +98,7 @@ class PerformPasswordReset(APIView):
     """
     authentication_classes = []
     permission_classes = [AllowAny]
+    query_budgets = {'post': 5}
 
     def post(self, request):
         """
@@ -0,0 +1,258 @@
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+from django_redis.cache import RedisCache
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+import hashlib
+import logging
+import math
+import time
+
+logger = logging.getLogger('videoflix.metrics')
+
+METRICS_KEY_PREFIX = 'metrics'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Default buckets of the Prometheus client libraries, suitable for request latencies in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Values are stored as integers, since only integers can be incremented atomically in the cache.
+# Fractional values are stored in millionths.
+FRACTION_SCALE = 1000000
+
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+REGISTRY = []
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + '}'
+
+def format_value(value):
+    return '+Inf' if value == math.inf else str(value)
+
+def get_redis():
+    """
+    Returns the Redis client of the default cache, or None if another cache backend is used.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    return backend.client.get_client(write=True) if isinstance(backend, RedisCache) else None
+
+class Metric:
+    """
+    Metric family stored in the cache, so the web and worker processes share their values.
+    Each label combination (series) is registered once in an index of the family, which is read
+    when the metrics are exported. Series and values never expire.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), scale=1):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.scale = scale
+        REGISTRY.append(self)
+
+    def get_labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' requires the labels {', '.join(self.labelnames)}.")
+        return {name: str(labels[name]) for name in self.labelnames}
+
+    def generate_key(self, labels, suffix):
+        series_hash = hashlib.md5(format_labels(labels).encode()).hexdigest()
+        return f"{METRICS_KEY_PREFIX}:{self.name}:{series_hash}:{suffix}"
+
+    @property
+    def series_count_key(self):
+        return f"{METRICS_KEY_PREFIX}:{self.name}:series"
+
+    def register_series(self, labels):
+        """
+        Adds a label combination to the index of the family, unless another process has already done so.
+        """
+        if not cache.add(self.generate_key(labels, 'registered'), True, timeout=None):
+            return
+        cache.add(self.series_count_key, 0, timeout=None)
+        index = cache.incr(self.series_count_key)
+        cache.set(f"{self.series_count_key}:{index}", labels, timeout=None)
+
+    def increment(self, labels, suffix, amount, register=False):
+        """
+        Increments a stored value, creating it (and registering the series, if requested) when missing.
+        Cache errors are logged instead of raised, so recording a metric never breaks a request or a job.
+        """
+        key = self.generate_key(labels, suffix)
+        try:
+            self.increment_key(key, labels, amount, register)
+        except Exception:
+            logger.warning("Recording metric '%s' failed.", self.name, exc_info=True)
+
+    def increment_many(self, labels, amounts, register=False):
+        """
+        Increments several stored values of a series by suffix. With Redis, all values are incremented
+        in a single pipelined round trip and the series is registered once its first value has been created.
+        Other cache backends increment the values one by one.
+        """
+        keys = {self.generate_key(labels, suffix): amount for suffix, amount in amounts.items()}
+        try:
+            redis = get_redis()
+            if redis is None:
+                for index, (key, amount) in enumerate(keys.items()):
+                    self.increment_key(key, labels, amount, register and index == 0)
+                return
+            pipe = redis.pipeline(transaction=False)
+            for key, amount in keys.items():
+                pipe.incrby(cache.make_key(key), amount)
+            first_amount, first_value = next(iter(keys.values())), pipe.execute()[0]
+            if register and first_value == first_amount:
+                self.register_series(labels)
+        except Exception:
+            logger.warning("Recording metric '%s' failed.", self.name, exc_info=True)
+
+    def increment_key(self, key, labels, amount, register):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if register:
+                self.register_series(labels)
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, amount)
+
+    def get_series(self):
+        """
+        Returns the label combinations registered for the family.
+        """
+        count = cache.get(self.series_count_key) or 0
+        index_keys = [f"{self.series_count_key}:{index}" for index in range(1, count + 1)]
+        return list(cache.get_many(index_keys).values())
+
+    def scale_value(self, value):
+        return value / self.scale if self.scale != 1 else value
+
+    def collect(self):
+        """
+        Returns the sample lines of all series of the family.
+        """
+        raise NotImplementedError
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.collect()]
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.increment(self.get_labels(labels), 'value', round(amount * self.scale), register=True)
+
+    def collect(self):
+        series = self.get_series()
+        values = cache.get_many([self.generate_key(labels, 'value') for labels in series])
+        return [
+            f"{self.name}{format_labels(labels)} {format_value(self.scale_value(values.get(self.generate_key(labels, 'value'), 0)))}"
+            for labels in series
+        ]
+
+class Histogram(Metric):
+    """
+    Histogram counting observations per bucket. Each observation increments a single bucket,
+    the cumulative bucket counts expected by Prometheus are summed up when exporting.
+    Count, sum and bucket of an observation are incremented together, see Metric.increment_many.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, scale=FRACTION_SCALE):
+        super().__init__(name, documentation, labelnames, scale)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, value, **labels):
+        labels = self.get_labels(labels)
+        bucket = next(bound for bound in self.buckets if value <= bound)
+        self.increment_many(labels, {'count': 1, 'sum': round(value * self.scale), f"bucket:{format_value(bucket)}": 1}, register=True)
+
+    def collect(self):
+        series = self.get_series()
+        suffixes = ['count', 'sum', *(f"bucket:{format_value(bound)}" for bound in self.buckets)]
+        values = cache.get_many([self.generate_key(labels, suffix) for labels in series for suffix in suffixes])
+        lines = []
+        for labels in series:
+            cumulative = 0
+            for bound in self.buckets:
+                cumulative += values.get(self.generate_key(labels, f"bucket:{format_value(bound)}"), 0)
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(self.scale_value(values.get(self.generate_key(labels, 'sum'), 0)))}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {values.get(self.generate_key(labels, 'count'), 0)}")
+        return lines
+
+def render_metrics():
+    """
+    Returns all registered metric families in the Prometheus text exposition format.
+    """
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+REQUEST_DURATION = Histogram(
+    'videoflix_http_request_duration_seconds', 'Latency of the HTTP requests in seconds, by view.',
+    ['view', 'method', 'status']
+)
+
+def get_view_name(request):
+    """
+    Returns the URL name of the view handling a request, keeping the number of series bounded.
+    """
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unmatched'
+    return resolver_match.view_name
+
+def observe_request(request, response, started_at):
+    REQUEST_DURATION.observe(
+        time.perf_counter() - started_at,
+        view=get_view_name(request), method=request.method if request.method in HTTP_METHODS else 'other',
+        status=response.status_code
+    )
+
+class RequestMetricsMiddleware:
+    """
+    Records the latency of every request in the "videoflix_http_request_duration_seconds" histogram.
+    Async requests are handled without switching to a thread, except for recording the observation.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        observe_request(request, response, started_at)
+        return response
+
+    async def __acall__(self, request):
+        started_at = time.perf_counter()
+        response = await self.get_response(request)
+        await sync_to_async(observe_request)(request, response, started_at)
+        return response
+
+@never_cache
+@require_GET
+def metrics_view(request):
+    """
+    Exports the metrics for Prometheus. The scraper has to send the "METRICS_TOKEN" setting as bearer token.
+    Without a token, the metrics are only exported in debug mode.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden('The "METRICS_TOKEN" setting is required outside debug mode.')
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden('Invalid metrics token.')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
@@ -0,0 +1,208 @@
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django_redis.cache import RedisCache
+from rest_framework import serializers
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+from .metrics import get_view_name
+import logging
+import random
+import time
+
+logger = logging.getLogger('videoflix.performance')
+
+REQUEST_PROFILE = ContextVar('request_profile', default=None)
+MISSING = object()
+
+class RequestProfile:
+    """
+    Performance figures of a single request: database queries, cache lookups and named timing spans (in seconds).
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.spans = defaultdict(float)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def record_query(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper counting and timing the queries of the request.
+        """
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started_at
+
+    def generate_server_timing(self, total):
+        """
+        Returns the "Server-Timing" header value, with durations in milliseconds.
+        """
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            *(f'{name};dur={duration * 1000:.1f}' for name, duration in self.spans.items()),
+            f'total;dur={total * 1000:.1f}',
+        ]
+        return ', '.join(metrics)
+
+def get_request_profile():
+    return REQUEST_PROFILE.get()
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting and timing the queries of the current request, if any.
+    """
+    profile = get_request_profile()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+def install_query_recorder():
+    """
+    Installs the query recorder on the database connections of the current thread, unless already installed.
+    Connections are thread-local, so this has to run in the thread executing the queries of a request.
+    The recorder is inserted first, so execute wrappers of other code are still removed in order.
+    """
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, record_query)
+
+@contextmanager
+def measure(name):
+    """
+    Adds the time spent within the block to the named span of the current request, if any.
+    """
+    profile = get_request_profile()
+    if profile is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] += time.perf_counter() - started_at
+
+class InstrumentedCacheMixin:
+    """
+    Cache backend mixin counting the hits and misses of the current request.
+    """
+    def get(self, key, default=None, version=None, **kwargs):
+        profile = get_request_profile()
+        if profile is None:
+            return super().get(key, default, version, **kwargs)
+        started_at = time.perf_counter()
+        value = super().get(key, MISSING, version, **kwargs)
+        profile.cache_time += time.perf_counter() - started_at
+        if value is MISSING:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None, **kwargs):
+        profile = get_request_profile()
+        if profile is None:
+            return super().get_many(keys, version, **kwargs)
+        keys = list(keys)
+        started_at = time.perf_counter()
+        values = super().get_many(keys, version, **kwargs)
+        profile.cache_time += time.perf_counter() - started_at
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+        return values
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+class SerializationTimingMixin:
+    """
+    Serializer mixin recording the time spent building the representation as "serialize" span of the request.
+    Nested serializers don't access "data", so only top-level serializers are measured.
+    """
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+class TimedListSerializer(SerializationTimingMixin, serializers.ListSerializer):
+    """
+    List serializer recording its serialization time, see "SerializationTimingMixin".
+    """
+
+def is_sampled():
+    return random.random() < getattr(settings, 'PERFORMANCE_SLOW_REQUEST_SAMPLE_RATE', 1)
+
+def log_slow_request(request, response, profile, total):
+    """
+    Logs a request exceeding the "PERFORMANCE_SLOW_REQUEST_THRESHOLD" setting (in seconds),
+    sampled according to the "PERFORMANCE_SLOW_REQUEST_SAMPLE_RATE" setting.
+    """
+    threshold = getattr(settings, 'PERFORMANCE_SLOW_REQUEST_THRESHOLD', 1)
+    if threshold is None or total < threshold or not is_sampled():
+        return
+    spans = ' '.join(f"{name}_ms={duration * 1000:.1f}" for name, duration in profile.spans.items())
+    logger.warning(
+        "Slow request: %s %s view=%s status=%s total_ms=%.1f db_queries=%d db_ms=%.1f cache_hits=%d cache_misses=%d %s",
+        request.method, request.path, get_view_name(request), response.status_code, total * 1000,
+        profile.db_queries, profile.db_time * 1000, profile.cache_hits, profile.cache_misses, spans
+    )
+
+class PerformanceMiddleware:
+    """
+    Records the database queries, cache hits and misses, serialization time and total latency of every request.
+    The figures are sent in a "Server-Timing" header if enabled by the "PERFORMANCE_SERVER_TIMING" setting
+    (by default in debug mode only), and slow requests are logged. For async requests, the query recorder
+    is installed in the thread running their database queries, see "install_query_recorder".
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @contextmanager
+    def profile_request(self):
+        profile = RequestProfile()
+        token = REQUEST_PROFILE.set(profile)
+        try:
+            yield profile
+        finally:
+            REQUEST_PROFILE.reset(token)
+
+    def process_profile(self, request, response, profile):
+        total = profile.elapsed
+        if getattr(settings, 'PERFORMANCE_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = profile.generate_server_timing(total)
+        log_slow_request(request, response, profile, total)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_query_recorder()
+        with self.profile_request() as profile:
+            response = self.get_response(request)
+        return self.process_profile(request, response, profile)
+
+    async def __acall__(self, request):
+        await sync_to_async(install_query_recorder)()
+        with self.profile_request() as profile:
+            response = await self.get_response(request)
+        return self.process_profile(request, response, profile)
@@ -20,6 +20,20 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Media files are delivered by the front proxy if a sendfile backend is set ("nginx" for X-Accel-Redirect
+# to an internal location aliasing MEDIA_ROOT, "xsendfile" for X-Sendfile), see videos_app/media.py
+
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Video files are only served using signed URLs, which expire MEDIA_URL_TTL seconds after the end of the
+# signing interval they were created in (in seconds). MEDIA_URL_TTL must exceed CACHE_TTL, since the signed
+# playlist URLs are part of the cached video catalogue responses, see videos_app/signing.py
+
+MEDIA_SIGNED_URLS = True
+MEDIA_URL_SIGNING_INTERVAL = 60 * 60
+MEDIA_URL_TTL = 60 * 60 * 12
+
 TESTING = 'test' in sys.argv
 
 # Quick-start development settings - unsuitable for production
@@ -70,13 +84,18 @@ INSTALLED_APPS = [
     'django.contrib.sites',
 ]
 
-if not TESTING:
+# The debug toolbar slows down every request, so it is only enabled for development
+DEBUG_TOOLBAR = DEBUG and not TESTING
+
+if DEBUG_TOOLBAR:
     INSTALLED_APPS = [
         *INSTALLED_APPS,
         'debug_toolbar',
     ]
 
 MIDDLEWARE = [
+    'videoflix.metrics.RequestMetricsMiddleware',
+    'videoflix.performance.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -87,7 +106,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-if not TESTING:
+if DEBUG_TOOLBAR:
     MIDDLEWARE = [
         'debug_toolbar.middleware.DebugToolbarMiddleware',
         *MIDDLEWARE,
@@ -95,7 +114,7 @@ if not TESTING:
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'videoflix.performance.InstrumentedLocMemCache',
         'LOCATION': 'test-cache',
     }
 }
@@ -103,7 +122,7 @@ CACHES = {
 if not TESTING:
     CACHES = {
         'default': {
-            'BACKEND': 'django_redis.cache.RedisCache',
+            'BACKEND': 'videoflix.performance.InstrumentedRedisCache',
             'LOCATION': 'redis://127.0.0.1:6379/1',
             'OPTIONS': {
                 'PASSWORD': REDIS_PW,
@@ -113,7 +132,20 @@ if not TESTING:
         }
     }
 
-CACHE_TTL = 60 * 15
+# Cached video catalogue responses are invalidated on every video change, see videos_app/cache.py
+
+CACHE_TTL = 60 * 60 * 6
+
+# Playback progress updates are buffered in Redis and written to the database
+# by the "flush_video_completions" command
+
+PROGRESS_WRITE_BEHIND = not TESTING
+
+# Authentication tokens are cached per process and in the shared cache (in seconds),
+# see users_app/authentication.py
+
+TOKEN_CACHE_TTL = 60
+TOKEN_LOCAL_CACHE_TTL = 5
 
 ROOT_URLCONF = 'videoflix.urls'
 
@@ -224,6 +256,59 @@ RQ_QUEUES = {
     }
 }
 
+# HLS transcoding configuration
+# "single_pass" decodes the source once and writes all resolutions from one FFMPEG process,
+# "per_resolution" runs a separate FFMPEG process for each resolution,
+# "parallel" enqueues a separate job for each resolution to be processed by multiple workers.
+
+HLS_TRANSCODE_MODE = 'single_pass'
+
+# HLS segment format
+# "mpegts" writes MPEG-TS segments with muxed audio,
+# "fmp4" writes fragmented MP4 (CMAF) segments with a separate audio rendition
+# and an additional DASH manifest describing the same files.
+
+HLS_SEGMENT_FORMAT = 'mpegts'
+
+# Default encoding preset, which can be overridden per video, see ENCODING_PRESETS in videos_app/utils.py
+# "standard" encodes at fixed bitrates, "per_title" and "per_title_quality" use capped CRF values
+# picked from a sample encode of each video.
+
+HLS_ENCODING_PRESET = 'standard'
+
+# Timeouts of the processing steps in seconds (see DEFAULT_STEP_TIMEOUTS in videos_app/tasks.py),
+# extended by HLS_TIMEOUT_REALTIME_FACTOR seconds per second of video for transcoding and artwork
+
+HLS_STEP_TIMEOUTS = {
+    'probe': 60,
+    'analysis': 600,
+    'artwork': 600,
+    'transcode': 600,
+}
+HLS_TIMEOUT_REALTIME_FACTOR = 4
+
+# Automatic retries of failed processing jobs, waiting the given number of seconds before each retry
+
+HLS_JOB_RETRIES = 3
+HLS_JOB_RETRY_INTERVALS = [60, 300, 900]
+
+# Minimum number of seconds between two progress updates of a running conversion
+
+HLS_PROGRESS_UPDATE_INTERVAL = 2
+
+# Request performance instrumentation (see videoflix/performance.py)
+# The Server-Timing header reveals query counts and timings to every client, so it is only sent in debug mode
+# Requests slower than the threshold (in seconds, None disables logging) are logged at the given sample rate
+
+PERFORMANCE_SERVER_TIMING = DEBUG
+PERFORMANCE_SLOW_REQUEST_THRESHOLD = 1
+PERFORMANCE_SLOW_REQUEST_SAMPLE_RATE = 0.1
+
+# Bearer token required to scrape the Prometheus metrics at /metrics, which expose view names and traffic.
+# Without a token, the endpoint is only served in debug mode.
+
+METRICS_TOKEN = None
+
 # Import export configuration
 
 IMPORT_EXPORT_USE_TRANSACTIONS = True
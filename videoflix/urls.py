@@ -1,9 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from debug_toolbar.toolbar import debug_toolbar_urls
-from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+import re
+from videos_app.media import serve_media
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -11,10 +12,14 @@ urlpatterns = [
     path('api/videos/', include('videos_app.urls')),
     path('django-rq/', include('django_rq.urls')),
     path('docs/', include('docs_app.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ] 
 
-urlpatterns += static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
+urlpatterns += [
+    re_path(rf"^{re.escape(settings.MEDIA_URL.lstrip('/'))}(?P<path>.*)$", serve_media, name='media'),
+]
 urlpatterns += staticfiles_urlpatterns()
 
-if not settings.TESTING:
+if settings.DEBUG_TOOLBAR:
+    from debug_toolbar.toolbar import debug_toolbar_urls
     urlpatterns += debug_toolbar_urls()
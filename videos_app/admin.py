@@ -2,13 +2,14 @@ from django.contrib import admin
 from django import forms
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
-from .models import Video, VideoCompletion
+from .models import Video, VideoUpload, VideoCompletion
+from .progress import get_processing_progress
 
 class VideoResource(resources.ModelResource):
     
     class Meta:
         model = Video
-        exclude = ('duration_in_seconds',)
+        exclude = (*Video.METADATA_FIELDS, 'processing_state', 'playlist_path', 'dash_manifest_path', 'artwork')
 
 class VideoAdminForm(forms.ModelForm):
     description = forms.CharField(widget=forms.Textarea(attrs={'rows': 4, 'cols': 40}))
@@ -21,6 +22,24 @@ class VideoAdminForm(forms.ModelForm):
 class VideoAdmin(ImportExportModelAdmin):
     form = VideoAdminForm
     resource_class = VideoResource
-    readonly_fields = ('duration_in_seconds',)
+    list_display = (
+        '__str__', 'genre', 'resolution', 'duration_in_seconds', 'processing_state', 'processing_progress', 'created_at'
+    )
+    list_filter = ('processing_state', 'genre')
+    readonly_fields = (*Video.METADATA_FIELDS, 'processing_state', 'playlist_path', 'dash_manifest_path', 'artwork')
 
-admin.site.register(VideoCompletion)
\ No newline at end of file
+    @admin.display(description='Processing')
+    def processing_progress(self, obj):
+        progress = get_processing_progress(obj.pk)
+        if progress is None:
+            return '-'
+        if progress['current_rendition'] is None:
+            return f"{progress['percent']} %"
+        return f"{progress['percent']} % ({progress['current_rendition']}, ETA {progress['eta_seconds']} s)"
+
+@admin.register(VideoCompletion)
+class VideoCompletionAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'current_time', 'updated_at')
+    list_select_related = ('user', 'video')
+
+admin.site.register(VideoUpload)
\ No newline at end of file
@@ -0,0 +1,116 @@
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.timezone import now
+from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
+from users_app.authentication import aauthenticate
+from .models import Video, VideoCompletion
+from .serializers import VideoSerializer, VideoCompletionSerializer, VideoCompletionProgressSerializer
+from .serializers import includes_progress
+from .views import CACHE_TTL, VideoViewSet, prepare_video_queryset
+from .pagination import VideoCursorPagination
+from .cache import CATALOGUE_KEY_PREFIX, aget_catalogue_version
+from .buffer import is_write_behind_enabled, buffer_progress, get_buffered_progress
+import functools
+import hashlib
+import json
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+def token_required(view_func):
+    """
+    Decorator authenticating an async view by token, responding with 401 Unauthorized like the DRF views.
+    """
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await aauthenticate(request)
+        if user is None:
+            response = json_response({'detail': 'Invalid or missing token.'}, status_code=status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+        request.user = user
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+def wrap_request(request):
+    """
+    Wraps a Django request for the DRF serializers and query parameter helpers, without DRF authentication.
+    """
+    drf_request = Request(request)
+    drf_request.user = request.user
+    return drf_request
+
+async def serialize_videos(queryset, drf_request, context):
+    """
+    Returns the serialized videos, paginated by cursor like the DRF view if a page size is requested.
+    """
+    paginator = VideoCursorPagination()
+    if paginator.get_page_size(drf_request) is None:
+        videos = [video async for video in queryset]
+        return VideoSerializer(videos, many=True, context=context).data
+    videos = await sync_to_async(paginator.paginate_queryset)(queryset, drf_request, view=VideoViewSet())
+    return paginator.get_paginated_response(VideoSerializer(videos, many=True, context=context).data).data
+
+@require_GET
+@token_required
+async def video_list(request):
+    """
+    Async version of the video list view, supporting "fields", "include=progress", "processing_state",
+    "ordering" and "page_size". Responses without progress are cached per catalogue generation like the DRF view.
+    """
+    drf_request = wrap_request(request)
+    queryset = prepare_video_queryset(Video.objects.all(), drf_request)
+    if request.GET.get('processing_state'):
+        queryset = queryset.filter(processing_state=request.GET['processing_state'])
+    if request.GET.get('ordering') in ('created_at', '-created_at'):
+        queryset = queryset.order_by(request.GET['ordering'])
+    if includes_progress(drf_request):
+        buffered = await sync_to_async(get_buffered_progress)(request.user.pk)
+        response = json_response(await serialize_videos(queryset, drf_request, {'request': drf_request, 'buffered_progress': buffered}))
+        patch_cache_control(response, private=True)
+        return response
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    cache_key = f"{CATALOGUE_KEY_PREFIX}.{await aget_catalogue_version()}.async.{url_hash}"
+    content = await cache.aget(cache_key)
+    if content is None:
+        content = JSONRenderer().render(await serialize_videos(queryset, drf_request, {'request': drf_request}))
+        await cache.aset(cache_key, content, CACHE_TTL)
+    response = HttpResponse(content, content_type='application/json')
+    patch_cache_control(response, max_age=0)
+    return response
+
+@csrf_exempt
+@require_POST
+@token_required
+async def video_completion_create(request):
+    """
+    Async version of the video completion create view, covering both creation and update
+    of the current user's playback position, or buffering it if write-behind buffering is enabled.
+    Exempt from CSRF checks like the DRF views, since requests are authenticated by token instead of cookies.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return json_response({'detail': 'JSON parse error.'}, status_code=status.HTTP_400_BAD_REQUEST)
+    serializer = VideoCompletionProgressSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status_code=status.HTTP_400_BAD_REQUEST)
+    video_pk, current_time = serializer.validated_data['video_id'], serializer.validated_data['current_time']
+    if not await Video.objects.filter(pk=video_pk).aexists():
+        return json_response({'video_id': [f'Invalid pk "{video_pk}" - object does not exist.']}, status_code=status.HTTP_400_BAD_REQUEST)
+    if is_write_behind_enabled():
+        entry = await sync_to_async(buffer_progress)(request.user.pk, video_pk, current_time)
+        return json_response({'video_id': video_pk, **entry}, status_code=status.HTTP_202_ACCEPTED)
+    instance, created = await VideoCompletion.objects.aupdate_or_create(
+        user=request.user,
+        video_id=video_pk,
+        defaults={'current_time': current_time, 'recorded_at': now()}
+    )
+    response_serializer = VideoCompletionSerializer(instance, context={'request': wrap_request(request)})
+    return json_response(response_serializer.data, status_code=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
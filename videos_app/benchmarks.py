@@ -0,0 +1,264 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .models import Video
+from .cache import bump_catalogue_version
+from .staging import prepare_staging_dir, list_output_files, clear_output_files
+from .tasks import set_video_metadata, plan_resolutions, get_segment_format, has_separate_audio, generate_rendition_name
+from .tasks import convert_single_resolution, convert_audio_rendition, convert_all_resolutions
+from .utils import generate_playlist_basename, AUDIO_RENDITION_NAME
+import django
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'videoflix.performance.InstrumentedLocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+COMPARED_KEYS = ('p50_ms', 'p95_ms', 'per_second', 'queries', 'realtime_factor')
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def summarize(durations):
+    """
+    Returns count, mean, median, 95th percentile, minimum and maximum of request durations in milliseconds.
+    """
+    values = sorted(duration * 1000 for duration in durations)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'p50_ms': round(percentile(values, 0.5), 3),
+        'p95_ms': round(percentile(values, 0.95), 3),
+        'min_ms': round(values[0], 3),
+        'max_ms': round(values[-1], 3),
+    }
+
+def measure_endpoint(send, iterations, prepare=None):
+    """
+    Sends a request once while counting its database queries, then times the given number of requests.
+    The prepare function runs before each request without being timed, e.g. to invalidate the cache.
+    """
+    if prepare:
+        prepare()
+    with CaptureQueriesContext(connection) as queries:
+        response = send()
+    query_count = len(queries)
+    durations = []
+    for _ in range(iterations):
+        if prepare:
+            prepare()
+        started_at = time.perf_counter()
+        send()
+        durations.append(time.perf_counter() - started_at)
+    return {'status': response.status_code, 'queries': query_count, **summarize(durations)}
+
+def measure_throughput(send, iterations):
+    """
+    Sends the given number of requests back to back and returns the achieved rate per second.
+    """
+    started_at = time.perf_counter()
+    for index in range(iterations):
+        send(index)
+    elapsed = time.perf_counter() - started_at
+    return {'count': iterations, 'seconds': round(elapsed, 3), 'per_second': round(iterations / elapsed, 2) if elapsed else None}
+
+def seed_data(video_count, user_count, rng):
+    """
+    Creates ready videos and active users with tokens in bulk, so no processing jobs are enqueued.
+    """
+    genres = [genre for genre, _ in Video.GENRES]
+    videos = Video.objects.bulk_create([
+        Video(
+            title=f"Benchmark video {index}", description=f"Benchmark description {index}", genre=rng.choice(genres),
+            duration_in_seconds=rng.uniform(60, 7200), width=1920, height=1080, fps=25.0,
+            processing_state=Video.READY, playlist_path=f"videos/{index}_Benchmark/{index}_master.m3u8"
+        )
+        for index in range(video_count)
+    ])
+    password = make_password(BENCHMARK_PASSWORD)
+    users = User.objects.bulk_create([
+        User(username=f"benchmark_user_{index}", email=f"benchmark_user_{index}@example.com", password=password)
+        for index in range(user_count)
+    ])
+    tokens = Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+    bump_catalogue_version()
+    return videos, users, tokens
+
+def benchmark_api(videos, users, tokens, iterations, login_iterations, rng):
+    """
+    Measures latency and query counts of the API hot paths and the throughput of progress upserts and logins.
+    """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + tokens[0].key)
+    video_list_url = reverse('video-list')
+    results = {
+        'video_list_cold_cache': measure_endpoint(lambda: client.get(video_list_url), iterations, prepare=bump_catalogue_version),
+        'video_list_warm_cache': measure_endpoint(lambda: client.get(video_list_url), iterations),
+        'video_list_with_progress': measure_endpoint(lambda: client.get(video_list_url, {'include': 'progress'}), iterations),
+        'video_detail': measure_endpoint(lambda: client.get(reverse('video-detail', kwargs={'pk': videos[0].pk})), iterations),
+    }
+    completion_url = reverse('video-completion-list')
+    results['completion_upsert'] = {
+        **measure_endpoint(lambda: client.post(completion_url, {'video_id': videos[0].pk, 'current_time': 1.0}, format='json'), 0),
+        **measure_throughput(
+            lambda index: client.post(
+                completion_url, {'video_id': videos[index % len(videos)].pk, 'current_time': rng.uniform(0, 60)}, format='json'
+            ),
+            iterations
+        ),
+    }
+    results['completion_list'] = measure_endpoint(lambda: client.get(completion_url), iterations)
+    batch = [
+        {'video_id': video.pk, 'current_time': rng.uniform(0, 60), 'client_ts': now().isoformat()}
+        for video in videos[:500]
+    ]
+    sync_url = reverse('video-completion-sync')
+    results['completion_sync'] = {
+        'entries_per_batch': len(batch),
+        **measure_endpoint(lambda: client.post(sync_url, batch, format='json'), iterations),
+    }
+    anonymous = APIClient()
+    login_data = {'email': users[-1].email, 'password': BENCHMARK_PASSWORD}
+    results['login'] = {
+        **measure_endpoint(lambda: anonymous.post(reverse('login'), login_data, format='json'), 0),
+        **measure_throughput(lambda index: anonymous.post(reverse('login'), login_data, format='json'), login_iterations),
+    }
+    return results
+
+def generate_testsrc_cmd(output_path, duration, size):
+    """
+    Returns a command generating a synthetic clip (test pattern with a sine tone) of the given duration and size.
+    """
+    return [
+        "ffmpeg", "-y", "-f", "lavfi", "-i", f"testsrc=size={size}:rate=25", "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(duration), "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac", "-shortest", output_path,
+    ]
+
+def measure_rendition(video, base_name, convert):
+    started_at = time.perf_counter()
+    convert()
+    elapsed = time.perf_counter() - started_at
+    return {
+        'seconds': round(elapsed, 3),
+        'realtime_factor': round(video.duration_in_seconds / elapsed, 3) if elapsed else None,
+        'output_bytes': sum(os.path.getsize(path) for path in list_output_files(video.staging_abs_dir, base_name)),
+    }
+
+def benchmark_transcoding(duration, size):
+    """
+    Converts a synthetic clip to each planned rendition separately and to all renditions in a single pass,
+    measuring the real-time factor (seconds of video converted per second) and output size of each.
+    """
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        return {'skipped': 'ffmpeg and ffprobe are required.'}
+    with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+        source_rel_path = os.path.join('videos', 'benchmark_testsrc.mp4')
+        os.makedirs(os.path.join(temp_dir, 'videos'))
+        subprocess.run(generate_testsrc_cmd(os.path.join(temp_dir, source_rel_path), duration, size), check=True, capture_output=True)
+        video = Video.objects.bulk_create([Video(title='Benchmark testsrc', description='', video_upload=source_rel_path)])[0]
+        set_video_metadata(video)
+        segment_format = get_segment_format()
+        resolutions = plan_resolutions(video)
+        prepare_staging_dir(video.staging_abs_dir)
+        renditions = {}
+        for res in resolutions:
+            renditions[generate_rendition_name(res)] = measure_rendition(
+                video, generate_playlist_basename(video, res['height']),
+                lambda: convert_single_resolution(video, res, segment_format)
+            )
+        if has_separate_audio(resolutions, segment_format):
+            renditions[AUDIO_RENDITION_NAME] = measure_rendition(
+                video, f"{video.pk}_{AUDIO_RENDITION_NAME}", lambda: convert_audio_rendition(video)
+            )
+        clear_output_files(video.staging_abs_dir)
+        single_pass = measure_rendition(video, None, lambda: convert_all_resolutions(video, resolutions, segment_format))
+    return {
+        'source': {'duration': video.duration_in_seconds, 'size': size, 'segment_format': segment_format},
+        'renditions': renditions,
+        'single_pass': single_pass,
+    }
+
+def get_environment():
+    """
+    Returns the commit and versions the benchmark ran with, so results of different commits can be told apart.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cache': settings.CACHES['default']['BACKEND'],
+    }
+
+def run_benchmarks(video_count, user_count, iterations, login_iterations, transcode=False, transcode_duration=10,
+                   transcode_size='1920x1080', seed=0, shared_cache=False):
+    """
+    Seeds videos and users and runs the benchmarks. All data is rolled back afterwards, and an isolated
+    local memory cache is used unless a shared cache is requested, so neither the database
+    nor cached responses and metrics are affected. Progress upserts are written to the database directly,
+    since the write-behind buffer requires Redis and would outlive the rollback.
+    """
+    rng = random.Random(seed)
+    caches = {} if shared_cache else {'CACHES': BENCHMARK_CACHES}
+    with override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], PROGRESS_WRITE_BEHIND=False, **caches
+    ), transaction.atomic():
+        results = {
+            'environment': get_environment(),
+            'parameters': {
+                'videos': video_count, 'users': user_count, 'iterations': iterations,
+                'login_iterations': login_iterations, 'seed': seed,
+            },
+        }
+        started_at = time.perf_counter()
+        videos, users, tokens = seed_data(video_count, user_count, rng)
+        results['seed_seconds'] = round(time.perf_counter() - started_at, 3)
+        results['api'] = benchmark_api(videos, users, tokens, iterations, login_iterations, rng)
+        if transcode:
+            results['transcoding'] = benchmark_transcoding(transcode_duration, transcode_size)
+        transaction.set_rollback(True)
+    return results
+
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+def compare_results(results, baseline):
+    """
+    Returns the latencies, rates, query counts and real-time factors which differ from a baseline run,
+    as (key, baseline value, current value) tuples.
+    """
+    current, previous = flatten(results), flatten(baseline)
+    return [
+        (key, previous[key], value) for key, value in current.items()
+        if key.endswith(COMPARED_KEYS) and key in previous and previous[key] != value
+    ]
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.utils.timezone import now
+from django.utils.dateparse import parse_datetime
+import json
+
+BUFFER_KEY_PREFIX = 'video_completion_buffer'
+BUFFER_USERS_KEY = f"{BUFFER_KEY_PREFIX}_users"
+
+def is_write_behind_enabled():
+    """
+    Returns whether playback progress updates are buffered in Redis instead of being written to the database.
+    """
+    return getattr(settings, 'PROGRESS_WRITE_BEHIND', False)
+
+def get_redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+def generate_buffer_key(user_pk):
+    """
+    Returns the key of the Redis hash containing the buffered progress of a user, with one field per video.
+    """
+    return f"{BUFFER_KEY_PREFIX}:{user_pk}"
+
+def decode_entry(value):
+    entry = json.loads(value)
+    entry['updated_at'] = parse_datetime(entry['updated_at'])
+    return entry
+
+def buffer_progress(user_pk, video_pk, current_time):
+    """
+    Buffers the playback position of a user for a video and registers the user for the next flush.
+    Returns the buffered entry.
+    """
+    updated_at = now()
+    value = json.dumps({'current_time': current_time, 'updated_at': updated_at.isoformat()})
+    pipe = get_redis().pipeline()
+    pipe.hset(generate_buffer_key(user_pk), str(video_pk), value)
+    pipe.sadd(BUFFER_USERS_KEY, str(user_pk))
+    pipe.execute()
+    return {'current_time': current_time, 'updated_at': updated_at}
+
+def get_buffered_progress(user_pk):
+    """
+    Returns the buffered playback positions of a user by video ID, or an empty dict if buffering is disabled.
+    """
+    if not is_write_behind_enabled():
+        return {}
+    values = get_redis().hgetall(generate_buffer_key(user_pk))
+    return {int(video_pk): decode_entry(value) for video_pk, value in values.items()}
+
+def discard_buffered_progress(user_pk, *video_pks):
+    """
+    Removes the buffered playback positions of a user for the given videos, e.g. when they are overwritten directly.
+    """
+    if is_write_behind_enabled() and video_pks:
+        get_redis().hdel(generate_buffer_key(user_pk), *(str(video_pk) for video_pk in video_pks))
+
+def pop_buffered_progress(user_pk):
+    """
+    Reads and removes the buffered playback positions of a user in a single transaction,
+    so updates arriving in the meantime are kept for the next flush.
+    """
+    pipe = get_redis().pipeline(transaction=True)
+    key = generate_buffer_key(user_pk)
+    pipe.hgetall(key)
+    pipe.delete(key)
+    values, _ = pipe.execute()
+    return {int(video_pk): decode_entry(value) for video_pk, value in values.items()}
+
+def restore_buffered_progress(user_pk, entries):
+    """
+    Puts popped entries back into the buffer without overwriting newer updates, e.g. after a failed flush.
+    """
+    redis = get_redis()
+    pipe = redis.pipeline()
+    for video_pk, entry in entries.items():
+        value = json.dumps({'current_time': entry['current_time'], 'updated_at': entry['updated_at'].isoformat()})
+        pipe.hsetnx(generate_buffer_key(user_pk), str(video_pk), value)
+    pipe.sadd(BUFFER_USERS_KEY, str(user_pk))
+    pipe.execute()
+
+def pop_buffered_users():
+    """
+    Returns and unregisters all users with buffered playback positions.
+    """
+    redis = get_redis()
+    users = []
+    while batch := redis.spop(BUFFER_USERS_KEY, 1000):
+        users.extend(int(user_pk) for user_pk in batch)
+    return users
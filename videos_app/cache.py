@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_page
+import functools
+
+CATALOGUE_VERSION_KEY = 'video_catalogue_version'
+CATALOGUE_KEY_PREFIX = 'video_catalogue'
+
+def get_catalogue_version():
+    """
+    Returns the current generation of the cached video catalogue responses.
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+async def aget_catalogue_version():
+    """
+    Async version of "get_catalogue_version".
+    """
+    version = await cache.aget(CATALOGUE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+def bump_catalogue_version():
+    """
+    Starts a new generation of cached video catalogue responses, so all previously cached responses
+    are bypassed immediately. They expire according to their timeout.
+    """
+    try:
+        return cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CATALOGUE_VERSION_KEY)
+
+def catalogue_cache_page(timeout):
+    """
+    Decorator caching a catalogue view like "cache_page", but using the current catalogue generation
+    as key prefix. Clients are told to revalidate, since the server-side entries may be invalidated
+    long before their timeout.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def revalidated_view(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            patch_cache_control(response, max_age=0)
+            return response
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key_prefix = f"{CATALOGUE_KEY_PREFIX}.{get_catalogue_version()}"
+            return cache_page(timeout, key_prefix=key_prefix)(revalidated_view)(request, *args, **kwargs)
+        return wrapper
+    return decorator
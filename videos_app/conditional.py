@@ -0,0 +1,57 @@
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import hashlib
+
+class ConditionalListMixin:
+    """
+    Viewset mixin supporting conditional GET requests of the list view.
+    ETag and Last-Modified are derived from the latest modification date and the row count
+    of the filtered queryset, so a "304 Not Modified" response is returned before the list
+    is evaluated or serialized.
+    """
+    last_modified_field = 'updated_at'
+
+    def get_validator_querysets(self):
+        """
+        Returns the querysets the list content depends on, each with its modification date field.
+        """
+        return [(self.filter_queryset(self.get_queryset()), self.last_modified_field)]
+
+    def get_validator_extras(self):
+        """
+        Returns further modification dates the list content depends on, apart from the database.
+        """
+        return []
+
+    def get_list_validators(self, request):
+        """
+        Returns the ETag and the Last-Modified timestamp of the list, using one aggregate query per queryset.
+        """
+        fingerprint = [self.basename, request.get_full_path(), str(request.user.pk)]
+        modification_dates = []
+        for queryset, field in self.get_validator_querysets():
+            stats = queryset.order_by().aggregate(last_modified=Max(field), count=Count('pk'))
+            fingerprint.extend([str(stats['count']), str(stats['last_modified'])])
+            modification_dates.append(stats['last_modified'])
+        for extra in self.get_validator_extras():
+            fingerprint.append(str(extra))
+            modification_dates.append(extra)
+        last_modified = max((date for date in modification_dates if date), default=None)
+        etag = '"%s"' % hashlib.sha1('|'.join(fingerprint).encode()).hexdigest()
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def get_list_response(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = self.get_list_validators(request)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = self.get_list_response(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
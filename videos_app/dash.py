@@ -0,0 +1,78 @@
+from xml.etree.ElementTree import Element, SubElement, tostring
+from .utils import AUDIO_BITRATE, AUDIO_CODEC, AUDIO_SAMPLE_RATE, AUDIO_RENDITION_NAME
+import re
+
+MPD_NAMESPACE = 'urn:mpeg:dash:schema:mpd:2011'
+MPD_PROFILE = 'urn:mpeg:dash:profile:isoff-main:2011'
+TIMESCALE = 1000
+MAP_URI_PATTERN = re.compile(r'URI="([^"]+)"')
+
+def parse_media_playlist(content):
+    """
+    Extracts the initialization segment and the segment URIs with their durations (in seconds)
+    from a fragmented MP4 HLS media playlist.
+    """
+    init, segments, duration = None, [], None
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-MAP:'):
+            init = MAP_URI_PATTERN.search(line).group(1)
+        elif line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#'):
+            segments.append((line, duration))
+    return {'init': init, 'segments': segments}
+
+def format_duration(seconds):
+    return f"PT{seconds:.3f}S"
+
+def add_segment_list(representation, playlist):
+    """
+    Describes the segments of a media playlist by a segment list with their exact durations,
+    since the segments are cut at key frames and don't share a fixed duration.
+    """
+    segment_list = SubElement(representation, 'SegmentList', timescale=str(TIMESCALE))
+    SubElement(segment_list, 'Initialization', sourceURL=playlist['init'])
+    timeline = SubElement(segment_list, 'SegmentTimeline')
+    for index, (_, duration) in enumerate(playlist['segments']):
+        attributes = {'t': '0'} if index == 0 else {}
+        SubElement(timeline, 'S', d=str(round(duration * TIMESCALE)), **attributes)
+    for uri, _ in playlist['segments']:
+        SubElement(segment_list, 'SegmentURL', media=uri)
+
+def generate_mpd(video_renditions, audio_playlist=None):
+    """
+    Returns a static DASH manifest referencing the fragmented MP4 segments of the HLS renditions,
+    given as (resolution, media playlist) pairs, and of the separate audio rendition if any.
+    """
+    duration = sum(duration for _, duration in video_renditions[0][1]['segments'])
+    mpd = Element('MPD', {
+        'xmlns': MPD_NAMESPACE,
+        'profiles': MPD_PROFILE,
+        'type': 'static',
+        'mediaPresentationDuration': format_duration(duration),
+        'minBufferTime': format_duration(4),
+    })
+    period = SubElement(mpd, 'Period', id='0', start=format_duration(0))
+    video_set = SubElement(period, 'AdaptationSet', contentType='video', mimeType='video/mp4', segmentAlignment='true')
+    for res, playlist in video_renditions:
+        attributes = {
+            'id': f"{res['height']}p",
+            'bandwidth': str(res['maxrate'] * 1000),
+            'width': str(res['width']),
+            'height': str(res['height']),
+            'codecs': res['codecs'].split(',')[0],
+        }
+        if res.get('fps'):
+            attributes['frameRate'] = f"{res['fps']:.3f}".rstrip('0').rstrip('.')
+        add_segment_list(SubElement(video_set, 'Representation', attributes), playlist)
+    if audio_playlist:
+        audio_set = SubElement(period, 'AdaptationSet', contentType='audio', mimeType='audio/mp4', segmentAlignment='true')
+        representation = SubElement(audio_set, 'Representation', {
+            'id': AUDIO_RENDITION_NAME,
+            'bandwidth': str(AUDIO_BITRATE * 1000),
+            'codecs': AUDIO_CODEC,
+            'audioSamplingRate': str(AUDIO_SAMPLE_RATE),
+        })
+        add_segment_list(representation, audio_playlist)
+    return tostring(mpd, encoding='unicode', xml_declaration=True)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from videos_app.benchmarks import run_benchmarks, compare_results
+import json
+
+class Command(BaseCommand):
+    """
+    Measures the API hot paths (video list with cold and warm cache, progress upserts, logins)
+    and optionally the conversion of a synthetic clip, writing the results as JSON.
+    The seeded data is rolled back afterwards.
+    """
+    help = 'Runs the performance benchmarks and writes the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--videos', type=int, default=200, help='Number of videos to seed.')
+        parser.add_argument('--users', type=int, default=50, help='Number of users to seed.')
+        parser.add_argument('--iterations', type=int, default=50, help='Number of timed requests per endpoint.')
+        parser.add_argument('--login-iterations', type=int, default=10, help='Number of timed logins.')
+        parser.add_argument('--transcode', action='store_true', help='Also convert a synthetic ffmpeg testsrc clip.')
+        parser.add_argument('--transcode-duration', type=int, default=10, help='Duration of the synthetic clip in seconds.')
+        parser.add_argument('--transcode-size', default='1920x1080', help='Resolution of the synthetic clip.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the generated data.')
+        parser.add_argument('--shared-cache', action='store_true', help='Use the configured cache instead of an isolated one.')
+        parser.add_argument('--output', default='benchmark.json', help='Path of the JSON results file.')
+        parser.add_argument('--compare', default=None, help='Path of a previous results file to compare with.')
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(
+            video_count=options['videos'],
+            user_count=options['users'],
+            iterations=options['iterations'],
+            login_iterations=options['login_iterations'],
+            transcode=options['transcode'],
+            transcode_duration=options['transcode_duration'],
+            transcode_size=options['transcode_size'],
+            seed=options['seed'],
+            shared_cache=options['shared_cache'],
+        )
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        for name, result in results['api'].items():
+            self.stdout.write(f"{name}: p50 {result.get('p50_ms')} ms, {result.get('per_second')} /s, {result['queries']} queries")
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            for key, previous, current in compare_results(results, baseline):
+                change = f" ({(current - previous) / previous:+.1%})" if previous else ''
+                self.stdout.write(f"{key}: {previous} -> {current}{change}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote benchmark results to {options['output']}."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from videos_app.tasks import flush_progress_buffer
+import time
+
+class Command(BaseCommand):
+    """
+    Writes the playback positions buffered in Redis to the database,
+    either once or periodically if an interval is given.
+    """
+    help = 'Flushes buffered playback positions into the video completions table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None, help='Repeat the flush every INTERVAL seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_progress_buffer()
+            self.stdout.write(f"Flushed {flushed} video completion(s).")
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
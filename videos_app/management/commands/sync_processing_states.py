@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from videos_app.models import Video
+import os
+
+class Command(BaseCommand):
+    """
+    Marks videos as ready whose master playlist already exists on disk,
+    e.g. videos converted before the processing state was stored.
+    """
+    help = 'Marks pending videos with an existing master playlist as ready.'
+
+    def handle(self, *args, **options):
+        updated = 0
+        for video in Video.objects.exclude(processing_state=Video.READY):
+            if os.path.isfile(os.path.join(video.video_files_abs_dir, f"{video.pk}_master.m3u8")):
+                video.update_processing_state(Video.READY, playlist_path=video.master_playlist_rel_path)
+                updated += 1
+        self.stdout.write(self.style.SUCCESS(f"Marked {updated} video(s) as ready."))
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseForbidden, FileResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+from .signing import requires_signature, verify_signature, sign_playlist, sign_manifest
+import mimetypes
+import os
+import re
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mpd': 'application/dash+xml',
+    '.vtt': 'text/vtt',
+}
+SEGMENT_EXTENSIONS = ('.ts', '.m4s')
+PLAYLIST_EXTENSIONS = ('.m3u8', '.mpd')
+SEGMENT_MAX_AGE = 60 * 60 * 24 * 365
+DEFAULT_MAX_AGE = 60 * 60 * 24
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def get_content_type(path):
+    """
+    Returns the content type of a media file, including the HLS/DASH types missing from most mime type databases.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in CONTENT_TYPES:
+        return CONTENT_TYPES[extension]
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+def patch_media_cache_control(response, path):
+    """
+    Lets clients and proxies cache segments forever, since a segment is never changed once published.
+    Playlists are revalidated on every request and all other media files are cached for a day.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in SEGMENT_EXTENSIONS:
+        patch_cache_control(response, public=True, max_age=SEGMENT_MAX_AGE, immutable=True)
+    elif extension in PLAYLIST_EXTENSIONS:
+        patch_cache_control(response, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=DEFAULT_MAX_AGE)
+
+def parse_range_header(header, size):
+    """
+    Returns the first and last byte of a single "bytes" range within a file of the given size,
+    None if the header is missing or unsupported (e.g. multiple ranges), or False if it is not satisfiable.
+    """
+    match = RANGE_PATTERN.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+class FileRange:
+    """
+    File-like object reading a limited number of bytes from the current position of a file.
+    It doesn't expose "fileno", so WSGI file wrappers read it chunk by chunk instead of sending the whole file.
+    """
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def generate_sendfile_response(path, abs_path):
+    """
+    Returns an empty response telling the front proxy to deliver the file itself, according to
+    the "MEDIA_SENDFILE_BACKEND" setting ("nginx" for X-Accel-Redirect, "xsendfile" for X-Sendfile),
+    or None if files are served by Django. The proxy handles range and conditional requests.
+    """
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+    if backend == 'nginx':
+        response = HttpResponse(content_type=get_content_type(path))
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/') + path
+        return response
+    if backend == 'xsendfile':
+        response = HttpResponse(content_type=get_content_type(path))
+        response['X-Sendfile'] = abs_path
+        return response
+    return None
+
+def generate_file_response(request, path, abs_path, stat):
+    """
+    Returns a response streaming the file, limited to the requested byte range if any.
+    Complete files are passed to the WSGI server's file wrapper, which uses "os.sendfile" where available.
+    """
+    content_type = get_content_type(path)
+    byte_range = parse_range_header(request.headers.get('Range'), stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{stat.st_size}"
+        return response
+    file = open(abs_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+def generate_signed_playlist_response(request, path, abs_path):
+    """
+    Returns a HLS playlist or DASH manifest whose URIs are signed with the expiry of the requested URL,
+    so players can load the variant playlists and segments.
+    """
+    sign = sign_manifest if path.endswith('.mpd') else sign_playlist
+    with open(abs_path, 'r') as f:
+        content = sign(f.read(), path, request.GET['expires'])
+    return HttpResponse(content, content_type=get_content_type(path))
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a file from the media root, either by delegating the delivery to the front proxy
+    or by streaming it with support for byte ranges and conditional requests.
+    Video files can only be accessed using signed URLs (see videos_app/signing.py), which are verified
+    without database access. Signed playlists are rewritten to pass the signature on to their URIs.
+    The path is normalized before checking the signature, so "." and ".." segments cannot bypass it.
+    """
+    try:
+        abs_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Media file not found.')
+    path = os.path.relpath(abs_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    signed = requires_signature(path)
+    if signed and not verify_signature(path, request.GET.get('expires'), request.GET.get('signature')):
+        return HttpResponseForbidden('Invalid or expired signature.')
+    if not os.path.isfile(abs_path):
+        raise Http404('Media file not found.')
+    stat = os.stat(abs_path)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    elif signed and path.endswith(PLAYLIST_EXTENSIONS):
+        response = generate_signed_playlist_response(request, path, abs_path)
+    else:
+        response = generate_sendfile_response(path, abs_path) or generate_file_response(request, path, abs_path, stat)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    patch_media_cache_control(response, path)
+    return response
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from videoflix.metrics import Counter, Histogram, FRACTION_SCALE
+import os
+import time
+
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+REALTIME_FACTOR_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+SUCCESS = 'success'
+FAILURE = 'failure'
+
+STAGE_DURATION = Histogram(
+    'videoflix_pipeline_stage_duration_seconds', 'Wall time of the video processing stages in seconds.',
+    ['stage', 'outcome'], buckets=STAGE_BUCKETS
+)
+STAGE_CPU = Counter(
+    'videoflix_pipeline_stage_cpu_seconds_total', 'CPU time of the video processing stages in seconds, including FFMPEG processes.',
+    ['stage'], scale=FRACTION_SCALE
+)
+STAGE_FAILURES = Counter(
+    'videoflix_pipeline_stage_failures_total', 'Number of failed video processing stages.', ['stage']
+)
+RENDITION_REALTIME_FACTOR = Histogram(
+    'videoflix_transcode_realtime_factor', 'Seconds of video converted per second of wall time, by rendition.',
+    ['rendition'], buckets=REALTIME_FACTOR_BUCKETS
+)
+RENDITION_OUTPUT_BYTES = Counter(
+    'videoflix_transcode_output_bytes_total', 'Bytes of playlists and segments written by the conversion, by rendition.',
+    ['rendition']
+)
+
+def get_cpu_time():
+    """
+    Returns the CPU time used by the current process and its terminated child processes (e.g. FFMPEG).
+    Child processes are not accounted on Windows.
+    """
+    return sum(os.times()[:4])
+
+@contextmanager
+def measure_stage(stage):
+    """
+    Records wall time, CPU time and outcome of a video processing stage. Can be used as decorator as well.
+    """
+    started_at, cpu_started_at = time.monotonic(), get_cpu_time()
+    outcome = SUCCESS
+    try:
+        yield
+    except Exception:
+        outcome = FAILURE
+        STAGE_FAILURES.inc(stage=stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.monotonic() - started_at, stage=stage, outcome=outcome)
+        STAGE_CPU.inc(max(get_cpu_time() - cpu_started_at, 0), stage=stage)
+
+def record_rendition(rendition, duration, wall_time, output_bytes):
+    """
+    Records the real-time factor and output size of a converted rendition.
+    """
+    if duration and wall_time > 0:
+        RENDITION_REALTIME_FACTOR.observe(duration / wall_time, rendition=rendition)
+    RENDITION_OUTPUT_BYTES.inc(output_bytes, rendition=rendition)
@@ -1,7 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+from django.utils.timezone import now
+from .cache import bump_catalogue_version
+from .utils import ENCODING_PRESETS
 import os
+import uuid
 
 class Video(models.Model):
     """
@@ -15,13 +21,69 @@ class Video(models.Model):
         (DRAMA.lower(), DRAMA),
         (ROMANCE.lower(), ROMANCE)
     ]
+    PENDING = 'pending'
+    PROBING = 'probing'
+    TRANSCODING = 'transcoding'
+    READY = 'ready'
+    FAILED = 'failed'
+    PROCESSING_STATES = [
+        (PENDING, 'Pending'),
+        (PROBING, 'Probing'),
+        (TRANSCODING, 'Transcoding'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed')
+    ]
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=1024)
     genre = models.CharField(max_length=32, choices=GENRES, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     video_upload = models.FileField(upload_to='videos', blank=True, null=True)
     thumbnail = models.FileField(upload_to='video_thumbs', blank=True, null=True)
     duration_in_seconds = models.FloatField(default=None, blank=True, null=True)
+    width = models.PositiveIntegerField(default=None, blank=True, null=True)
+    height = models.PositiveIntegerField(default=None, blank=True, null=True)
+    fps = models.FloatField(default=None, blank=True, null=True)
+    bitrate = models.PositiveIntegerField(default=None, blank=True, null=True, help_text='Video bitrate in kbit/s')
+    video_codec = models.CharField(max_length=32, blank=True, default='')
+    audio_codec = models.CharField(max_length=32, blank=True, default='')
+    audio_channels = models.PositiveSmallIntegerField(default=None, blank=True, null=True)
+    processing_state = models.CharField(max_length=16, choices=PROCESSING_STATES, default=PENDING, db_index=True)
+    playlist_path = models.CharField(max_length=255, blank=True, default='')
+    dash_manifest_path = models.CharField(max_length=255, blank=True, default='')
+    artwork = models.JSONField(default=dict, blank=True)
+    encoding_preset = models.CharField(
+        max_length=32, blank=True, default='',
+        choices=[(name, preset['label']) for name, preset in ENCODING_PRESETS.items()],
+        help_text='Leave empty to use the default encoding preset'
+    )
+
+    METADATA_FIELDS = (
+        'duration_in_seconds', 'width', 'height', 'fps', 'bitrate', 'video_codec', 'audio_codec', 'audio_channels'
+    )
+
+    @property
+    def has_metadata(self):
+        return self.width is not None and self.height is not None
+
+    @property
+    def resolution(self):
+        if self.has_metadata:
+            return f"{self.width}x{self.height}"
+        return None
+
+    @property
+    def source_properties(self):
+        """
+        Returns the stored source metadata required to plan the HLS renditions.
+        """
+        return {
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "bitrate": self.bitrate,
+            "audio": bool(self.audio_channels),
+        }
 
     @property
     def video_files_rel_dir(self):
@@ -33,16 +95,124 @@ class Video(models.Model):
     def video_files_abs_dir(self):
         return os.path.join(settings.MEDIA_ROOT, self.video_files_rel_dir)
     
+    @property
+    def staging_abs_dir(self):
+        """
+        Returns the directory the conversion tasks stage their output in. It is located next to the video files,
+        so the finished output can be renamed into place, and named by primary key only, as titles may change.
+        """
+        return os.path.join(settings.MEDIA_ROOT, 'videos', '.staging', str(self.pk))
+
+    @property
+    def artwork_rel_dir(self):
+        return os.path.join('video_thumbs', str(self.pk))
+
+    @property
+    def artwork_abs_dir(self):
+        return os.path.join(settings.MEDIA_ROOT, self.artwork_rel_dir)
+
+    @property
+    def master_playlist_rel_path(self):
+        return os.path.join(self.video_files_rel_dir, f"{self.pk}_master.m3u8")
+
+    @property
+    def dash_manifest_rel_path(self):
+        return os.path.join(self.video_files_rel_dir, f"{self.pk}.mpd")
+
+    @property
+    def is_playable(self):
+        return self.processing_state == self.READY and bool(self.playlist_path)
+
     @property
     def playlist_rel_url(self):
-        filename = f"{self.pk}_master.m3u8"
-        if os.path.isfile(os.path.join(self.video_files_abs_dir, filename)):
-            return os.path.join(settings.MEDIA_URL, self.video_files_rel_dir, filename)
-        raise FileNotFoundError(f"Playlist file '{filename}' does not exist in directory for video ID {self.pk}.")
+        """
+        Returns the master playlist URL stored by the processing tasks, or None if the video is not playable yet.
+        This does not access the file system.
+        """
+        if self.is_playable:
+            return os.path.join(settings.MEDIA_URL, self.playlist_path)
+        return None
+
+    @property
+    def dash_manifest_rel_url(self):
+        """
+        Returns the DASH manifest URL stored by the processing tasks, or None if the video is not playable yet
+        or has been converted without fragmented MP4 segments.
+        """
+        if self.is_playable and self.dash_manifest_path:
+            return os.path.join(settings.MEDIA_URL, self.dash_manifest_path)
+        return None
+
+    def update_processing_state(self, state, **fields):
+        """
+        Persists the processing state (and further fields), see "persist_fields".
+        """
+        self.persist_fields(processing_state=state, **fields)
+
+    def persist_fields(self, **fields):
+        """
+        Persists the given fields without saving the whole instance,
+        since the processing tasks work on instances which may be outdated.
+        As no signals are sent, the cached catalogue is invalidated explicitly.
+        """
+        fields.update(updated_at=now())
+        Video.objects.filter(pk=self.pk).update(**fields)
+        for field, value in fields.items():
+            setattr(self, field, value)
+        bump_catalogue_version()
     
     def __str__(self):
         return f"({self.pk}) {self.title}"
 
+class VideoUpload(models.Model):
+    """
+    Resumable upload model collecting a source video in chunks before the video instance is created.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    title = models.CharField(max_length=100)
+    description = models.CharField(max_length=1024)
+    genre = models.CharField(max_length=32, choices=Video.GENRES, blank=True, null=True)
+    video = models.OneToOneField(Video, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def partial_file_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f"{self.pk}.part")
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    @property
+    def is_finalized(self):
+        return self.video_id is not None
+
+    def create_video(self):
+        """
+        Moves the completed upload into the video upload directory and creates the corresponding
+        video instance, which triggers the regular processing tasks.
+        """
+        name = default_storage.get_available_name(os.path.join('videos', get_valid_filename(self.filename)))
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.partial_file_path, path)
+        self.video = Video.objects.create(
+            title=self.title,
+            description=self.description,
+            genre=self.genre,
+            video_upload=name
+        )
+        self.save(update_fields=['video', 'updated_at'])
+        return self.video
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
 class VideoCompletion(models.Model):
     """
     Video completion model representing the playback state of a video for a user.
@@ -50,6 +220,7 @@ class VideoCompletion(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     video = models.ForeignKey(Video, on_delete=models.CASCADE)
     current_time = models.FloatField()
+    recorded_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -59,4 +230,57 @@ class VideoCompletion(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.username}: {self.video.title}"
\ No newline at end of file
+        return f"{self.user.username}: {self.video.title}"
+
+    @property
+    def effective_recorded_at(self):
+        """
+        Returns the time the playback position was recorded, falling back to the last update
+        for video completions written before recording times were stored.
+        """
+        return self.recorded_at or self.updated_at
+
+    @classmethod
+    def sync_for_user(cls, user, entries, buffered=None):
+        """
+        Applies a batch of playback positions recorded by a client ("video_id", "current_time", "client_ts")
+        in a single transaction and returns one result per entry, in order.
+        Conflicts are resolved by last-writer-wins on the recording time: an entry is only applied if it is
+        newer than the stored position, the given buffered position and any other entry for the same video.
+        """
+        buffered = buffered or {}
+        video_pks = {entry['video_id'] for entry in entries}
+        existing_videos = set(Video.objects.filter(pk__in=video_pks).values_list('pk', flat=True))
+        with transaction.atomic():
+            latest = {
+                completion.video_id: {'current_time': completion.current_time, 'recorded_at': completion.effective_recorded_at}
+                for completion in cls.objects.select_for_update().filter(user=user, video_id__in=existing_videos)
+            }
+            for video_pk, entry in buffered.items():
+                if video_pk in existing_videos and (video_pk not in latest or entry['updated_at'] > latest[video_pk]['recorded_at']):
+                    latest[video_pk] = {'current_time': entry['current_time'], 'recorded_at': entry['updated_at']}
+            results, winners = [], {}
+            for entry in entries:
+                video_pk = entry['video_id']
+                if video_pk not in existing_videos:
+                    results.append({'video_id': video_pk, 'status': 'invalid', 'current_time': None})
+                    continue
+                current = latest.get(video_pk)
+                if current and entry['client_ts'] <= current['recorded_at']:
+                    results.append({'video_id': video_pk, 'status': 'stale', 'current_time': current['current_time']})
+                    continue
+                if video_pk in winners:
+                    results[winners[video_pk]].update(status='stale', current_time=entry['current_time'])
+                latest[video_pk] = {'current_time': entry['current_time'], 'recorded_at': entry['client_ts']}
+                winners[video_pk] = len(results)
+                results.append({'video_id': video_pk, 'status': 'applied', 'current_time': entry['current_time']})
+            cls.objects.bulk_create(
+                [
+                    cls(user=user, video_id=video_pk, current_time=latest[video_pk]['current_time'], recorded_at=latest[video_pk]['recorded_at'])
+                    for video_pk in winners
+                ],
+                update_conflicts=True,
+                unique_fields=['user', 'video'],
+                update_fields=['current_time', 'recorded_at', 'updated_at']
+            )
+        return results
\ No newline at end of file
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+class VideoCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by creation date and ID, which remains stable when videos are added.
+    Pages are only returned if the "page_size" query parameter is given,
+    so clients requesting the complete list keep receiving a plain array.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
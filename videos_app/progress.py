@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.core.cache import cache
+import subprocess
+import tempfile
+import threading
+import time
+
+PROGRESS_TTL = 60 * 60 * 24
+ALL_RESOLUTIONS = 'all'
+
+def generate_progress_key(video_pk, rendition=None):
+    """
+    Returns the cache key containing the processing progress of a video or one of its renditions.
+    """
+    if rendition is None:
+        return f"video_processing_{video_pk}"
+    return f"video_processing_{video_pk}_{rendition}"
+
+def start_progress(video_obj, renditions):
+    """
+    Registers the renditions being converted for a video and resets their progress.
+    """
+    cache.set(generate_progress_key(video_obj.pk), {'renditions': renditions}, PROGRESS_TTL)
+    cache.delete_many([generate_progress_key(video_obj.pk, rendition) for rendition in renditions])
+
+def get_processing_progress(video_pk):
+    """
+    Returns the combined conversion progress of all renditions of a video,
+    or None if no conversion has been registered for the video.
+    """
+    summary = cache.get(generate_progress_key(video_pk))
+    if summary is None:
+        return None
+    keys = {rendition: generate_progress_key(video_pk, rendition) for rendition in summary['renditions']}
+    states = cache.get_many(keys.values())
+    renditions = {rendition: states.get(key) for rendition, key in keys.items()}
+    running = [rendition for rendition, state in renditions.items() if state and state['percent'] < 100]
+    etas = [state['eta_seconds'] for state in renditions.values() if state and state['eta_seconds'] is not None]
+    return {
+        'percent': round(sum(state['percent'] for state in renditions.values() if state) / max(len(renditions), 1), 1),
+        'current_rendition': running[0] if running else None,
+        'fps': sum(state['fps'] for state in renditions.values() if state and state['percent'] < 100),
+        'eta_seconds': max(etas) if etas else None,
+        'renditions': renditions,
+    }
+
+class ProgressReporter:
+    """
+    Publishes the progress of a FFMPEG process converting a single rendition (or all renditions at once)
+    into the cache. Updates are rate limited by the "HLS_PROGRESS_UPDATE_INTERVAL" setting (in seconds).
+    """
+    def __init__(self, video_obj, rendition=ALL_RESOLUTIONS):
+        self.key = generate_progress_key(video_obj.pk, rendition)
+        self.duration = video_obj.duration_in_seconds
+        self.interval = getattr(settings, 'HLS_PROGRESS_UPDATE_INTERVAL', 2)
+        self.started_at = time.monotonic()
+        self.published_at = None
+
+    def calc_state(self, values):
+        """
+        Calculates percent complete, frame rate and estimated remaining time from a FFMPEG progress block.
+        """
+        out_time = int(values.get('out_time_us') or values.get('out_time_ms') or 0) / 1000000
+        percent = min(100 * out_time / self.duration, 100) if self.duration else 0
+        if values.get('progress') == 'end':
+            percent = 100
+        elapsed = time.monotonic() - self.started_at
+        eta_seconds = None
+        if 0 < percent < 100:
+            eta_seconds = round(elapsed * (100 - percent) / percent)
+        elif percent == 100:
+            eta_seconds = 0
+        try:
+            fps = float(values.get('fps', 0))
+        except ValueError:
+            fps = 0.0
+        return {'percent': round(percent, 1), 'fps': fps, 'eta_seconds': eta_seconds}
+
+    def update(self, values):
+        """
+        Publishes the state of a FFMPEG progress block, unless the last update is too recent.
+        The final block is always published.
+        """
+        now = time.monotonic()
+        final = values.get('progress') == 'end'
+        if not final and self.published_at is not None and now - self.published_at < self.interval:
+            return
+        cache.set(self.key, self.calc_state(values), PROGRESS_TTL)
+        self.published_at = now
+
+def run_ffmpeg_with_progress(cmd, reporter, timeout=None):
+    """
+    Runs a FFMPEG command, parsing its "-progress" output to publish the conversion progress.
+    The process is killed if it runs longer than the timeout (in seconds), raising a TimeoutExpired.
+    Raises a CalledProcessError including the FFMPEG error output if the conversion fails.
+    """
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    with tempfile.TemporaryFile() as stderr:
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True) as process:
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                process.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                values = {}
+                for line in process.stdout:
+                    key, _, value = line.strip().partition('=')
+                    values[key] = value
+                    if key == 'progress':
+                        reporter.update(values)
+                        values = {}
+            finally:
+                if timer:
+                    timer.cancel()
+        if timed_out.is_set():
+            stderr.seek(0)
+            raise subprocess.TimeoutExpired(cmd, timeout, stderr=stderr.read())
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr.read())
@@ -1,27 +1,133 @@
+from django.conf import settings
+from django.utils.timezone import now
 from rest_framework import serializers
-from .models import Video, VideoCompletion
+from videoflix.performance import SerializationTimingMixin, TimedListSerializer
+from .models import Video, VideoUpload, VideoCompletion
+from .signing import requires_signature, generate_signed_query
+import os
 
-class VideoSerializer(serializers.ModelSerializer):
+def get_requested_fields(request):
+    """
+    Returns the field names requested by the "fields" query parameter, or None if all fields are requested.
+    """
+    if request is None or not request.query_params.get('fields'):
+        return None
+    return {name.strip() for name in request.query_params['fields'].split(',') if name.strip()}
+
+def includes_progress(request):
+    """
+    Returns whether the playback progress of the current user is requested by "?include=progress".
+    """
+    if request is None or not request.query_params.get('include'):
+        return False
+    return 'progress' in {name.strip() for name in request.query_params['include'].split(',')}
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin removing all fields not requested by the "fields" query parameter,
+    so their values are neither computed nor rendered.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested_fields = get_requested_fields(self.context.get('request'))
+        if requested_fields is not None:
+            for name in set(self.fields) - requested_fields:
+                self.fields.pop(name)
+
+class VideoSerializer(SerializationTimingMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for a video/video metadata, including URLs to access the streaming playlist and the video thumbnail.
+    A subset of fields can be requested by the "fields" query parameter, e.g. "?fields=id,title,thumbnail".
+    The progress fields are only included if requested by "?include=progress".
+    Buffered playback positions passed as "buffered_progress" context take precedence over stored ones.
     """
+    PROGRESS_FIELDS = ('current_time', 'progress_percent')
     genre = serializers.SerializerMethodField()
     playlist_url = serializers.SerializerMethodField()
+    dash_url = serializers.SerializerMethodField()
+    poster_variants = serializers.SerializerMethodField()
+    thumbnail_track_url = serializers.SerializerMethodField()
+    current_time = serializers.SerializerMethodField()
+    progress_percent = serializers.SerializerMethodField()
 
     class Meta:
         model = Video
-        fields = ['id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'duration_in_seconds', 'thumbnail']
+        list_serializer_class = TimedListSerializer
+        fields = [
+            'id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'dash_url', 'duration_in_seconds', 'thumbnail',
+            'poster_variants', 'thumbnail_track_url',
+            'width', 'height', 'fps', 'processing_state', 'current_time', 'progress_percent'
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not includes_progress(self.context.get('request')):
+            for name in self.PROGRESS_FIELDS:
+                self.fields.pop(name, None)
 
     def get_genre(self, obj):
         return obj.get_genre_display()
 
-    def get_playlist_url(self, obj):
+    def build_media_url(self, rel_url, rel_path):
+        """
+        Returns the absolute URL of a media file, signed if the file may only be accessed using signed URLs.
+        """
+        if rel_url and requires_signature(rel_path):
+            rel_url += '?' + generate_signed_query(rel_path)
         request = self.context.get('request')
-        if request:
-            return request.build_absolute_uri(obj.playlist_rel_url)
-        return obj.playlist_url
+        if request and rel_url:
+            return request.build_absolute_uri(rel_url)
+        return rel_url
+
+    def get_playlist_url(self, obj):
+        return self.build_media_url(obj.playlist_rel_url, obj.playlist_path)
+
+    def get_dash_url(self, obj):
+        return self.build_media_url(obj.dash_manifest_rel_url, obj.dash_manifest_path)
+
+    def get_poster_variants(self, obj):
+        """
+        Returns the URLs of the generated WebP posters by width descriptor, e.g. for a "srcset" attribute.
+        """
+        variants = obj.artwork.get('poster_variants', {})
+        return {
+            f"{width}w": self.build_media_url(os.path.join(settings.MEDIA_URL, path), path)
+            for width, path in variants.items()
+        }
+
+    def get_thumbnail_track_url(self, obj):
+        path = obj.artwork.get('thumbnail_track')
+        return self.build_media_url(os.path.join(settings.MEDIA_URL, path), path) if path else None
+
+    def get_current_time(self, obj):
+        buffered = self.context.get('buffered_progress', {}).get(obj.pk)
+        if buffered:
+            return buffered['current_time']
+        return getattr(obj, 'current_time', None)
+
+    def get_progress_percent(self, obj):
+        current_time = self.get_current_time(obj)
+        if current_time is None or not obj.duration_in_seconds:
+            return None
+        return round(min(100 * current_time / obj.duration_in_seconds, 100), 1)
     
-class VideoCompletionSerializer(serializers.ModelSerializer):
+class VideoUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a resumable video upload, including the number of bytes received so far.
+    """
+    video_id = serializers.PrimaryKeyRelatedField(source='video', read_only=True)
+
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'filename', 'size', 'offset', 'title', 'description', 'genre', 'video_id', 'created_at']
+        read_only_fields = ['offset']
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('The upload size must be positive.')
+        return value
+
+class VideoCompletionSerializer(SerializationTimingMixin, serializers.ModelSerializer):
     """
     Serializer for video completion.
     """
@@ -30,6 +136,7 @@ class VideoCompletionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = VideoCompletion
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'video_id', 'current_time', 'updated_at']
 
     def __init__(self, *args, **kwargs):
@@ -40,10 +147,25 @@ class VideoCompletionSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
+        validated_data['recorded_at'] = now()
         return super().create(validated_data)
 
     def update(self, instance, validated_data):
         if 'video' in validated_data:
             raise serializers.ValidationError('You cannot change the video of an existing completion.')
         validated_data['user'] = self.context['request'].user
-        return super().update(instance, validated_data)
\ No newline at end of file
+        validated_data['recorded_at'] = now()
+        return super().update(instance, validated_data)
+
+class VideoCompletionProgressSerializer(serializers.Serializer):
+    """
+    Serializer validating a playback position without database access, e.g. in async views.
+    """
+    video_id = serializers.IntegerField(min_value=1)
+    current_time = serializers.FloatField(min_value=0)
+
+class VideoCompletionSyncSerializer(VideoCompletionProgressSerializer):
+    """
+    Serializer for a single playback position within a bulk sync, recorded by the client at "client_ts".
+    """
+    client_ts = serializers.DateTimeField()
\ No newline at end of file
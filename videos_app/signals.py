@@ -2,34 +2,50 @@ from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete
 import django_rq
 from videoflix import settings
-from .models import Video
-from .utils import delete_source_video
-from .tasks import set_video_duration, convert_video_to_hls
+from .models import Video, VideoUpload
+from .utils import delete_source_video, delete_partial_upload
+from .tasks import set_video_metadata, convert_video_to_hls, get_job_retry
+from .staging import delete_staging_dir
+from .cache import bump_catalogue_version
 import os
 import shutil
 
 @receiver(post_save, sender=Video) 
 def create_video(sender, instance, created, **kwargs):
     """
-    Enqueues routine tasks upon video creation regarding the video duration and conversion to HLS format.
+    Enqueues routine tasks upon video creation regarding the video metadata and conversion to HLS format,
+    which are retried automatically if they fail. Any change invalidates the cached video catalogue.
     """
+    bump_catalogue_version()
     if created and not settings.TESTING:
         queue = django_rq.get_queue('default', autocommit=True)
         try:
-            duration_task = queue.enqueue(set_video_duration, video_obj=instance)
-            queue.enqueue(convert_video_to_hls, video_obj=instance, depends_on=duration_task)
+            metadata_task = queue.enqueue(set_video_metadata, video_obj=instance, retry=get_job_retry())
+            queue.enqueue(convert_video_to_hls, video_obj=instance, depends_on=metadata_task, retry=get_job_retry())
         except Exception as e:
             print("Error while executing tasks on video creation:", e)
 
 @receiver(post_delete, sender=Video) 
 def delete_video(sender, instance, *args, **kwargs):
     """
-    Deletes associated video content files upon deletion of a video model instance.
+    Deletes associated video content files upon deletion of a video model instance
+    and invalidates the cached video catalogue.
     """
+    bump_catalogue_version()
     delete_source_video(instance)
     video_files_abs_dir = instance.video_files_abs_dir
     if os.path.isdir(video_files_abs_dir):
         shutil.rmtree(video_files_abs_dir)
     if instance.thumbnail:
         if os.path.isfile(instance.thumbnail.path):
-            os.remove(instance.thumbnail.path)
\ No newline at end of file
+            os.remove(instance.thumbnail.path)
+    if os.path.isdir(instance.artwork_abs_dir):
+        shutil.rmtree(instance.artwork_abs_dir)
+    delete_staging_dir(instance.staging_abs_dir)
+
+@receiver(post_delete, sender=VideoUpload)
+def delete_upload(sender, instance, *args, **kwargs):
+    """
+    Deletes the partial file upon deletion of a resumable upload.
+    """
+    delete_partial_upload(instance)
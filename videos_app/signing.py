@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.utils.crypto import salted_hmac, constant_time_compare
+from django.utils.http import urlencode
+from datetime import datetime, timezone
+import os
+import re
+import time
+
+SIGNATURE_SALT = 'videos_app.signing.media'
+SIGNED_PATH_PREFIX = 'videos/'
+URI_ATTRIBUTE_PATTERN = re.compile(r'URI="([^"]+)"')
+MANIFEST_URL_PATTERN = re.compile(r'(sourceURL|media)="([^"]+)"')
+
+def is_signing_enabled():
+    return getattr(settings, 'MEDIA_SIGNED_URLS', False)
+
+def requires_signature(path):
+    """
+    Returns whether a media path (relative to the media root) may only be accessed using a signed URL.
+    """
+    return is_signing_enabled() and path.startswith(SIGNED_PATH_PREFIX)
+
+def get_signing_interval_start():
+    """
+    Returns the start of the current signing interval. All URLs signed within an interval are identical,
+    so clients and proxies can cache the signed playlists and segments.
+    """
+    interval = getattr(settings, 'MEDIA_URL_SIGNING_INTERVAL', 60 * 60)
+    return datetime.fromtimestamp(int(time.time()) // interval * interval, tz=timezone.utc)
+
+def generate_expiry():
+    """
+    Returns the expiry timestamp of URLs signed in the current interval, which lies at least
+    "MEDIA_URL_TTL" seconds after the end of the interval.
+    """
+    interval = getattr(settings, 'MEDIA_URL_SIGNING_INTERVAL', 60 * 60)
+    return int(get_signing_interval_start().timestamp()) + interval + getattr(settings, 'MEDIA_URL_TTL', 60 * 60 * 12)
+
+def generate_signature(directory, expires):
+    """
+    Returns the signature granting access to all files of a media directory until the expiry timestamp.
+    """
+    return salted_hmac(SIGNATURE_SALT, f"{directory}:{expires}", algorithm='sha256').hexdigest()
+
+def generate_signed_query(path, expires=None):
+    """
+    Returns the query string signing the directory of a media path.
+    """
+    expires = expires or generate_expiry()
+    return urlencode({'expires': expires, 'signature': generate_signature(os.path.dirname(path), expires)})
+
+def verify_signature(path, expires, signature):
+    """
+    Returns whether the signature grants access to a media path and has not expired yet.
+    """
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time() or not signature:
+        return False
+    return constant_time_compare(generate_signature(os.path.dirname(path), expires), signature)
+
+def sign_relative_uri(uri, path, expires):
+    """
+    Appends a signed query with the given expiry to a URI relative to the media file at the given path.
+    """
+    if '://' in uri or uri.startswith('/'):
+        return uri
+    target = os.path.normpath(os.path.join(os.path.dirname(path), uri.split('?')[0]))
+    separator = '&' if '?' in uri else '?'
+    return f"{uri}{separator}{generate_signed_query(target, expires)}"
+
+def sign_manifest(content, path, expires):
+    """
+    Appends signed queries with the given expiry to the initialization and media segment URLs of a DASH manifest.
+    The query separator is escaped, since the URLs are XML attributes.
+    """
+    return MANIFEST_URL_PATTERN.sub(
+        lambda match: f'{match.group(1)}="{sign_relative_uri(match.group(2), path, expires).replace("&", "&amp;")}"',
+        content
+    )
+
+def sign_playlist(content, path, expires):
+    """
+    Appends signed queries with the given expiry to all relative URIs of a playlist, i.e. the variant playlists
+    and segments on URI lines and in URI attributes (e.g. initialization segments or subtitles).
+    """
+    def sign_uri(uri):
+        return sign_relative_uri(uri, path, expires)
+
+    lines = []
+    for line in content.splitlines():
+        if line.startswith('#'):
+            line = URI_ATTRIBUTE_PATTERN.sub(lambda match: f'URI="{sign_uri(match.group(1))}"', line)
+        elif line.strip():
+            line = sign_uri(line.strip())
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import shutil
+
+OUTPUT_DIRNAME = 'output'
+CHECKPOINTS_DIRNAME = 'checkpoints'
+PREVIOUS_DIRNAME = 'previous'
+PLAN_FILENAME = 'plan.json'
+URI_ATTRIBUTE_PATTERN = re.compile(r'URI="([^"]+)"')
+
+def get_output_dir(staging_dir):
+    """
+    Returns the directory the renditions are written to before they are swapped into place.
+    """
+    return os.path.join(staging_dir, OUTPUT_DIRNAME)
+
+def get_checkpoint_path(staging_dir, name):
+    return os.path.join(staging_dir, CHECKPOINTS_DIRNAME, f"{name}.done")
+
+def prepare_staging_dir(staging_dir):
+    """
+    Creates the staging directory of a conversion, keeping the output and checkpoints of a previous attempt.
+    """
+    os.makedirs(get_output_dir(staging_dir), exist_ok=True)
+    os.makedirs(os.path.join(staging_dir, CHECKPOINTS_DIRNAME), exist_ok=True)
+
+def is_checkpointed(staging_dir, name):
+    """
+    Returns whether the step (e.g. a rendition) with the given name has been completed by a previous attempt.
+    """
+    return os.path.isfile(get_checkpoint_path(staging_dir, name))
+
+def mark_checkpoint(staging_dir, name):
+    """
+    Records that the step (e.g. a rendition) with the given name has been completed, so retries skip it.
+    """
+    with open(get_checkpoint_path(staging_dir, name), 'w') as f:
+        f.write('')
+
+def list_output_files(staging_dir, base_name=None):
+    """
+    Returns the paths of the staged playlist, initialization segment and segments of the rendition
+    with the given base name, or of all staged files if no base name is given.
+    """
+    output_dir = get_output_dir(staging_dir)
+    return [
+        os.path.join(output_dir, filename) for filename in os.listdir(output_dir)
+        if base_name is None or filename == f"{base_name}.m3u8" or filename.startswith(f"{base_name}_")
+    ]
+
+def clear_output_files(staging_dir, base_name=None):
+    """
+    Deletes the files left behind by an interrupted attempt to convert a rendition, see "list_output_files".
+    """
+    for path in list_output_files(staging_dir, base_name):
+        os.remove(path)
+
+def has_staged_output(staging_dir):
+    """
+    Returns whether the staging directory contains output which has not been swapped into place yet.
+    """
+    output_dir = get_output_dir(staging_dir)
+    return os.path.isdir(output_dir) and bool(os.listdir(output_dir))
+
+def save_plan(staging_dir, plan):
+    """
+    Stores the conversion plan, so retries convert the same renditions with the same encoding parameters.
+    """
+    with open(os.path.join(staging_dir, PLAN_FILENAME), 'w') as f:
+        json.dump(plan, f)
+
+def load_plan(staging_dir):
+    """
+    Returns the conversion plan stored by a previous attempt, or None.
+    """
+    try:
+        with open(os.path.join(staging_dir, PLAN_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def read_playlist_uris(path):
+    """
+    Returns the URIs referenced by a playlist on URI lines and in URI attributes, and whether it is complete.
+    """
+    uris, complete = [], False
+    with open(path) as f:
+        for line in f.read().splitlines():
+            line = line.strip()
+            if line == '#EXT-X-ENDLIST':
+                complete = True
+            elif line.startswith('#'):
+                uris.extend(URI_ATTRIBUTE_PATTERN.findall(line))
+            elif line:
+                uris.append(line)
+    return uris, complete
+
+def verify_hls_output(directory, master_filename, extra_filenames=()):
+    """
+    Checks that the master playlist, all variant playlists and all their segments exist within the directory
+    and that every variant playlist is complete. Raises a ValueError describing the first problem found.
+    """
+    master_path = os.path.join(directory, master_filename)
+    if not os.path.isfile(master_path):
+        raise ValueError(f"Missing master playlist '{master_filename}'.")
+    for filename in extra_filenames:
+        if not os.path.isfile(os.path.join(directory, filename)):
+            raise ValueError(f"Missing file '{filename}'.")
+    variants, _ = read_playlist_uris(master_path)
+    if not variants:
+        raise ValueError(f"Master playlist '{master_filename}' references no renditions.")
+    for variant in variants:
+        variant_path = os.path.join(directory, variant)
+        if not os.path.isfile(variant_path):
+            raise ValueError(f"Missing variant playlist '{variant}'.")
+        uris, complete = read_playlist_uris(variant_path)
+        if not complete:
+            raise ValueError(f"Variant playlist '{variant}' is incomplete.")
+        for uri in uris:
+            if not os.path.isfile(os.path.join(directory, uri)):
+                raise ValueError(f"Missing segment '{uri}' of variant playlist '{variant}'.")
+
+def swap_into_place(staging_dir, target_dir):
+    """
+    Moves the staged output to the target directory by renaming, which is atomic on the same file system.
+    Files published by a previous conversion are moved aside first and deleted with the staging directory.
+    """
+    previous_dir = os.path.join(staging_dir, PREVIOUS_DIRNAME)
+    if os.path.isdir(target_dir):
+        if os.path.isdir(previous_dir):
+            shutil.rmtree(previous_dir)
+        os.rename(target_dir, previous_dir)
+    os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+    os.rename(get_output_dir(staging_dir), target_dir)
+
+def delete_staging_dir(staging_dir):
+    if os.path.isdir(staging_dir):
+        shutil.rmtree(staging_dir)
@@ -1,7 +1,35 @@
 import os
+import functools
 import subprocess
-from .utils import calc_duration, generate_playlist_basename, generate_single_resolution_cmd, delete_source_video
+import tempfile
+import time
+import django_rq
+from rq import Retry, get_current_job
+from django.conf import settings
+from django.contrib.auth.models import User
+from .models import Video, VideoCompletion
+from .utils import probe_video, generate_playlist_basename, delete_source_video
+from .utils import plan_resolution_ladder, AUDIO_BITRATE, AUDIO_RENDITION_NAME, MPEGTS, FMP4
+from .utils import generate_single_resolution_cmd, generate_multi_resolution_cmd, generate_audio_rendition_cmd
+from .utils import plan_artwork, generate_artwork_cmd, generate_thumbnail_track
+from .utils import ENCODING_PRESETS, CAPPED_CRF, SAMPLE_DURATION, plan_sample_times, generate_sample_encode_cmd, apply_crf_values
+from .dash import parse_media_playlist, generate_mpd
+from .progress import ProgressReporter, ALL_RESOLUTIONS, start_progress, run_ffmpeg_with_progress
+from .staging import prepare_staging_dir, get_output_dir, is_checkpointed, mark_checkpoint, clear_output_files, list_output_files
+from .staging import save_plan, load_plan, verify_hls_output, has_staged_output, swap_into_place, delete_staging_dir
+from .metrics import measure_stage, record_rendition
+from .buffer import pop_buffered_users, pop_buffered_progress, restore_buffered_progress
 
+SINGLE_PASS = 'single_pass'
+PER_RESOLUTION = 'per_resolution'
+PARALLEL = 'parallel'
+STAGED = 'staged'
+
+# Timeouts of the processing steps (in seconds), which can be overridden by the "HLS_STEP_TIMEOUTS" setting.
+DEFAULT_STEP_TIMEOUTS = { "probe": 60, "analysis": 600, "artwork": 600, "transcode": 600 }
+
+# Candidate resolutions. The renditions actually converted are planned from these
+# for each source, see "plan_resolution_ladder" in utils.
 RESOLUTIONS = [
     { "width": 640, "height": 360, "bitrate": 1000 },
     { "width": 853, "height": 480, "bitrate": 1500 },
@@ -9,47 +37,423 @@ RESOLUTIONS = [
     { "width": 1920, "height": 1080, "bitrate": 5000 }
 ]
 
-def set_video_duration(video_obj):
+def will_be_retried():
+    """
+    Returns whether the current job (if the task runs as RQ job) has retries left, i.e. is retried after failing.
+    """
+    job = get_current_job()
+    return bool(job and job.retries_left)
+
+def fail_on_error(task):
+    """
+    Decorator marking the processing state of the task's video as failed if the task raises an exception
+    and is not retried automatically. While retries are left, the video keeps its current processing state.
+    """
+    @functools.wraps(task)
+    def wrapper(*args, **kwargs):
+        video_obj = kwargs.get('video_obj', args[0] if args else None)
+        try:
+            return task(*args, **kwargs)
+        except Exception:
+            if not will_be_retried():
+                video_obj.update_processing_state(Video.FAILED)
+            raise
+    return wrapper
+
+def get_step_timeout(step, duration=None):
+    """
+    Returns the timeout of a processing step (in seconds), extended by "HLS_TIMEOUT_REALTIME_FACTOR" seconds
+    per second of the source duration if given, so long videos are not killed while still making progress.
+    """
+    timeout = {**DEFAULT_STEP_TIMEOUTS, **getattr(settings, 'HLS_STEP_TIMEOUTS', {})}[step]
+    return timeout + getattr(settings, 'HLS_TIMEOUT_REALTIME_FACTOR', 4) * (duration or 0)
+
+def get_job_retry():
+    """
+    Returns the automatic retry policy of the processing jobs, configured by the "HLS_JOB_RETRIES" setting
+    and the "HLS_JOB_RETRY_INTERVALS" setting (backoff in seconds before each retry).
+    """
+    return Retry(
+        max=getattr(settings, 'HLS_JOB_RETRIES', 3),
+        interval=getattr(settings, 'HLS_JOB_RETRY_INTERVALS', [60, 300, 900])
+    )
+
+def get_segment_format():
+    """
+    Returns the HLS segment format selected by the "HLS_SEGMENT_FORMAT" setting.
+    """
+    return getattr(settings, 'HLS_SEGMENT_FORMAT', MPEGTS)
+
+def has_separate_audio(resolutions, segment_format):
+    """
+    Returns whether the audio is converted to a separate rendition shared by all video renditions,
+    which is the case for fragmented MP4 segments of a source with audio.
+    """
+    return segment_format == FMP4 and any(res.get('audio', True) for res in resolutions)
+
+def publish_playlist(video_obj, segment_format=MPEGTS):
+    """
+    Marks the video as playable, storing the path of its master playlist
+    and of its DASH manifest if the segments are fragmented MP4.
+    """
+    dash_manifest_path = video_obj.dash_manifest_rel_path if segment_format == FMP4 else ''
+    video_obj.update_processing_state(
+        Video.READY, playlist_path=video_obj.master_playlist_rel_path, dash_manifest_path=dash_manifest_path
+    )
+
+@fail_on_error
+@measure_stage('probe')
+def set_video_metadata(video_obj):
     """
-    Sets duration of video instance after calculating the value.
+    Sets the metadata of a video instance (resolution, codecs, frame rate, bitrate,
+    audio channels and duration) after reading them in a single FFProbe pass.
     """
+    video_obj.update_processing_state(Video.PROBING)
     try:
-        result = calc_duration(video_obj)
-        if result.returncode != 0:
-            raise ValueError(f"ffprobe error: {result.stderr}")
-        duration = float(result.stdout.strip())
-        video_obj.duration_in_seconds = duration
-        video_obj.save()
+        metadata = probe_video(video_obj, timeout=get_step_timeout('probe'))
+        for field, value in metadata.items():
+            setattr(video_obj, field, value)
+        video_obj.save(update_fields=[*metadata.keys(), 'updated_at'])
     except Exception as e:
-        raise ValueError(f"Error when identifying the video duration: {e}")
+        raise ValueError(f"Error when identifying the video metadata: {e}")
+
+def generate_stream_inf(resolution, audio_group=None):
+    """
+    Returns the master playlist tag describing a single rendition,
+    referring to the group of the separate audio rendition if any.
+    """
+    audio_bitrate = AUDIO_BITRATE if resolution.get('audio', True) else 0
+    attributes = [
+        f"BANDWIDTH={(resolution['maxrate'] + audio_bitrate) * 1000}",
+        f"AVERAGE-BANDWIDTH={(resolution.get('average_bitrate', resolution['bitrate']) + audio_bitrate) * 1000}",
+        f"RESOLUTION={resolution['width']}x{resolution['height']}",
+        f"CODECS=\"{resolution['codecs']}\"",
+    ]
+    if resolution.get('fps'):
+        attributes.append(f"FRAME-RATE={resolution['fps']:.3f}")
+    if audio_group:
+        attributes.append(f"AUDIO=\"{audio_group}\"")
+    return "#EXT-X-STREAM-INF:" + ",".join(attributes)
 
-def create_playlists(video_obj):
+def create_playlists(video_obj, resolutions, segment_format=MPEGTS, output_dir=None):
     """
     Creates multiple HLS playlist files and combines them into a single master playlist.
+    Fragmented MP4 segments require protocol version 7.
+    The master playlist is written to the video files directory unless another output directory is given.
     """
-    master_playlist_lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
-    resolution_lookup = {f"{res['height']}p": res['bitrate'] * 1000 for res in RESOLUTIONS}
-    for res in RESOLUTIONS:
-        resolution = f"{res['height']}p"
-        playlist_filename = f"{generate_playlist_basename(video_obj, res['height'])}.m3u8"
-        bandwidth = resolution_lookup.get(resolution, 1000000)
+    master_playlist_lines = ["#EXTM3U", "#EXT-X-VERSION:7" if segment_format == FMP4 else "#EXT-X-VERSION:3"]
+    audio_group = None
+    if has_separate_audio(resolutions, segment_format):
+        audio_group = AUDIO_RENDITION_NAME
         master_playlist_lines.append(
-            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution}"
+            f"#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID=\"{audio_group}\",NAME=\"{AUDIO_RENDITION_NAME}\","
+            f"DEFAULT=YES,AUTOSELECT=YES,URI=\"{video_obj.pk}_{AUDIO_RENDITION_NAME}.m3u8\""
         )
+    for res in resolutions:
+        playlist_filename = f"{generate_playlist_basename(video_obj, res['height'])}.m3u8"
+        master_playlist_lines.append(generate_stream_inf(res, audio_group))
         master_playlist_lines.append(playlist_filename)
-    output_file = f"{video_obj.video_files_abs_dir}/{video_obj.pk}_master.m3u8"
+    output_file = f"{output_dir or video_obj.video_files_abs_dir}/{video_obj.pk}_master.m3u8"
     with open(output_file, "w") as f:
         f.write("\n".join(master_playlist_lines) + "\n")
 
+def create_dash_manifest(video_obj, resolutions, output_dir=None):
+    """
+    Creates a DASH manifest next to the master playlist, describing the fragmented MP4 segments
+    of the HLS renditions, so DASH players can stream the same files.
+    """
+    output_dir = output_dir or video_obj.video_files_abs_dir
+
+    def read_media_playlist(basename):
+        with open(f"{output_dir}/{basename}.m3u8") as f:
+            return parse_media_playlist(f.read())
+
+    video_renditions = [(res, read_media_playlist(generate_playlist_basename(video_obj, res['height']))) for res in resolutions]
+    audio_playlist = None
+    if has_separate_audio(resolutions, FMP4):
+        audio_playlist = read_media_playlist(f"{video_obj.pk}_{AUDIO_RENDITION_NAME}")
+    with open(os.path.join(output_dir, os.path.basename(video_obj.dash_manifest_rel_path)), "w") as f:
+        f.write(generate_mpd(video_renditions, audio_playlist))
+
+@measure_stage('artwork')
+def create_artwork(video_obj):
+    """
+    Creates a poster frame with resized WebP variants for different screen densities, as well as sprite sheets
+    with a WebVTT thumbnail track for scrub previews, all in a single FFMPEG pass over the video upload.
+    The poster becomes the video thumbnail unless a thumbnail has been uploaded.
+    """
+    artwork = plan_artwork(video_obj.source_properties, video_obj.duration_in_seconds)
+    os.makedirs(video_obj.artwork_abs_dir, exist_ok=True)
+    subprocess.run(
+        generate_artwork_cmd(video_obj, artwork), check=True, capture_output=True,
+        timeout=get_step_timeout('artwork', video_obj.duration_in_seconds)
+    )
+    with open(os.path.join(video_obj.artwork_abs_dir, 'thumbnails.vtt'), 'w') as f:
+        f.write(generate_thumbnail_track(artwork))
+    rel_dir = video_obj.artwork_rel_dir
+    fields = {'artwork': {
+        'poster': os.path.join(rel_dir, 'poster.jpg'),
+        'poster_variants': {str(width): os.path.join(rel_dir, f"poster_{width}w.webp") for width in artwork['poster_widths']},
+        'thumbnail_track': os.path.join(rel_dir, 'thumbnails.vtt'),
+    }}
+    if not video_obj.thumbnail:
+        fields['thumbnail'] = fields['artwork']['poster']
+    video_obj.persist_fields(**fields)
+
+def generate_rendition_name(resolution):
+    """
+    Returns the name of a rendition, used to report its conversion progress.
+    """
+    return f"{resolution['height']}p"
+
+def generate_rendition_names(resolutions, segment_format):
+    """
+    Returns the names of all renditions converted separately, including the audio rendition if any.
+    """
+    names = [generate_rendition_name(res) for res in resolutions]
+    if has_separate_audio(resolutions, segment_format):
+        names.append(AUDIO_RENDITION_NAME)
+    return names
+
+def get_encoding_preset(video_obj):
+    """
+    Returns the encoding preset selected for the video, or by the "HLS_ENCODING_PRESET" setting.
+    """
+    return ENCODING_PRESETS[video_obj.encoding_preset or getattr(settings, 'HLS_ENCODING_PRESET', 'standard')]
+
+def analyze_complexity(video_obj, resolutions, preset):
+    """
+    Encodes short samples of the video upload at the highest planned resolution and the preset's reference CRF,
+    and returns the renditions with the CRF values picked from the resulting bitrate.
+    """
+    reference = resolutions[-1]
+    sample_times = plan_sample_times(video_obj.duration_in_seconds)
+    sample_length = min(SAMPLE_DURATION, video_obj.duration_in_seconds or SAMPLE_DURATION) * len(sample_times)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_path = os.path.join(temp_dir, 'sample.mkv')
+        cmd = generate_sample_encode_cmd(video_obj, reference, preset, sample_times, output_path)
+        subprocess.run(cmd, check=True, capture_output=True, timeout=get_step_timeout('analysis'))
+        sample_bitrate = os.path.getsize(output_path) * 8 / 1000 / sample_length
+    return apply_crf_values(resolutions, reference, sample_bitrate, preset)
+
+@measure_stage('plan')
+def plan_resolutions(video_obj):
+    """
+    Returns the renditions to convert the video upload to,
+    based on the stored source metadata and the candidate resolutions defined above,
+    encoded according to the video's encoding preset.
+    The source is only probed if its metadata has not been stored yet.
+    """
+    if not video_obj.has_metadata:
+        set_video_metadata(video_obj)
+    preset = get_encoding_preset(video_obj)
+    resolutions = [
+        {**res, "preset": preset['x264_preset']}
+        for res in plan_resolution_ladder(video_obj.source_properties, RESOLUTIONS)
+    ]
+    if preset['rate_control'] == CAPPED_CRF:
+        resolutions = analyze_complexity(video_obj, resolutions, preset)
+    return resolutions
+
+def plan_conversion(video_obj, staging_dir):
+    """
+    Returns the segment format and the renditions to convert the video upload to.
+    The plan is stored in the staging directory, so retries convert the same renditions
+    with the same encoding parameters instead of repeating the analysis.
+    """
+    plan = load_plan(staging_dir)
+    if plan is None:
+        plan = {"segment_format": get_segment_format(), "resolutions": plan_resolutions(video_obj)}
+        save_plan(staging_dir, plan)
+    return plan['segment_format'], plan['resolutions']
+
+def run_rendition(video_obj, name, base_name, cmd):
+    """
+    Converts the video upload into the staging directory using the given FFMPEG arguments, unless a previous
+    attempt has already completed the rendition. Files left behind by an interrupted attempt are deleted first.
+    The real-time factor and output size of the rendition are recorded as metrics.
+    """
+    staging_dir = video_obj.staging_abs_dir
+    reporter = ProgressReporter(video_obj, name)
+    if is_checkpointed(staging_dir, name):
+        reporter.update({'progress': 'end'})
+        return
+    clear_output_files(staging_dir, base_name)
+    started_at = time.monotonic()
+    with measure_stage('transcode'):
+        run_ffmpeg_with_progress(
+            ["ffmpeg", "-i", video_obj.video_upload.path, *cmd], reporter,
+            timeout=get_step_timeout('transcode', video_obj.duration_in_seconds)
+        )
+    mark_checkpoint(staging_dir, name)
+    output_bytes = sum(os.path.getsize(path) for path in list_output_files(staging_dir, base_name))
+    record_rendition(name, video_obj.duration_in_seconds, time.monotonic() - started_at, output_bytes)
+
+def convert_all_resolutions(video_obj, resolutions, segment_format=MPEGTS):
+    """
+    Converts the video upload to all resolutions using a single FFMPEG process.
+    The master playlist (with the planned codecs and bandwidths) and the DASH manifest are created afterwards,
+    like for separately converted renditions.
+    """
+    output_dir = get_output_dir(video_obj.staging_abs_dir)
+    cmd = generate_multi_resolution_cmd(video_obj=video_obj, resolutions=resolutions, segment_format=segment_format, output_dir=output_dir)
+    run_rendition(video_obj, ALL_RESOLUTIONS, None, cmd)
+    create_manifests(video_obj, resolutions, segment_format, output_dir)
+
+@fail_on_error
+def convert_single_resolution(video_obj, resolution, segment_format=MPEGTS):
+    """
+    Converts the video upload to a single resolution using a separate FFMPEG process.
+    """
+    output_dir = get_output_dir(video_obj.staging_abs_dir)
+    cmd = generate_single_resolution_cmd(video_obj=video_obj, index=0, resolution=resolution, segment_format=segment_format, output_dir=output_dir)
+    run_rendition(video_obj, generate_rendition_name(resolution), generate_playlist_basename(video_obj, resolution['height']), cmd)
+
+@fail_on_error
+def convert_audio_rendition(video_obj):
+    """
+    Converts the audio of the video upload to a separate fragmented MP4 rendition using a separate FFMPEG process.
+    """
+    cmd = generate_audio_rendition_cmd(video_obj=video_obj, output_dir=get_output_dir(video_obj.staging_abs_dir))
+    run_rendition(video_obj, AUDIO_RENDITION_NAME, f"{video_obj.pk}_{AUDIO_RENDITION_NAME}", cmd)
+
+def create_manifests(video_obj, resolutions, segment_format=MPEGTS, output_dir=None):
+    """
+    Combines the playlists of separately converted renditions into the master playlist
+    and the DASH manifest if the segments are fragmented MP4.
+    """
+    create_playlists(video_obj, resolutions, segment_format, output_dir)
+    if segment_format == FMP4:
+        create_dash_manifest(video_obj, resolutions, output_dir)
+
+def convert_each_resolution(video_obj, resolutions, segment_format=MPEGTS):
+    """
+    Converts the video upload using a separate FFMPEG process for each resolution
+    (and the audio rendition, if any) and combines the resulting playlists afterwards.
+    """
+    for res in resolutions:
+        convert_single_resolution(video_obj, res, segment_format)
+    if has_separate_audio(resolutions, segment_format):
+        convert_audio_rendition(video_obj)
+    create_manifests(video_obj, resolutions, segment_format, get_output_dir(video_obj.staging_abs_dir))
+
+@measure_stage('publish')
+def publish_staged_output(video_obj, segment_format=MPEGTS):
+    """
+    Verifies the staged output and swaps it into place, replacing any previously published files,
+    before marking the video as playable. The source video upload is only deleted once the published files
+    have been verified, so a failed attempt can always be retried without uploading the video again.
+    Steps completed by a previous attempt are skipped.
+    """
+    staging_dir = video_obj.staging_abs_dir
+    master_filename = os.path.basename(video_obj.master_playlist_rel_path)
+    extra_filenames = [os.path.basename(video_obj.dash_manifest_rel_path)] if segment_format == FMP4 else []
+    if not is_checkpointed(staging_dir, STAGED):
+        verify_hls_output(get_output_dir(staging_dir), master_filename, extra_filenames)
+        mark_checkpoint(staging_dir, STAGED)
+    if has_staged_output(staging_dir):
+        swap_into_place(staging_dir, video_obj.video_files_abs_dir)
+    verify_hls_output(video_obj.video_files_abs_dir, master_filename, extra_filenames)
+    publish_playlist(video_obj, segment_format)
+    delete_source_video(video_obj)
+    delete_staging_dir(staging_dir)
+
+@fail_on_error
+def finalize_hls_conversion(video_obj, resolutions, segment_format=MPEGTS):
+    """
+    Combines the playlists of all converted resolutions, publishes the master playlist
+    and deletes the source video upload.
+    """
+    if not is_checkpointed(video_obj.staging_abs_dir, STAGED):
+        create_manifests(video_obj, resolutions, segment_format, get_output_dir(video_obj.staging_abs_dir))
+    publish_staged_output(video_obj, segment_format)
+
+def enqueue_parallel_conversion(video_obj, resolutions, segment_format=MPEGTS):
+    """
+    Enqueues a separate job for each resolution (and the audio rendition, if any), so multiple workers
+    can convert the video upload in parallel. The finalizing job only runs after all these jobs have succeeded.
+    Failed jobs are retried automatically, skipping the renditions completed before.
+    """
+    queue = django_rq.get_queue('default', autocommit=True)
+    rendition_tasks = [
+        queue.enqueue(convert_single_resolution, video_obj=video_obj, resolution=res, segment_format=segment_format, retry=get_job_retry())
+        for res in resolutions
+    ]
+    if has_separate_audio(resolutions, segment_format):
+        rendition_tasks.append(queue.enqueue(convert_audio_rendition, video_obj=video_obj, retry=get_job_retry()))
+    return queue.enqueue(
+        finalize_hls_conversion, video_obj=video_obj, resolutions=resolutions, segment_format=segment_format,
+        depends_on=rendition_tasks, retry=get_job_retry()
+    )
+
+@fail_on_error
+@measure_stage('convert')
 def convert_video_to_hls(video_obj):
     """
     Converts uploaded video file into HLS streaming format,
-    covering the video resolutions and bitrates defined above.
-    """
-    os.makedirs(video_obj.video_files_abs_dir, exist_ok=True)
-    for i, res in enumerate(RESOLUTIONS):
-        cmd = ["ffmpeg", "-i", video_obj.video_upload.path]
-        cmd.extend(generate_single_resolution_cmd(video_obj=video_obj, index=i, resolution=res))
-        subprocess.run(cmd, capture_output=True, check=True)
-    create_playlists(video_obj)
-    delete_source_video(video_obj)
\ No newline at end of file
+    covering the resolutions planned for the source out of the candidates defined above.
+    The transcoding strategy is selected by the "HLS_TRANSCODE_MODE" setting,
+    the segment format by the "HLS_SEGMENT_FORMAT" setting.
+    The renditions are written to a staging directory, which is only swapped into place once complete.
+    Retrying the task after a failure or crash resumes the conversion, reusing the stored plan
+    and skipping completed renditions. Videos already published are left unchanged.
+    """
+    mode = getattr(settings, 'HLS_TRANSCODE_MODE', SINGLE_PASS)
+    video_obj.refresh_from_db()
+    if video_obj.is_playable:
+        delete_source_video(video_obj)
+        return
+    staging_dir = video_obj.staging_abs_dir
+    prepare_staging_dir(staging_dir)
+    segment_format, resolutions = plan_conversion(video_obj, staging_dir)
+    if not video_obj.artwork:
+        try:
+            create_artwork(video_obj)
+        except Exception as e:
+            print("Error while creating the video artwork:", e)
+    video_obj.update_processing_state(Video.TRANSCODING)
+    if mode == SINGLE_PASS:
+        start_progress(video_obj, [ALL_RESOLUTIONS])
+    else:
+        start_progress(video_obj, generate_rendition_names(resolutions, segment_format))
+    if mode == PARALLEL:
+        enqueue_parallel_conversion(video_obj, resolutions, segment_format)
+        return
+    if not is_checkpointed(staging_dir, STAGED):
+        if mode == SINGLE_PASS:
+            convert_all_resolutions(video_obj, resolutions, segment_format)
+        elif mode == PER_RESOLUTION:
+            convert_each_resolution(video_obj, resolutions, segment_format)
+        else:
+            raise ValueError(f"Unknown HLS transcoding mode '{mode}'.")
+    publish_staged_output(video_obj, segment_format)
+
+def flush_progress_buffer():
+    """
+    Writes all buffered playback positions to the database in a single bulk upsert
+    and returns the number of video completions written.
+    Entries referring to deleted users or videos are dropped. If any database query fails,
+    the entries are put back into the buffer unless they have been updated in the meantime.
+    """
+    buffered = {user_pk: pop_buffered_progress(user_pk) for user_pk in pop_buffered_users()}
+    try:
+        video_pks = {video_pk for entries in buffered.values() for video_pk in entries}
+        existing_videos = set(Video.objects.filter(pk__in=video_pks).values_list('pk', flat=True))
+        existing_users = set(User.objects.filter(pk__in=buffered.keys()).values_list('pk', flat=True))
+        completions = [
+            VideoCompletion(user_id=user_pk, video_id=video_pk, current_time=entry['current_time'], recorded_at=entry['updated_at'])
+            for user_pk, entries in buffered.items() if user_pk in existing_users
+            for video_pk, entry in entries.items() if video_pk in existing_videos
+        ]
+        VideoCompletion.objects.bulk_create(
+            completions,
+            update_conflicts=True,
+            unique_fields=['user', 'video'],
+            update_fields=['current_time', 'recorded_at', 'updated_at'],
+            batch_size=1000
+        )
+    except Exception:
+        for user_pk, entries in buffered.items():
+            restore_buffered_progress(user_pk, entries)
+        raise
+    return len(completions)
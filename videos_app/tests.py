@@ -1,14 +1,39 @@
+from django.conf import settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from django.test import override_settings
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
-from .models import Video, VideoCompletion
+from .models import Video, VideoUpload, VideoCompletion
+from .tasks import RESOLUTIONS, convert_single_resolution, finalize_hls_conversion, enqueue_parallel_conversion
+from .tasks import create_playlists, create_manifests, flush_progress_buffer, plan_resolutions
+from .tasks import convert_each_resolution, convert_all_resolutions, publish_staged_output, fail_on_error
+from .utils import generate_multi_resolution_cmd, plan_resolution_ladder, parse_probe_output, FMP4
+from .utils import plan_artwork, generate_artwork_cmd, generate_thumbnail_track, generate_playlist_basename
+from .utils import ENCODING_PRESETS, SAMPLE_COUNT, SAMPLE_DURATION, apply_crf_values, generate_video_encoding_args
+from .progress import ProgressReporter, start_progress, run_ffmpeg_with_progress
+from .staging import prepare_staging_dir, get_output_dir, is_checkpointed
+from .metrics import measure_stage, record_rendition
+from videoflix.metrics import REQUEST_DURATION
+from .signing import generate_signed_query
+from .views import VideoViewSet, VideoCompletionViewSet
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from users_app.authentication import local_token_cache
+from unittest import mock
+from urllib.parse import urlsplit
+from xml.etree import ElementTree
 import os
+import json
+import subprocess
 import tempfile
+import time
+import unittest
 
 class VideosTests(APITestCase):
     """
@@ -52,6 +77,7 @@ class VideosTests(APITestCase):
         playlist_path = os.path.join(video_dir, f"{self.mock_video.pk}_master.m3u8")
         with open(playlist_path, 'w') as f:
             f.write("this is not a playlist file!")
+        self.mock_video.update_processing_state(Video.READY, playlist_path=self.mock_video.master_playlist_rel_path)
         
     def tearDown(self):
         """
@@ -74,7 +100,8 @@ class VideosTests(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertNotIn('file', response.data)
-        for key in ('id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'duration_in_seconds', 'thumbnail'):
+        for key in ('id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'duration_in_seconds', 'thumbnail',
+                    'width', 'height', 'fps', 'processing_state'):
             self.assertIn(key, response.data[0])
             
     def test_get_video_list_not_authenticated_unauthorized(self):
@@ -102,9 +129,29 @@ class VideosTests(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertNotIn('file', response.data)
-        for key in ('id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'duration_in_seconds', 'thumbnail'):
+        for key in ('id', 'title', 'description', 'genre', 'created_at', 'playlist_url', 'duration_in_seconds', 'thumbnail',
+                    'width', 'height', 'fps', 'processing_state'):
             self.assertIn(key, response.data)
         
+    def test_get_video_detail_artwork_ok(self):
+        """
+        Tests videos detail view GET request for a video with generated artwork.
+
+        Asserts:
+            - Absolute URLs of the poster variants by width descriptor.
+            - Absolute URL of the thumbnail track.
+        """
+        rel_dir = self.mock_video.artwork_rel_dir
+        self.mock_video.persist_fields(artwork={
+            'poster': f"{rel_dir}/poster.jpg",
+            'poster_variants': {'320': f"{rel_dir}/poster_320w.webp"},
+            'thumbnail_track': f"{rel_dir}/thumbnails.vtt",
+        })
+        url = reverse('video-detail', kwargs={'pk': self.mock_video.pk})
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['poster_variants'], {'320w': f"http://testserver/media/{rel_dir}/poster_320w.webp"})
+        self.assertEqual(response.data['thumbnail_track_url'], f"http://testserver/media/{rel_dir}/thumbnails.vtt")
+
     def test_get_video_detail_not_authenticated_unauthorized(self):
         """
         Tests failing videos detail view GET request without credentials.
@@ -117,6 +164,151 @@ class VideosTests(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_get_video_processing_ok(self):
+        """
+        Tests video processing view GET request while a conversion is running.
+
+        Asserts:
+            - 200 OK status.
+            - Combined progress of all registered renditions.
+            - Progress of the rendition currently being converted.
+        """
+        start_progress(self.mock_video, ['360p', '720p'])
+        ProgressReporter(self.mock_video, '360p').update({'out_time_us': '7650000', 'progress': 'end'})
+        ProgressReporter(self.mock_video, '720p').update({'out_time_us': '1912500', 'fps': '48.0', 'progress': 'continue'})
+        url = reverse('video-processing', kwargs={'pk': self.mock_video.pk})
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['progress']['percent'], 62.5)
+        self.assertEqual(response.data['progress']['current_rendition'], '720p')
+        self.assertEqual(response.data['progress']['fps'], 48.0)
+
+    def test_get_video_list_pending_without_playlist_ok(self):
+        """
+        Tests videos list view GET request including a video which has not been converted yet.
+
+        Asserts:
+            - 200 OK status.
+            - Playlist URL for the ready video only.
+            - Only the ready video when filtering by processing state.
+        """
+        pending_video = Video.objects.create(title='pendingtitle', description='testdescription')
+        url = reverse('video-list')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        playlist_urls = {video['id']: video['playlist_url'] for video in response.data}
+        self.assertIsNone(playlist_urls[pending_video.pk])
+        self.assertTrue(urlsplit(playlist_urls[self.mock_video.pk]).path.endswith(f"{self.mock_video.pk}_master.m3u8"))
+        response = self.client.get(url, data={'processing_state': Video.READY}, format='json')
+        self.assertEqual([video['id'] for video in response.data], [self.mock_video.pk])
+
+    def test_get_video_list_paginated_ok(self):
+        """
+        Tests videos list view GET request with a page size.
+
+        Asserts:
+            - 200 OK status.
+            - Newest video on the first page.
+            - Remaining video on the page linked by the next cursor.
+        """
+        newer_video = Video.objects.create(title='newertitle', description='testdescription')
+        url = reverse('video-list')
+        response = self.client.get(url, data={'page_size': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([video['id'] for video in response.data['results']], [newer_video.pk])
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual([video['id'] for video in response.data['results']], [self.mock_video.pk])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_video_list_selected_fields_ok(self):
+        """
+        Tests videos list view GET request selecting a subset of fields.
+
+        Asserts:
+            - 200 OK status.
+            - Presence of the requested fields only.
+        """
+        url = reverse('video-list')
+        response = self.client.get(url, data={'fields': 'id,title,thumbnail'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0].keys()), {'id', 'title', 'thumbnail'})
+
+    def test_get_video_list_include_progress_ok(self):
+        """
+        Tests videos list view GET request including the playback progress of the current user.
+
+        Asserts:
+            - 200 OK status.
+            - Current time and percent watched of the current user.
+            - No progress fields without the include parameter.
+        """
+        VideoCompletion.objects.create(user=self.user, video=self.mock_video, current_time=1.53)
+        url = reverse('video-list')
+        response = self.client.get(url, data={'include': 'progress'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['current_time'], 1.53)
+        self.assertEqual(response.data[0]['progress_percent'], 20.0)
+        response = self.client.get(url, format='json')
+        self.assertNotIn('current_time', response.data[0])
+        self.assertNotIn('progress_percent', response.data[0])
+
+    def test_get_video_list_include_progress_not_shared(self):
+        """
+        Tests that the included playback progress is not served to other users from the cache.
+
+        Asserts:
+            - Progress of the first user in the first response.
+            - No progress in the response for a second user without a video completion.
+        """
+        VideoCompletion.objects.create(user=self.user, video=self.mock_video, current_time=1.53)
+        url = reverse('video-list')
+        self.client.get(url, data={'include': 'progress'}, format='json')
+        different_user = User.objects.create_user(username='testuser2', email='testemail2@email.com', password='testpassword')
+        different_token = Token.objects.create(user=different_user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + different_token.key)
+        response = self.client.get(url, data={'include': 'progress'}, format='json')
+        self.assertIsNone(response.data[0]['current_time'])
+
+    def test_get_video_list_cache_invalidated_ok(self):
+        """
+        Tests that cached videos list responses are invalidated by video changes.
+
+        Asserts:
+            - New video listed right after its creation.
+            - Changed processing state listed right after the change.
+            - Clients are told to revalidate the response.
+        """
+        url = reverse('video-list')
+        self.client.get(url, format='json')
+        new_video = Video.objects.create(title='newtitle', description='testdescription')
+        response = self.client.get(url, format='json')
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(url, data={'processing_state': Video.FAILED}, format='json')
+        self.assertEqual(len(response.data), 0)
+        new_video.update_processing_state(Video.FAILED)
+        response = self.client.get(url, data={'processing_state': Video.FAILED}, format='json')
+        self.assertEqual([video['id'] for video in response.data], [new_video.pk])
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+    def test_get_video_list_not_modified(self):
+        """
+        Tests conditional videos list view GET requests.
+
+        Asserts:
+            - ETag and Last-Modified headers in the first response.
+            - 304 Not modified status when sending the ETag without any changes.
+            - 200 OK status when sending the ETag after a video has been added.
+        """
+        url = reverse('video-list')
+        response = self.client.get(url, format='json')
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        Video.objects.create(title='newtitle', description='testdescription')
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 class VideoCompletionTests(APITestCase):
     """
     Video completion test class testing playback state requests.
@@ -175,6 +367,23 @@ class VideoCompletionTests(APITestCase):
         for key in ('id', 'video_id', 'current_time', 'updated_at'):
             self.assertIn(key, response.data[0])
 
+    def test_get_video_completion_list_not_modified(self):
+        """
+        Tests conditional video completions list view GET requests.
+
+        Asserts:
+            - 304 Not modified status when sending the ETag without any changes.
+            - 200 OK status when sending the ETag after the current time has been updated.
+        """
+        url = reverse('video-completion-list')
+        etag = self.client.get(url, format='json')['ETag']
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.video_completion.current_time = 5.43
+        self.video_completion.save()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_get_video_completion_list_different_user_ok(self):
         """
         Tests video completions list view GET request when the video completion
@@ -362,4 +571,1473 @@ class VideoCompletionTests(APITestCase):
         self.video_completion.save()
         url = reverse('video-completion-detail', kwargs={'pk': self.video_completion.pk})
         response = self.client.patch(url, data={'current_time': new_current_time}, format='json')
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_post_video_completion_sync_ok(self):
+        """
+        Tests video completions sync view POST request with new, stale, duplicate and unknown entries.
+
+        Asserts:
+            - 200 OK status.
+            - One result per entry with last-writer-wins status and resulting current time.
+            - Newest position of each video stored in the database.
+        """
+        second_video = Video.objects.create(title='secondtitle', description='seconddescription')
+        past, future = '2000-01-01T00:00:00Z', '2100-01-01T00:00:00Z'
+        data = [
+            {'video_id': self.mock_video.pk, 'current_time': 1.0, 'client_ts': past},
+            {'video_id': second_video.pk, 'current_time': 5.0, 'client_ts': future},
+            {'video_id': second_video.pk, 'current_time': 6.0, 'client_ts': '2100-01-01T00:00:01Z'},
+            {'video_id': 999999, 'current_time': 1.0, 'client_ts': future},
+        ]
+        response = self.client.post(reverse('video-completion-sync'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['status'] for result in response.data], ['stale', 'stale', 'applied', 'invalid'])
+        self.assertEqual(response.data[0]['current_time'], 2.34)
+        self.video_completion.refresh_from_db()
+        self.assertEqual(self.video_completion.current_time, 2.34)
+        self.assertEqual(VideoCompletion.objects.get(user=self.user, video=second_video).current_time, 6.0)
+
+    def test_post_video_completion_sync_invalid_bad_request(self):
+        """
+        Tests video completions sync view POST request with an entry missing its client timestamp.
+
+        Asserts:
+            - 400 Bad request status.
+        """
+        data = [{'video_id': self.mock_video.pk, 'current_time': 1.0}]
+        response = self.client.post(reverse('video-completion-sync'), data=data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class FakeRedis:
+    """
+    In-memory replacement for the Redis commands used by the playback progress buffer and the metrics.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field.encode()] = value.encode()
+
+    def hsetnx(self, key, field, value):
+        if field.encode() not in self.data.get(key, {}):
+            self.hset(key, field, value)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field.encode(), None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    def spop(self, key, count):
+        members = self.data.pop(key, set())
+        return list(members)
+
+    def incrby(self, key, amount):
+        self.data[key] = self.data.get(key, 0) + amount
+        return self.data[key]
+
+class FakeRedisPipeline:
+    """
+    Pipeline collecting commands for the in-memory Redis replacement.
+    """
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((getattr(self.redis, name), args))
+
+    def execute(self):
+        return [command(*args) for command, args in self.commands]
+
+@override_settings(PROGRESS_WRITE_BEHIND=True)
+class VideoCompletionBufferTests(APITestCase):
+    """
+    Video completion buffer test class testing write-behind buffering of playback state requests.
+    """
+    def setUp(self):
+        """
+        Extends the video completion tests setup by replacing Redis with an in-memory buffer.
+        """
+        VideoCompletionTests.setUp(self=self)
+        self.redis_patch = mock.patch('videos_app.buffer.get_redis', return_value=FakeRedis())
+        self.redis_patch.start()
+
+    def create_temp_dir(self):
+        VideosTests.create_temp_dir(self=self)
+
+    def create_mock_playlist(self):
+        VideosTests.create_mock_playlist(self=self)
+
+    def generate_create_data(self):
+        return VideoCompletionTests.generate_create_data(self=self)
+
+    def tearDown(self):
+        """
+        Removes the in-memory buffer and resets the system to the state before testing.
+        """
+        self.redis_patch.stop()
+        VideosTests.tearDown(self=self)
+
+    def test_post_video_completion_buffered_accepted(self):
+        """
+        Tests video completions list view POST request with write-behind buffering.
+
+        Asserts:
+            - 202 Accepted status.
+            - Unchanged current time in the database.
+            - Buffered current time in the list view and the video list.
+            - Buffered current time in the database after flushing.
+        """
+        url = reverse('video-completion-list')
+        response = self.client.post(url, data={'video_id': self.mock_video.pk, 'current_time': 4.56}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.video_completion.refresh_from_db()
+        self.assertEqual(self.video_completion.current_time, 2.34)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data[0]['current_time'], 4.56)
+        response = self.client.get(reverse('video-list'), data={'include': 'progress'}, format='json')
+        self.assertEqual(response.data[0]['current_time'], 4.56)
+        self.assertEqual(flush_progress_buffer(), 1)
+        self.video_completion.refresh_from_db()
+        self.assertEqual(self.video_completion.current_time, 4.56)
+
+    def test_post_video_completion_buffered_response_shape(self):
+        """
+        Tests the response body of buffered video completion POST requests for both code paths.
+
+        Asserts:
+            - 202 Accepted status.
+            - Exactly the video ID, the current time and the modification date, without the completion ID.
+        """
+        for name in ('video-completion-list', 'video-completion-async'):
+            with self.subTest(name=name):
+                response = self.client.post(reverse(name), data={'video_id': self.mock_video.pk, 'current_time': 4.56}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+                data = response.json()
+                self.assertEqual(set(data), {'video_id', 'current_time', 'updated_at'})
+                self.assertEqual(data['video_id'], self.mock_video.pk)
+                self.assertEqual(data['current_time'], 4.56)
+
+    def test_flush_new_video_completion_created(self):
+        """
+        Tests flushing a buffered playback position without an existing video completion.
+
+        Asserts:
+            - Buffered entry listed before flushing.
+            - Video completion created by the flush.
+        """
+        self.video_completion.delete()
+        url = reverse('video-completion-list')
+        self.client.post(url, data=self.generate_create_data(), format='json')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data[0]['video_id'], self.mock_video.pk)
+        flush_progress_buffer()
+        self.assertTrue(VideoCompletion.objects.filter(user=self.user, video=self.mock_video).exists())
+
+    def test_flush_database_error_restores_buffer(self):
+        """
+        Tests flushing while the database is unavailable, failing the query for existing videos.
+
+        Asserts:
+            - Error raised by the flush.
+            - Buffered entry kept and written by the next flush.
+        """
+        self.client.post(reverse('video-completion-list'), data={'video_id': self.mock_video.pk, 'current_time': 4.56}, format='json')
+        with mock.patch('videos_app.tasks.Video.objects.filter', side_effect=OperationalError('connection lost')):
+            with self.assertRaises(OperationalError):
+                flush_progress_buffer()
+        self.assertEqual(self.client.get(reverse('video-completion-list'), format='json').data[0]['current_time'], 4.56)
+        self.assertEqual(flush_progress_buffer(), 1)
+        self.video_completion.refresh_from_db()
+        self.assertEqual(self.video_completion.current_time, 4.56)
+
+    def test_post_video_completion_async_buffered_accepted(self):
+        """
+        Tests async video completion POST request with write-behind buffering.
+
+        Asserts:
+            - 202 Accepted status.
+            - Buffered current time in the list view.
+        """
+        response = self.client.post(reverse('video-completion-async'), data={'video_id': self.mock_video.pk, 'current_time': 4.56}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.get(reverse('video-completion-list'), format='json')
+        self.assertEqual(response.data[0]['current_time'], 4.56)
+
+    def test_post_video_completion_sync_buffered_ok(self):
+        """
+        Tests video completions sync view POST request competing with a buffered playback position.
+
+        Asserts:
+            - Stale status for an entry older than the buffered position.
+            - Applied status for a newer entry, which discards the buffered position.
+            - Synced current time kept after flushing.
+        """
+        url = reverse('video-completion-list')
+        self.client.post(url, data={'video_id': self.mock_video.pk, 'current_time': 4.56}, format='json')
+        sync_url = reverse('video-completion-sync')
+        response = self.client.post(sync_url, data=[
+            {'video_id': self.mock_video.pk, 'current_time': 1.0, 'client_ts': '2000-01-01T00:00:00Z'}
+        ], format='json')
+        self.assertEqual(response.data[0]['status'], 'stale')
+        self.assertEqual(response.data[0]['current_time'], 4.56)
+        response = self.client.post(sync_url, data=[
+            {'video_id': self.mock_video.pk, 'current_time': 7.0, 'client_ts': '2100-01-01T00:00:00Z'}
+        ], format='json')
+        self.assertEqual(response.data[0]['status'], 'applied')
+        flush_progress_buffer()
+        self.video_completion.refresh_from_db()
+        self.assertEqual(self.video_completion.current_time, 7.0)
+
+class AsyncEndpointTests(APITestCase):
+    """
+    Async endpoint test class running the hot endpoints against both the DRF and the async code path.
+    """
+    LIST_URL_NAMES = ('video-list', 'video-list-async')
+    COMPLETION_URL_NAMES = ('video-completion-list', 'video-completion-async')
+
+    def setUp(self):
+        """
+        Copies the video completion tests setup.
+        """
+        VideoCompletionTests.setUp(self=self)
+
+    def create_temp_dir(self):
+        VideosTests.create_temp_dir(self=self)
+
+    def create_mock_playlist(self):
+        VideosTests.create_mock_playlist(self=self)
+
+    def generate_create_data(self):
+        return VideoCompletionTests.generate_create_data(self=self)
+
+    def tearDown(self):
+        VideosTests.tearDown(self=self)
+
+    def test_get_video_list_ok(self):
+        """
+        Tests video list GET requests with selected fields and included progress.
+
+        Asserts:
+            - 200 OK status.
+            - Equal response data for both code paths.
+            - Current time of the user's video completion.
+        """
+        responses = [self.client.get(reverse(name), data={'fields': 'id,title,current_time', 'include': 'progress'}) for name in self.LIST_URL_NAMES]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(responses[1].json()[0], {'id': self.mock_video.pk, 'title': 'testtitle', 'current_time': 2.34})
+
+    def test_get_video_list_cache_invalidated(self):
+        """
+        Tests cached video list GET requests before and after changing a video.
+
+        Asserts:
+            - Changed title in the response of both code paths.
+        """
+        for name in self.LIST_URL_NAMES:
+            self.client.get(reverse(name))
+        self.mock_video.title = 'changedtitle'
+        self.mock_video.save()
+        for name in self.LIST_URL_NAMES:
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(reverse(name)).json()[0]['title'], 'changedtitle')
+
+    def test_get_video_list_not_authenticated_unauthorized(self):
+        """
+        Tests video list GET requests without token.
+
+        Asserts:
+            - 401 Unauthorized status for both code paths.
+        """
+        self.client.logout()
+        for name in self.LIST_URL_NAMES:
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(reverse(name)).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_post_video_completion_ok(self):
+        """
+        Tests video completion POST requests for existing and new video completions.
+
+        Asserts:
+            - 200 OK status and updated current time for an existing video completion.
+            - 201 Created status for a new video completion.
+        """
+        for index, name in enumerate(self.COMPLETION_URL_NAMES):
+            with self.subTest(name=name):
+                response = self.client.post(reverse(name), data={'video_id': self.mock_video.pk, 'current_time': 4.5 + index}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.json()['current_time'], 4.5 + index)
+                self.video_completion.refresh_from_db()
+                self.assertEqual(self.video_completion.current_time, 4.5 + index)
+                self.video_completion.delete()
+                response = self.client.post(reverse(name), data=self.generate_create_data(), format='json')
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.video_completion = VideoCompletion.objects.get(user=self.user, video=self.mock_video)
+
+    def test_get_video_list_paginated_ok(self):
+        """
+        Tests paginated video list GET requests, following the cursor to the second page.
+
+        Asserts:
+            - 200 OK status.
+            - Equal results of both code paths on each page.
+            - Link to the next page only on the first page.
+        """
+        Video.objects.create(title='secondtitle', description='testdescription')
+        for name in self.LIST_URL_NAMES:
+            with self.subTest(name=name):
+                first_page = self.client.get(reverse(name), data={'page_size': 1, 'fields': 'id,title'})
+                self.assertEqual(first_page.status_code, status.HTTP_200_OK)
+                self.assertEqual(first_page.json()['results'], [{'id': Video.objects.latest('created_at').pk, 'title': 'secondtitle'}])
+                self.assertIsNotNone(first_page.json()['next'])
+                second_page = self.client.get(first_page.json()['next'])
+                self.assertEqual(second_page.json()['results'], [{'id': self.mock_video.pk, 'title': 'testtitle'}])
+                self.assertIsNone(second_page.json()['next'])
+
+    def test_post_video_completion_csrf_enforced_ok(self):
+        """
+        Tests video completion POST requests authenticated by token with enforced CSRF checks, as for real clients.
+
+        Asserts:
+            - 200 OK status for both code paths.
+        """
+        client = APIClient(enforce_csrf_checks=True)
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        for name in self.COMPLETION_URL_NAMES:
+            with self.subTest(name=name):
+                response = client.post(reverse(name), data={'video_id': self.mock_video.pk, 'current_time': 4.5}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_post_video_completion_invalid_bad_request(self):
+        """
+        Tests video completion POST requests for an unknown video.
+
+        Asserts:
+            - 400 Bad request status for both code paths.
+        """
+        for name in self.COMPLETION_URL_NAMES:
+            with self.subTest(name=name):
+                response = self.client.post(reverse(name), data={'video_id': 999999, 'current_time': 1.0}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('video_id', response.json())
+
+@override_settings(MEDIA_SIGNED_URLS=False)
+class MediaTests(TestCase):
+    """
+    Media test class testing the delivery of playlists and segments.
+    """
+    def setUp(self):
+        """
+        Creates a mock playlist and segment in a temporary media directory.
+        """
+        VideosTests.create_temp_dir(self=self)
+        video_dir = os.path.join(self.temp_dir.name, 'videos', '1_testtitle')
+        os.makedirs(video_dir)
+        self.content = bytes(range(100))
+        with open(os.path.join(video_dir, '1_720p_000.ts'), 'wb') as f:
+            f.write(self.content)
+        with open(os.path.join(video_dir, '1_master.m3u8'), 'w') as f:
+            f.write("#EXTM3U\n")
+        self.segment_url = '/media/videos/1_testtitle/1_720p_000.ts'
+
+    def tearDown(self):
+        VideosTests.tearDown(self=self)
+
+    def test_get_segment_ok(self):
+        """
+        Tests GET request for a complete segment.
+
+        Asserts:
+            - 200 OK status.
+            - Segment content and content type.
+            - Immutable caching and byte range support.
+        """
+        response = self.client.get(self.segment_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'video/mp2t')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_get_segment_range_partial_content(self):
+        """
+        Tests GET requests for byte ranges of a segment.
+
+        Asserts:
+            - 206 Partial content status with the requested bytes and content range.
+            - Last bytes for a suffix range.
+            - 416 Range not satisfiable status for a range beyond the end of the segment.
+        """
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        response = self.client.get(self.segment_url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_get_playlist_ok(self):
+        """
+        Tests GET request for a playlist.
+
+        Asserts:
+            - HLS content type.
+            - Revalidation on every request.
+        """
+        response = self.client.get('/media/videos/1_testtitle/1_master.m3u8')
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx')
+    def test_get_segment_accel_redirect_ok(self):
+        """
+        Tests GET request for a segment delivered by the front proxy.
+
+        Asserts:
+            - X-Accel-Redirect header pointing to the internal location.
+            - Empty response body.
+        """
+        response = self.client.get(self.segment_url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/videos/1_testtitle/1_720p_000.ts')
+        self.assertEqual(response.content, b'')
+
+    def test_get_media_outside_root_not_found(self):
+        """
+        Tests GET request for a path outside of the media root.
+
+        Asserts:
+            - 404 Not found status.
+        """
+        response = self.client.get('/media/../manage.py')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class SignedMediaTests(APITestCase):
+    """
+    Signed media test class testing the access to video files using signed URLs.
+    """
+    def setUp(self):
+        """
+        Copies the videos tests setup and writes a variant playlist next to the master playlist.
+        """
+        VideosTests.setUp(self=self)
+        self.video_dir = os.path.join(self.temp_dir.name, self.mock_video.video_files_rel_dir)
+        with open(os.path.join(self.temp_dir.name, self.mock_video.master_playlist_rel_path), 'w') as f:
+            f.write("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nvariant.m3u8\n")
+        with open(os.path.join(self.video_dir, 'variant.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-MAP:URI="init.mp4"\n#EXTINF:4.0,\nsegment_000.ts\n')
+        with open(os.path.join(self.video_dir, 'segment_000.ts'), 'wb') as f:
+            f.write(b"this is not a segment file!")
+
+    def create_temp_dir(self):
+        VideosTests.create_temp_dir(self=self)
+
+    def create_mock_playlist(self):
+        VideosTests.create_mock_playlist(self=self)
+
+    def tearDown(self):
+        VideosTests.tearDown(self=self)
+
+    def get_signed_playlist_url(self):
+        response = self.client.get(reverse('video-detail', kwargs={'pk': self.mock_video.pk}), format='json')
+        return response.data['playlist_url']
+
+    def test_get_signed_playlists_and_segment_ok(self):
+        """
+        Tests GET requests following the signed URIs from the master playlist to a segment.
+
+        Asserts:
+            - 200 OK status for the master playlist, the variant playlist and the segment.
+            - Signed URIs in both playlists, including URI attributes.
+            - No database queries for the media requests.
+        """
+        playlist_url = self.get_signed_playlist_url()
+        base_url = os.path.dirname(urlsplit(playlist_url).path)
+        with self.assertNumQueries(0):
+            response = self.client.get(playlist_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            variant_uri = response.content.decode().splitlines()[-1]
+            self.assertTrue(variant_uri.startswith('variant.m3u8?expires='))
+            response = self.client.get(f"{base_url}/{variant_uri}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            content = response.content.decode()
+            self.assertIn('URI="init.mp4?expires=', content)
+            response = self.client.get(f"{base_url}/{content.splitlines()[-1]}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_segment_unsigned_forbidden(self):
+        """
+        Tests GET requests for a segment without, with a tampered and with an expired signature.
+
+        Asserts:
+            - 403 Forbidden status.
+        """
+        segment_url = f"/media/{self.mock_video.video_files_rel_dir}/segment_000.ts"
+        self.assertEqual(self.client.get(segment_url).status_code, status.HTTP_403_FORBIDDEN)
+        query = urlsplit(self.get_signed_playlist_url()).query
+        response = self.client.get(f"{segment_url}?{query[:-1]}0")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        query = generate_signed_query(self.mock_video.master_playlist_rel_path, expires=int(time.time()) - 1)
+        self.assertEqual(self.client.get(f"{segment_url}?{query}").status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_get_segment_traversal_unsigned_forbidden(self):
+        """
+        Tests GET requests for a segment without signature, using paths with "." and ".." segments.
+
+        Asserts:
+            - 403 Forbidden status.
+        """
+        segment_path = f"{self.mock_video.video_files_rel_dir}/segment_000.ts"
+        for url in [
+            f"/media/video_thumbs/../{segment_path}", f"/media/./{segment_path}", f"/media/video_thumbs/%2e%2e/{segment_path}"
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+class VideoUploadTests(APITestCase):
+    """
+    Video upload test class testing resumable chunked uploads.
+    """
+    def setUp(self):
+        """
+        Creates a staff user and an upload for a mock video file in a temporary directory.
+        """
+        VideosTests.create_temp_dir(self=self)
+        self.user = User.objects.create_user(username='staffuser', email='staff@email.com', password='testpassword', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.content = b"this is not a video file!"
+        response = self.client.post(reverse('video-upload-list'), data={
+            'filename': 'mock video.mp4',
+            'size': len(self.content),
+            'title': 'uploadtitle',
+            'description': 'uploaddescription',
+        }, format='json')
+        self.upload_id = response.data['id']
+        self.url = reverse('video-upload-detail', kwargs={'pk': self.upload_id})
+
+    def tearDown(self):
+        """
+        Resets the system to the state before testing.
+        """
+        VideosTests.tearDown(self=self)
+
+    def put_chunk(self, start, end):
+        """
+        Sends the given byte range of the mock video file.
+        """
+        return self.client.put(
+            self.url,
+            data=self.content[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{len(self.content)}"
+        )
+
+    def test_put_chunks_and_finalize_created(self):
+        """
+        Tests uploading a file in two chunks and finalizing the upload.
+
+        Asserts:
+            - 200 OK status and increasing offset for each chunk.
+            - Offset available for resuming the upload.
+            - 201 Created status on finalization.
+            - Created video containing the complete file.
+        """
+        response = self.put_chunk(0, 9)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['offset'], 10)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Upload-Offset'], '10')
+        response = self.put_chunk(10, len(self.content) - 1)
+        self.assertEqual(response.data['offset'], len(self.content))
+        response = self.client.post(reverse('video-upload-finalize', kwargs={'pk': self.upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        video = Video.objects.get(pk=response.data['video_id'])
+        self.assertEqual(video.title, 'uploadtitle')
+        with open(video.video_upload.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_put_chunk_wrong_offset_conflict(self):
+        """
+        Tests sending a chunk which does not start at the current offset.
+
+        Asserts:
+            - 409 Conflict status.
+            - Unchanged offset.
+        """
+        response = self.put_chunk(5, 9)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(VideoUpload.objects.get(pk=self.upload_id).offset, 0)
+
+    def test_finalize_incomplete_conflict(self):
+        """
+        Tests finalizing an upload before all bytes have been received.
+
+        Asserts:
+            - 409 Conflict status.
+            - No video has been created.
+        """
+        self.put_chunk(0, 9)
+        response = self.client.post(reverse('video-upload-finalize', kwargs={'pk': self.upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Video.objects.exists())
+
+    def test_create_upload_not_staff_forbidden(self):
+        """
+        Tests creating an upload as a regular user.
+
+        Asserts:
+            - 403 Forbidden status.
+        """
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post(reverse('video-upload-list'), data={}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class HLSCommandTests(TestCase):
+    """
+    HLS command test class testing the FFMPEG commands used for video conversion.
+    """
+    def setUp(self):
+        """
+        Creates a video object without any files and plans the renditions for a full HD source.
+        """
+        self.video = Video.objects.create(title='test title', description='testdescription')
+        self.source = { "width": 1920, "height": 1080, "fps": 25.0, "bitrate": 8000 }
+        self.resolutions = plan_resolution_ladder(self.source, RESOLUTIONS)
+
+    def test_multi_resolution_cmd_single_decode(self):
+        """
+        Tests the single-pass command covering all resolutions.
+
+        Asserts:
+            - Exactly one split filter with one output per resolution.
+            - One variant stream per resolution, named by its height.
+            - No master playlist written by FFMPEG, since it is created from the planned renditions.
+        """
+        cmd = generate_multi_resolution_cmd(video_obj=self.video, resolutions=self.resolutions)
+        filter_graph = cmd[cmd.index('-filter_complex') + 1]
+        self.assertEqual(filter_graph.count('split='), 1)
+        self.assertIn(f"split={len(self.resolutions)}", filter_graph)
+        stream_map = cmd[cmd.index('-var_stream_map') + 1].split(' ')
+        self.assertEqual(len(stream_map), len(self.resolutions))
+        for res in self.resolutions:
+            self.assertIn(f"scale=w={res['width']}:h={res['height']}", filter_graph)
+            self.assertTrue(any(entry.endswith(f"name:{res['height']}p") for entry in stream_map))
+        self.assertNotIn('-master_pl_name', cmd)
+
+    def test_multi_resolution_cmd_fmp4_separate_audio(self):
+        """
+        Tests the single-pass command writing fragmented MP4 segments.
+
+        Asserts:
+            - Fragmented MP4 segment type with an initialization segment per rendition.
+            - Video renditions referring to a single separate audio rendition.
+        """
+        cmd = generate_multi_resolution_cmd(video_obj=self.video, resolutions=self.resolutions, segment_format=FMP4)
+        self.assertEqual(cmd[cmd.index('-hls_segment_type') + 1], 'fmp4')
+        self.assertEqual(cmd[cmd.index('-hls_fmp4_init_filename') + 1], f"{self.video.pk}_%v_init.mp4")
+        self.assertTrue(cmd[cmd.index('-hls_segment_filename') + 1].endswith('_%v_%03d.m4s'))
+        stream_map = cmd[cmd.index('-var_stream_map') + 1].split(' ')
+        self.assertEqual(len(stream_map), len(self.resolutions) + 1)
+        self.assertEqual(stream_map[-1], 'a:0,agroup:audio,name:audio')
+        self.assertEqual(cmd.count('0:a:0'), 1)
+
+    def test_artwork_cmd_single_pass(self):
+        """
+        Tests the command extracting poster and sprite sheets.
+
+        Asserts:
+            - A single input decoding key frames only.
+            - Poster variants up to the source width only.
+            - Poster, WebP variant and sprite sheet outputs.
+        """
+        self.video.video_upload.name = 'videos/mock_video.mp4'
+        artwork = plan_artwork({ "width": 960, "height": 540 }, 120)
+        self.assertEqual(artwork['poster_widths'], [320, 640])
+        self.assertEqual((artwork['thumb_height'], artwork['thumb_count']), (90, 12))
+        cmd = generate_artwork_cmd(self.video, artwork)
+        self.assertEqual(cmd.count('-i'), 1)
+        self.assertEqual(cmd[cmd.index('-skip_frame') + 1], 'nokey')
+        outputs = [arg for arg in cmd if arg.startswith(self.video.artwork_abs_dir)]
+        self.assertEqual([os.path.basename(output) for output in outputs], [
+            'poster.jpg', 'poster_320w.webp', 'poster_640w.webp', 'sprite_%03d.jpg'
+        ])
+
+    def test_thumbnail_track_sprite_positions(self):
+        """
+        Tests the WebVTT thumbnail track for a video filling more than one sprite sheet.
+
+        Asserts:
+            - One cue per thumbnail, the last one ending with the video.
+            - Thumbnail positions within the sprite sheets.
+        """
+        artwork = plan_artwork({ "width": 1920, "height": 1080 }, 265)
+        track = generate_thumbnail_track(artwork).splitlines()
+        cues = [line for line in track if '-->' in line]
+        self.assertEqual(len(cues), 27)
+        self.assertEqual(cues[-1], '00:04:20.000 --> 00:04:25.000')
+        self.assertIn('sprite_001.jpg#xywh=160,90,160,90', track)
+        self.assertEqual(track[-1], 'sprite_002.jpg#xywh=160,0,160,90')
+
+    def test_apply_crf_values_by_complexity(self):
+        """
+        Tests picking CRF values from the bitrate of a sample encode at the highest resolution.
+
+        Asserts:
+            - Reference CRF for simple content below the target bitrates.
+            - Raised CRF, limited by the preset, for complex content.
+            - CRF instead of target bitrate in the encoding arguments.
+        """
+        preset = ENCODING_PRESETS['per_title']
+        simple = apply_crf_values(self.resolutions, self.resolutions[-1], 2000, preset)
+        self.assertEqual([res['crf'] for res in simple], [23] * len(self.resolutions))
+        self.assertEqual(simple[-1]['average_bitrate'], 2000)
+        complex_ladder = apply_crf_values(self.resolutions, self.resolutions[-1], 7500, preset)
+        self.assertEqual(complex_ladder[-1]['crf'], 27)
+        complex_ladder = apply_crf_values(self.resolutions, self.resolutions[-1], 20000, preset)
+        self.assertEqual(complex_ladder[-1]['crf'], 28)
+        args = generate_video_encoding_args(0, simple[-1])
+        self.assertEqual(args[args.index('-crf:v:0') + 1], '23')
+        self.assertNotIn('-b:v:0', args)
+        self.assertIn('-maxrate:v:0', args)
+
+    def test_plan_resolutions_per_title_preset(self):
+        """
+        Tests planning the renditions of a video using a per-title encoding preset.
+
+        Asserts:
+            - A single sample encode at the highest resolution.
+            - x264 preset and CRF values of the video's encoding preset.
+        """
+        for field, value in self.source.items():
+            setattr(self.video, field, value)
+        self.video.duration_in_seconds = 120
+        self.video.video_upload.name = 'videos/mock_video.mp4'
+        self.video.encoding_preset = 'per_title_quality'
+        sample_size = 1000 * 1000 * SAMPLE_DURATION * SAMPLE_COUNT // 8
+        with mock.patch('videos_app.tasks.subprocess.run') as run:
+            run.side_effect = lambda cmd, **kwargs: open(cmd[-1], 'wb').write(b'0' * sample_size)
+            resolutions = plan_resolutions(self.video)
+        cmd = run.call_args.args[0]
+        self.assertEqual(cmd.count('-i'), SAMPLE_COUNT)
+        self.assertIn('scale=w=1920:h=1080', cmd[cmd.index('-filter_complex') + 1])
+        self.assertEqual({res['preset'] for res in resolutions}, {'slow'})
+        self.assertEqual([res['crf'] for res in resolutions], [21] * len(resolutions))
+
+    def test_parallel_conversion_job_graph(self):
+        """
+        Tests the job graph enqueued for parallel conversion.
+
+        Asserts:
+            - One conversion job per resolution.
+            - Finalizing job depending on all conversion jobs.
+            - Automatic retries for all jobs.
+        """
+        with mock.patch('videos_app.tasks.django_rq.get_queue') as get_queue:
+            queue = get_queue.return_value
+            queue.enqueue.side_effect = lambda func, **kwargs: mock.Mock(func=func, kwargs=kwargs)
+            finalize_job = enqueue_parallel_conversion(self.video, self.resolutions)
+        resolution_jobs = [call.args[0] for call in queue.enqueue.call_args_list[:-1]]
+        self.assertEqual(resolution_jobs, [convert_single_resolution] * len(self.resolutions))
+        self.assertEqual(finalize_job.func, finalize_hls_conversion)
+        self.assertEqual(len(finalize_job.kwargs['depends_on']), len(self.resolutions))
+        self.assertTrue(all(call.kwargs['retry'].max == 3 for call in queue.enqueue.call_args_list))
+
+    def fake_ffmpeg(self, cmd, reporter, timeout=None):
+        """
+        Writes a complete single-segment playlist where the FFMPEG command would write the rendition.
+        """
+        playlist_path = cmd[-1]
+        segment_filename = f"{os.path.basename(playlist_path)[:-len('.m3u8')]}_000.ts"
+        with open(os.path.join(os.path.dirname(playlist_path), segment_filename), 'wb') as f:
+            f.write(b'0')
+        with open(playlist_path, 'w') as f:
+            f.write(f"#EXTM3U\n#EXTINF:4.000000,\n{segment_filename}\n#EXT-X-ENDLIST\n")
+
+    def create_source_upload(self):
+        self.video.video_upload.name = 'videos/mock_video.mp4'
+        os.makedirs(os.path.dirname(self.video.video_upload.path), exist_ok=True)
+        with open(self.video.video_upload.path, 'wb') as f:
+            f.write(b'0')
+
+    def test_conversion_retry_skips_completed_renditions(self):
+        """
+        Tests retrying a conversion which failed after its first rendition.
+
+        Asserts:
+            - Failed attempt publishing nothing and keeping the source upload.
+            - Retry only converting the renditions not completed before.
+            - Source upload deleted and staging directory removed after the verified publish.
+        """
+        def fail_second_rendition(cmd, reporter, timeout=None):
+            if run_ffmpeg.call_count == 2:
+                raise subprocess.CalledProcessError(1, cmd)
+            self.fake_ffmpeg(cmd, reporter, timeout)
+
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            self.create_source_upload()
+            prepare_staging_dir(self.video.staging_abs_dir)
+            with mock.patch('videos_app.tasks.run_ffmpeg_with_progress', side_effect=fail_second_rendition) as run_ffmpeg:
+                with self.assertRaises(subprocess.CalledProcessError):
+                    convert_each_resolution(self.video, self.resolutions)
+            self.assertTrue(is_checkpointed(self.video.staging_abs_dir, '360p'))
+            self.assertFalse(os.path.exists(self.video.video_files_abs_dir))
+            self.assertTrue(os.path.isfile(self.video.video_upload.path))
+            self.assertEqual(self.video.processing_state, Video.FAILED)
+            prepare_staging_dir(self.video.staging_abs_dir)
+            with mock.patch('videos_app.tasks.run_ffmpeg_with_progress', side_effect=self.fake_ffmpeg) as run_ffmpeg:
+                convert_each_resolution(self.video, self.resolutions)
+            self.assertEqual(run_ffmpeg.call_count, len(self.resolutions) - 1)
+            publish_staged_output(self.video)
+            self.assertEqual(self.video.processing_state, Video.READY)
+            self.assertTrue(os.path.isfile(os.path.join(temp_dir, self.video.master_playlist_rel_path)))
+            self.assertTrue(os.path.isfile(os.path.join(self.video.video_files_abs_dir, f"{self.video.pk}_360p_000.ts")))
+            self.assertFalse(os.path.exists(self.video.video_upload.path))
+            self.assertFalse(os.path.exists(self.video.staging_abs_dir))
+
+    def test_single_pass_master_playlist(self):
+        """
+        Tests the master playlist of a single-pass conversion.
+
+        Asserts:
+            - One stream per resolution with the planned codecs and average bandwidth.
+            - Published master playlist passing the verification.
+        """
+        def fake_multi_resolution_ffmpeg(cmd, reporter, timeout=None):
+            for res in self.resolutions:
+                playlist_path = os.path.join(output_dir, f"{generate_playlist_basename(self.video, res['height'])}.m3u8")
+                self.fake_ffmpeg([playlist_path], reporter, timeout)
+
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            self.create_source_upload()
+            prepare_staging_dir(self.video.staging_abs_dir)
+            output_dir = get_output_dir(self.video.staging_abs_dir)
+            with mock.patch('videos_app.tasks.run_ffmpeg_with_progress', side_effect=fake_multi_resolution_ffmpeg):
+                convert_all_resolutions(self.video, self.resolutions)
+            with open(os.path.join(output_dir, f"{self.video.pk}_master.m3u8")) as f:
+                stream_infs = [line for line in f.read().splitlines() if line.startswith('#EXT-X-STREAM-INF:')]
+            self.assertEqual(len(stream_infs), len(self.resolutions))
+            for stream_inf, res in zip(stream_infs, self.resolutions):
+                self.assertIn(f'CODECS="{res["codecs"]}"', stream_inf)
+                self.assertIn('AVERAGE-BANDWIDTH=', stream_inf)
+            publish_staged_output(self.video)
+            self.assertEqual(self.video.processing_state, Video.READY)
+
+    def test_failed_state_only_without_retries_left(self):
+        """
+        Tests the processing state of a video after a failed processing job with and without retries left.
+
+        Asserts:
+            - Processing state kept while the job will be retried.
+            - Failed processing state once no retries are left.
+        """
+        @fail_on_error
+        def failing_task(video_obj):
+            raise subprocess.CalledProcessError(1, 'ffmpeg')
+
+        self.video.update_processing_state(Video.TRANSCODING)
+        with mock.patch('videos_app.tasks.get_current_job', return_value=mock.Mock(retries_left=2)):
+            with self.assertRaises(subprocess.CalledProcessError):
+                failing_task(self.video)
+        self.assertEqual(Video.objects.get(pk=self.video.pk).processing_state, Video.TRANSCODING)
+        with mock.patch('videos_app.tasks.get_current_job', return_value=mock.Mock(retries_left=0)):
+            with self.assertRaises(subprocess.CalledProcessError):
+                failing_task(self.video)
+        self.assertEqual(Video.objects.get(pk=self.video.pk).processing_state, Video.FAILED)
+
+    def test_publish_rejects_incomplete_output(self):
+        """
+        Tests publishing staged output with an incomplete variant playlist.
+
+        Asserts:
+            - Verification error.
+            - Video neither published nor its source upload deleted.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            self.create_source_upload()
+            prepare_staging_dir(self.video.staging_abs_dir)
+            with mock.patch('videos_app.tasks.run_ffmpeg_with_progress', side_effect=self.fake_ffmpeg):
+                convert_each_resolution(self.video, self.resolutions)
+            with open(os.path.join(get_output_dir(self.video.staging_abs_dir), f"{self.video.pk}_720p.m3u8"), 'w') as f:
+                f.write(f"#EXTM3U\n#EXTINF:4.000000,\n{self.video.pk}_720p_000.ts\n")
+            with self.assertRaises(ValueError):
+                publish_staged_output(self.video)
+            self.assertFalse(os.path.exists(self.video.video_files_abs_dir))
+            self.assertTrue(os.path.isfile(self.video.video_upload.path))
+        self.assertFalse(Video.objects.get(pk=self.video.pk).is_playable)
+
+    @unittest.skipUnless(os.name == 'posix', 'requires a shell script')
+    def test_run_ffmpeg_timeout(self):
+        """
+        Tests running a FFMPEG process exceeding its timeout.
+
+        Asserts:
+            - Process killed and TimeoutExpired raised well before the process would have finished.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            script_path = os.path.join(temp_dir, 'ffmpeg')
+            with open(script_path, 'w') as f:
+                f.write('#!/bin/sh\nexec sleep 10\n')
+            os.chmod(script_path, 0o755)
+            started_at = time.monotonic()
+            with self.assertRaises(subprocess.TimeoutExpired):
+                run_ffmpeg_with_progress([script_path], ProgressReporter(self.video), timeout=0.5)
+        self.assertLess(time.monotonic() - started_at, 5)
+
+    def test_plan_resolution_ladder_no_upscaling(self):
+        """
+        Tests planning the renditions for a source below full HD.
+
+        Asserts:
+            - Absence of renditions above the source height.
+            - Bitrates capped at the source bitrate.
+            - Widths following the source aspect ratio.
+        """
+        source = { "width": 720, "height": 480, "fps": 30.0, "bitrate": 1200 }
+        ladder = plan_resolution_ladder(source, RESOLUTIONS)
+        self.assertEqual([res['height'] for res in ladder], [360, 480])
+        self.assertEqual([res['bitrate'] for res in ladder], [1000, 1200])
+        self.assertEqual([res['width'] for res in ladder], [540, 720])
+
+    def test_plan_resolution_ladder_small_source(self):
+        """
+        Tests planning the renditions for a source below every candidate resolution.
+
+        Asserts:
+            - Single rendition at the source resolution.
+        """
+        source = { "width": 320, "height": 240, "fps": 25.0, "bitrate": None }
+        ladder = plan_resolution_ladder(source, RESOLUTIONS)
+        self.assertEqual(len(ladder), 1)
+        self.assertEqual((ladder[0]['width'], ladder[0]['height']), (320, 240))
+
+    def test_create_playlists_stream_attributes(self):
+        """
+        Tests the master playlist written for the planned renditions.
+
+        Asserts:
+            - One variant entry per rendition.
+            - Resolution, bandwidth and codecs attributes for each rendition.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            os.makedirs(self.video.video_files_abs_dir)
+            create_playlists(self.video, self.resolutions)
+            with open(os.path.join(self.video.video_files_abs_dir, f"{self.video.pk}_master.m3u8")) as f:
+                stream_infs = [line for line in f.read().splitlines() if line.startswith('#EXT-X-STREAM-INF')]
+        self.assertEqual(len(stream_infs), len(self.resolutions))
+        self.assertIn('RESOLUTION=1920x1080', stream_infs[-1])
+        self.assertIn('AVERAGE-BANDWIDTH=5128000', stream_infs[-1])
+        self.assertIn('CODECS="avc1.4d4028,mp4a.40.2"', stream_infs[-1])
+
+    def test_create_manifests_fmp4(self):
+        """
+        Tests the master playlist and DASH manifest written for fragmented MP4 renditions.
+
+        Asserts:
+            - Protocol version 7 and audio group in the master playlist.
+            - One DASH video representation per rendition and an audio representation.
+            - DASH segment list referring to the initialization segment and segments of the HLS rendition.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir, override_settings(MEDIA_ROOT=temp_dir):
+            os.makedirs(self.video.video_files_abs_dir)
+            for name in [f"{res['height']}p" for res in self.resolutions] + ['audio']:
+                with open(os.path.join(self.video.video_files_abs_dir, f"{self.video.pk}_{name}.m3u8"), 'w') as f:
+                    f.write(
+                        f'#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI="{self.video.pk}_{name}_init.mp4"\n'
+                        f'#EXTINF:4.000000,\n{self.video.pk}_{name}_000.m4s\n#EXTINF:2.500000,\n{self.video.pk}_{name}_001.m4s\n'
+                    )
+            create_manifests(self.video, self.resolutions, FMP4)
+            with open(os.path.join(self.video.video_files_abs_dir, f"{self.video.pk}_master.m3u8")) as f:
+                master_playlist = f.read()
+            mpd = ElementTree.parse(os.path.join(temp_dir, self.video.dash_manifest_rel_path)).getroot()
+        self.assertIn('#EXT-X-VERSION:7', master_playlist)
+        self.assertIn('#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio"', master_playlist)
+        self.assertIn('AUDIO="audio"', master_playlist)
+        namespace = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
+        self.assertEqual(mpd.get('mediaPresentationDuration'), 'PT6.500S')
+        video_set, audio_set = mpd.findall('mpd:Period/mpd:AdaptationSet', namespace)
+        self.assertEqual(len(video_set.findall('mpd:Representation', namespace)), len(self.resolutions))
+        self.assertEqual(len(audio_set.findall('mpd:Representation', namespace)), 1)
+        segment_list = video_set.find('mpd:Representation/mpd:SegmentList', namespace)
+        self.assertEqual(segment_list.find('mpd:Initialization', namespace).get('sourceURL'), f"{self.video.pk}_360p_init.mp4")
+        self.assertEqual([s.get('d') for s in segment_list.findall('mpd:SegmentTimeline/mpd:S', namespace)], ['4000', '2500'])
+        self.assertEqual(segment_list.findall('mpd:SegmentURL', namespace)[1].get('media'), f"{self.video.pk}_360p_001.m4s")
+
+    def test_parse_probe_output(self):
+        """
+        Tests parsing the metadata of a single FFProbe pass.
+
+        Asserts:
+            - Resolution, frame rate, bitrate and codecs taken from the streams.
+            - Audio channels and duration taken from the audio stream and container.
+            - Parsed metadata applicable to the planning of renditions.
+        """
+        output = json.dumps({
+            "streams": [
+                { "codec_type": "video", "codec_name": "h264", "width": 1280, "height": 720, "r_frame_rate": "30000/1001" },
+                { "codec_type": "audio", "codec_name": "aac", "channels": 2 },
+            ],
+            "format": { "duration": "12.500000", "bit_rate": "2500000" },
+        })
+        metadata = parse_probe_output(output)
+        self.assertEqual((metadata['width'], metadata['height']), (1280, 720))
+        self.assertAlmostEqual(metadata['fps'], 29.97, places=2)
+        self.assertEqual(metadata['bitrate'], 2500)
+        self.assertEqual((metadata['video_codec'], metadata['audio_codec']), ('h264', 'aac'))
+        self.assertEqual(metadata['audio_channels'], 2)
+        self.assertEqual(metadata['duration_in_seconds'], 12.5)
+        for field, value in metadata.items():
+            setattr(self.video, field, value)
+        ladder = plan_resolution_ladder(self.video.source_properties, RESOLUTIONS)
+        self.assertEqual([res['height'] for res in ladder], [360, 480, 720])
+
+@override_settings(METRICS_TOKEN='scrapetoken')
+class MetricsTests(APITestCase):
+    """
+    Metrics test class testing the Prometheus endpoint and the recorded request and pipeline metrics.
+    """
+    def setUp(self):
+        """
+        Clears the metrics stored in the cache and creates an authenticated user.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='testemail@email.com', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def get_metrics(self):
+        response = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer scrapetoken')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_request_latency_histogram(self):
+        """
+        Tests the latency histogram recorded for API requests.
+
+        Asserts:
+            - One observation per request, labelled with the view name, method and status.
+            - Cumulative buckets ending with the "+Inf" bucket equal to the count.
+        """
+        self.client.get(reverse('video-list'))
+        self.client.get(reverse('video-list'))
+        lines = self.get_metrics()
+        self.assertIn('# TYPE videoflix_http_request_duration_seconds histogram', lines)
+        self.assertIn('videoflix_http_request_duration_seconds_count{view="video-list",method="GET",status="200"} 2', lines)
+        buckets = [line for line in lines if line.startswith('videoflix_http_request_duration_seconds_bucket{view="video-list"')]
+        counts = [int(line.split(' ')[-1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+        self.assertIn('le="+Inf"', buckets[-1])
+        self.assertEqual(counts[-1], 2)
+
+    def test_pipeline_stage_metrics(self):
+        """
+        Tests the metrics recorded for processing stages and converted renditions.
+
+        Asserts:
+            - Duration observations labelled with stage and outcome.
+            - Failure counter incremented for failed stages only.
+            - Real-time factor and output bytes recorded per rendition.
+        """
+        with measure_stage('probe'):
+            pass
+        with self.assertRaises(ValueError), measure_stage('transcode'):
+            raise ValueError('ffmpeg failed')
+        record_rendition('720p', 60, 20, 1500)
+        record_rendition('720p', 60, 30, 500)
+        lines = self.get_metrics()
+        self.assertIn('videoflix_pipeline_stage_duration_seconds_count{stage="probe",outcome="success"} 1', lines)
+        self.assertIn('videoflix_pipeline_stage_duration_seconds_count{stage="transcode",outcome="failure"} 1', lines)
+        self.assertIn('videoflix_pipeline_stage_failures_total{stage="transcode"} 1', lines)
+        self.assertFalse(any(line.startswith('videoflix_pipeline_stage_failures_total{stage="probe"}') for line in lines))
+        self.assertIn('videoflix_transcode_realtime_factor_count{rendition="720p"} 2', lines)
+        self.assertIn('videoflix_transcode_realtime_factor_sum{rendition="720p"} 5.0', lines)
+        self.assertIn('videoflix_transcode_output_bytes_total{rendition="720p"} 2000', lines)
+
+    def test_metrics_token(self):
+        """
+        Tests scraping the metrics if a token is configured.
+
+        Asserts:
+            - 403 Forbidden without the bearer token.
+            - 200 OK with the bearer token.
+        """
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrapetoken')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_metrics_without_token(self):
+        """
+        Tests scraping the metrics if no token is configured.
+
+        Asserts:
+            - 403 Forbidden outside debug mode.
+            - 200 OK in debug mode.
+        """
+        self.client.credentials()
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_200_OK)
+
+    def test_cache_errors_logged(self):
+        """
+        Tests recording metrics while the cache is unavailable.
+
+        Asserts:
+            - 200 OK status of a request, with the failed recording logged.
+            - Exception of a failed processing stage raised instead of the cache error.
+        """
+        with mock.patch('videoflix.metrics.cache.incr', side_effect=ConnectionError('cache unavailable')):
+            with self.assertLogs('videoflix.metrics', level='WARNING') as logs:
+                self.assertEqual(self.client.get(reverse('video-list')).status_code, status.HTTP_200_OK)
+            self.assertIn('videoflix_http_request_duration_seconds', logs.output[0])
+            with self.assertLogs('videoflix.metrics', level='WARNING'), self.assertRaises(ValueError):
+                with measure_stage('transcode'):
+                    raise ValueError('ffmpeg failed')
+
+    def test_request_metrics_single_round_trip(self):
+        """
+        Tests recording request latencies with Redis as cache backend.
+
+        Asserts:
+            - Count, sum and bucket of each request incremented in a single pipeline.
+            - Series registered once, with the count of both requests stored in Redis.
+        """
+        fake_redis = FakeRedis()
+        redis = mock.Mock(wraps=fake_redis)
+        with mock.patch('videoflix.metrics.get_redis', return_value=redis):
+            self.client.get(reverse('video-list'))
+            self.client.get(reverse('video-list'))
+        self.assertEqual(redis.method_calls, [mock.call.pipeline(transaction=False)] * 2)
+        labels = {'view': 'video-list', 'method': 'GET', 'status': '200'}
+        self.assertEqual(REQUEST_DURATION.get_series(), [labels])
+        self.assertEqual(fake_redis.data[cache.make_key(REQUEST_DURATION.generate_key(labels, 'count'))], 2)
+
+@override_settings(PERFORMANCE_SERVER_TIMING=True)
+class PerformanceMiddlewareTests(APITestCase):
+    """
+    Performance middleware test class testing the Server-Timing header and the slow request log.
+    """
+    def setUp(self):
+        """
+        Creates an authenticated user and a video object without any files.
+        """
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='testemail@email.com', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        Video.objects.create(title='test title', description='testdescription')
+
+    def parse_server_timing(self, response):
+        """
+        Returns the Server-Timing metrics of a response by name, with their duration and description.
+        """
+        metrics = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+
+    def test_server_timing_cache_miss_and_hit(self):
+        """
+        Tests the Server-Timing header of the video list on a cold and a warm cache.
+
+        Asserts:
+            - Database, cache, serialization and total metrics on a cache miss.
+            - Cache hits, no serialization and only the aggregate query of the conditional list validators
+              when the response is served from the cache.
+        """
+        cold = self.parse_server_timing(self.client.get(reverse('video-list')))
+        self.assertIn('serialize', cold)
+        self.assertNotEqual(cold['db']['desc'], '"0 queries"')
+        self.assertNotIn(' 0 misses', cold['cache']['desc'])
+        self.assertGreaterEqual(float(cold['total']['dur']), float(cold['db']['dur']))
+        warm = self.parse_server_timing(self.client.get(reverse('video-list')))
+        self.assertNotIn('serialize', warm)
+        self.assertEqual(warm['db']['desc'], '"1 queries"')
+        self.assertNotIn('"0 hits', warm['cache']['desc'])
+
+    async def test_server_timing_async_queries(self):
+        """
+        Tests the Server-Timing header of the async video list on a cold cache.
+
+        Asserts:
+            - Queries run in the thread of the async view counted.
+        """
+        response = await self.async_client.get(reverse('video-list-async'), headers={'Authorization': 'Token ' + self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        server_timing = self.parse_server_timing(response)
+        self.assertIn('serialize', server_timing)
+        self.assertNotEqual(server_timing['db']['desc'], '"0 queries"')
+
+    def test_server_timing_disabled_by_default(self):
+        """
+        Tests the Server-Timing header without the setting outside debug mode.
+
+        Asserts:
+            - No Server-Timing header sent.
+        """
+        with self.settings(DEBUG=False):
+            del settings.PERFORMANCE_SERVER_TIMING
+            response = self.client.get(reverse('video-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(PERFORMANCE_SLOW_REQUEST_THRESHOLD=0, PERFORMANCE_SLOW_REQUEST_SAMPLE_RATE=1)
+    def test_slow_request_logged(self):
+        """
+        Tests logging a request exceeding the slow request threshold.
+
+        Asserts:
+            - Warning naming the view and its query count.
+        """
+        with self.assertLogs('videoflix.performance', level='WARNING') as logs:
+            self.client.get(reverse('video-list'))
+        self.assertIn('view=video-list', logs.output[0])
+        self.assertIn('db_queries=', logs.output[0])
+
+    @override_settings(PERFORMANCE_SLOW_REQUEST_THRESHOLD=0, PERFORMANCE_SLOW_REQUEST_SAMPLE_RATE=0)
+    def test_slow_request_not_sampled(self):
+        """
+        Tests a slow request excluded by the sample rate.
+
+        Asserts:
+            - No warning logged.
+        """
+        with self.assertNoLogs('videoflix.performance', level='WARNING'):
+            self.client.get(reverse('video-list'))
+
+class BenchmarkCommandTests(TestCase):
+    """
+    Benchmark command test class testing a small benchmark run.
+    """
+    def test_benchmark_results(self):
+        """
+        Tests running the benchmarks with few videos, users and iterations.
+
+        Asserts:
+            - JSON results covering the API hot paths with successful responses and query counts.
+            - Fewer queries for the warm than for the cold video list cache.
+            - Seeded videos and users rolled back.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = os.path.join(temp_dir, 'benchmark.json')
+            call_command('benchmark', videos=5, users=2, iterations=2, login_iterations=1, output=output_path, stdout=mock.Mock())
+            with open(output_path) as f:
+                results = json.load(f)
+        api = results['api']
+        for name in ['video_list_cold_cache', 'video_list_warm_cache', 'video_detail', 'completion_list', 'completion_sync']:
+            self.assertEqual(api[name]['status'], status.HTTP_200_OK)
+            self.assertEqual(api[name]['count'], 2)
+        self.assertEqual(api['login']['status'], status.HTTP_200_OK)
+        self.assertGreater(api['completion_upsert']['per_second'], 0)
+        self.assertLess(api['video_list_warm_cache']['queries'], api['video_list_cold_cache']['queries'])
+        self.assertFalse(Video.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    @override_settings(PROGRESS_WRITE_BEHIND=True)
+    def test_benchmark_write_behind_enabled(self):
+        """
+        Tests running the benchmarks with write-behind buffering enabled, as outside of tests.
+
+        Asserts:
+            - Progress upserts and lists with progress written to and read from the database without Redis.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = os.path.join(temp_dir, 'benchmark.json')
+            call_command('benchmark', videos=2, users=1, iterations=1, login_iterations=1, output=output_path, stdout=mock.Mock())
+            with open(output_path) as f:
+                api = json.load(f)['api']
+        self.assertEqual(api['completion_upsert']['status'], status.HTTP_201_CREATED)
+        self.assertEqual(api['video_list_with_progress']['status'], status.HTTP_200_OK)
+
+# Savepoints depend on whether a request runs within a transaction (as in tests), so they are not counted.
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+def get_query_budget(view_class, action):
+    """
+    Returns the maximum number of database queries a view may run for an action,
+    as declared in its "query_budgets" attribute. Viewsets declare budgets per action
+    (e.g. "list" or "retrieve"), API views per handler method (e.g. "post").
+    """
+    budgets = getattr(view_class, 'query_budgets', {})
+    if action not in budgets:
+        raise ImproperlyConfigured(f"{view_class.__name__} declares no query budget for '{action}'.")
+    return budgets[action]
+
+class QueryBudgetTestMixin:
+    """
+    Test case mixin asserting the query budgets declared by the views and that the number
+    of queries of a request does not grow with the number of rows (N+1 queries).
+    Queries are counted with cleared caches, i.e. for the worst case of a request.
+    """
+    def count_queries(self, send, prepare=None):
+        """
+        Sends a request with cleared caches and returns the response and the number of its database queries.
+        The prepare function runs before without being counted, e.g. to create a single-use token.
+        """
+        if prepare:
+            prepare()
+        cache.clear()
+        local_token_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        statements = [query['sql'] for query in queries.captured_queries]
+        return response, sum(1 for sql in statements if not sql.startswith(TRANSACTION_STATEMENTS))
+
+    def assertWithinQueryBudget(self, view_class, action, send, status_code, prepare=None):
+        """
+        Asserts the status code of a request and that it runs no more queries than the budget of the view action.
+        """
+        response, query_count = self.count_queries(send, prepare)
+        self.assertEqual(response.status_code, status_code)
+        budget = get_query_budget(view_class, action)
+        self.assertLessEqual(
+            query_count, budget, f"{view_class.__name__} '{action}' ran {query_count} queries, its budget is {budget}."
+        )
+        return response
+
+    def assertConstantQueries(self, send, add_rows, prepare=None):
+        """
+        Asserts that a request runs the same number of queries after further rows have been added.
+        """
+        _, query_count = self.count_queries(send, prepare)
+        add_rows()
+        _, grown_query_count = self.count_queries(send, prepare)
+        self.assertEqual(
+            query_count, grown_query_count, f"The query count grew from {query_count} to {grown_query_count} with the row count."
+        )
+
+class QueryBudgetTests(QueryBudgetTestMixin, APITestCase):
+    """
+    Query budget test class testing the number of queries of the video and video completion endpoints.
+    """
+    PAGE_SIZES = [None, 1, 10, 100]
+
+    def setUp(self):
+        """
+        Creates an authenticated user, videos without any files and video completions of some of them.
+        """
+        self.user = User.objects.create_user(username='testuser', email='testemail@email.com', password='testpassword')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.add_videos(5)
+
+    def add_videos(self, count):
+        """
+        Creates videos and video completions of the current user for each of them.
+        """
+        videos = Video.objects.bulk_create([
+            Video(title=f"test title {index}", description='testdescription', processing_state=Video.READY)
+            for index in range(count)
+        ])
+        VideoCompletion.objects.bulk_create([
+            VideoCompletion(user=self.user, video=video, current_time=1.5) for video in videos
+        ])
+
+    def get_video_list(self, page_size=None, **params):
+        if page_size:
+            params['page_size'] = page_size
+        return self.client.get(reverse('video-list'), params)
+
+    def test_video_list_budget(self):
+        """
+        Tests the queries of the video list for each page size, with and without playback progress.
+
+        Asserts:
+            - No more queries than budgeted, regardless of the page size.
+            - Same number of queries after adding videos.
+        """
+        for page_size in self.PAGE_SIZES:
+            for params in [{}, {'include': 'progress'}]:
+                with self.subTest(page_size=page_size, **params):
+                    send = lambda: self.get_video_list(page_size, **params)
+                    self.assertWithinQueryBudget(VideoViewSet, 'list', send, status.HTTP_200_OK)
+                    self.assertConstantQueries(send, lambda: self.add_videos(5))
+
+    def test_video_detail_budget(self):
+        """
+        Tests the queries of the video detail view, with and without playback progress.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding videos.
+        """
+        video = Video.objects.first()
+        for params in [{}, {'include': 'progress'}]:
+            with self.subTest(**params):
+                send = lambda: self.client.get(reverse('video-detail', kwargs={'pk': video.pk}), params)
+                self.assertWithinQueryBudget(VideoViewSet, 'retrieve', send, status.HTTP_200_OK)
+                self.assertConstantQueries(send, lambda: self.add_videos(5))
+
+    def test_completion_list_budget(self):
+        """
+        Tests the queries of the video completion list, including the list of a staff member featuring all users.
+
+        Asserts:
+            - No more queries than budgeted.
+            - Same number of queries after adding video completions.
+        """
+        send = lambda: self.client.get(reverse('video-completion-list'))
+        self.assertWithinQueryBudget(VideoCompletionViewSet, 'list', send, status.HTTP_200_OK)
+        self.assertConstantQueries(send, lambda: self.add_videos(5))
+        self.user.is_staff = True
+        self.user.save()
+        self.assertWithinQueryBudget(VideoCompletionViewSet, 'list', send, status.HTTP_200_OK)
+        self.assertConstantQueries(send, lambda: self.add_videos(5))
+
+    def test_completion_create_budget(self):
+        """
+        Tests the queries of creating and updating a video completion.
+
+        Asserts:
+            - No more queries than budgeted for both creation and update.
+            - Same number of queries after adding video completions.
+        """
+        video = Video.objects.create(title='new title', description='testdescription')
+        send = lambda: self.client.post(reverse('video-completion-list'), {'video_id': video.pk, 'current_time': 3.5}, format='json')
+        self.assertWithinQueryBudget(VideoCompletionViewSet, 'create', send, status.HTTP_201_CREATED)
+        self.assertWithinQueryBudget(VideoCompletionViewSet, 'create', send, status.HTTP_200_OK)
+        self.assertConstantQueries(send, lambda: self.add_videos(5))
+
+    def test_completion_admin_list_constant(self):
+        """
+        Tests the queries of the video completion list in the admin, which displays the user and video of each row.
+
+        Asserts:
+            - Same number of queries after adding video completions.
+        """
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        send = lambda: self.client.get(reverse('admin:videos_app_videocompletion_changelist'))
+        self.assertEqual(send().status_code, status.HTTP_200_OK)
+        self.assertConstantQueries(send, lambda: self.add_videos(5))
+
+    def test_budgets_declared(self):
+        """
+        Tests looking up an action without a declared budget.
+
+        Asserts:
+            - ImproperlyConfigured raised.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            get_query_budget(VideoViewSet, 'destroy')
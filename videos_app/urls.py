@@ -1,11 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import VideoViewSet, VideoCompletionViewSet
+from .views import VideoViewSet, VideoUploadViewSet, VideoCompletionViewSet
+from .async_views import video_list, video_completion_create
 
 router = DefaultRouter()
 router.register(r'main', VideoViewSet, basename='video')
+router.register(r'uploads', VideoUploadViewSet, basename='video-upload')
 router.register(r'completion', VideoCompletionViewSet, basename='video-completion')
 
 urlpatterns = [
+    path('async/main/', video_list, name='video-list-async'),
+    path('async/completion/', video_completion_create, name='video-completion-async'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
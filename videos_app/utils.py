@@ -1,25 +1,155 @@
 import os
+import json
+import math
 import subprocess
+
+MPEGTS = 'mpegts'
+FMP4 = 'fmp4'
+SEGMENT_EXTENSIONS = {MPEGTS: '.ts', FMP4: '.m4s'}
+AUDIO_RENDITION_NAME = 'audio'
+AUDIO_BITRATE = 128
+AUDIO_SAMPLE_RATE = 48000
+BITRATE = 'bitrate'
+CAPPED_CRF = 'capped_crf'
+# Encoding presets, selectable globally by the "HLS_ENCODING_PRESET" setting or per video.
+# "capped_crf" encodes at a constant quality picked by a sample encode, limited by the rendition's maxrate.
+ENCODING_PRESETS = {
+    'standard': { "label": "Standard (fixed bitrate)", "rate_control": BITRATE, "x264_preset": "fast" },
+    'per_title': { "label": "Per-title (capped CRF)", "rate_control": CAPPED_CRF, "x264_preset": "medium", "crf": 23, "max_crf": 28 },
+    'per_title_quality': { "label": "Per-title, high quality (capped CRF)", "rate_control": CAPPED_CRF, "x264_preset": "slow", "crf": 21, "max_crf": 26 },
+}
+SAMPLE_COUNT = 3
+SAMPLE_DURATION = 4
+POSTER_WIDTHS = [320, 640, 1280]
+POSTER_MAX_TIME = 30
+SPRITE_INTERVAL = 10
+SPRITE_THUMB_WIDTH = 160
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+AUDIO_CODEC = 'mp4a.40.2'
+H264_PROFILE = 'main'
+H264_PROFILE_CODEC_PREFIX = 'avc1.4d40'
+H264_LEVELS = [
+    { "level": 30, "max_frame_size": 1620, "max_macroblock_rate": 40500 },
+    { "level": 31, "max_frame_size": 3600, "max_macroblock_rate": 108000 },
+    { "level": 32, "max_frame_size": 5120, "max_macroblock_rate": 216000 },
+    { "level": 40, "max_frame_size": 8192, "max_macroblock_rate": 245760 },
+    { "level": 42, "max_frame_size": 8704, "max_macroblock_rate": 522240 },
+    { "level": 50, "max_frame_size": 22080, "max_macroblock_rate": 589824 },
+    { "level": 51, "max_frame_size": 36864, "max_macroblock_rate": 983040 },
+]
     
-def generate_calc_duration_cmd(video_obj):
+def generate_probe_cmd(video_obj):
     """
-    Returns a command to calculate a video's duration using FFProbe.
+    Returns a command to read all stream and container metadata of a video upload using FFProbe.
     """
     return [
-        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of",
-        "default=noprint_wrappers=1:nokey=1", video_obj.video_upload.path
+        "ffprobe", "-v", "error", "-show_streams", "-show_format",
+        "-of", "json", video_obj.video_upload.path
     ]
-    
-def calc_duration(video_obj):
+
+def parse_frame_rate(value):
+    """
+    Converts a FFProbe frame rate fraction like "30000/1001" into a float.
+    """
+    numerator, _, denominator = str(value).partition('/')
+    if not denominator:
+        return float(numerator)
+    return float(numerator) / float(denominator) if float(denominator) else 0.0
+
+def parse_probe_output(output):
+    """
+    Extracts the video metadata from the JSON output of a FFProbe pass.
+    The keys match the metadata fields of the video model. The bitrate is given in kbit/s
+    and falls back to the container bitrate if the video stream does not report one.
     """
-    Calculates a video's duration by running FFProbe and returning the program's output.
+    probe = json.loads(output)
+    streams = probe.get('streams', [])
+    container = probe.get('format', {})
+    video_stream = next((stream for stream in streams if stream.get('codec_type') == 'video'), None)
+    audio_stream = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+    if video_stream is None:
+        raise ValueError("The file does not contain a video stream.")
+    bitrate = video_stream.get('bit_rate') or container.get('bit_rate')
+    duration = container.get('duration') or video_stream.get('duration')
+    return {
+        "width": int(video_stream['width']),
+        "height": int(video_stream['height']),
+        "fps": parse_frame_rate(video_stream.get('r_frame_rate', '0')),
+        "bitrate": int(bitrate) // 1000 if bitrate else None,
+        "video_codec": video_stream.get('codec_name', ''),
+        "audio_codec": audio_stream.get('codec_name', '') if audio_stream else '',
+        "audio_channels": int(audio_stream.get('channels', 0)) if audio_stream else 0,
+        "duration_in_seconds": float(duration) if duration else None,
+    }
+
+def probe_video(video_obj, timeout=None):
     """
-    return subprocess.run(
-        generate_calc_duration_cmd(video_obj),
+    Reads a video upload's metadata in a single FFProbe pass, which is killed after the timeout (in seconds).
+    """
+    result = subprocess.run(
+        generate_probe_cmd(video_obj),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True
+        text=True,
+        timeout=timeout
     )
+    if result.returncode != 0:
+        raise ValueError(f"ffprobe error: {result.stderr}")
+    return parse_probe_output(result.stdout)
+
+def calc_h264_level(width, height, fps):
+    """
+    Returns the lowest H.264 level (as level_idc, e.g. 31 for level 3.1)
+    supporting the given frame size and frame rate.
+    """
+    frame_size = ((width + 15) // 16) * ((height + 15) // 16)
+    macroblock_rate = frame_size * (fps or 30)
+    for level in H264_LEVELS:
+        if frame_size <= level['max_frame_size'] and macroblock_rate <= level['max_macroblock_rate']:
+            return level['level']
+    return H264_LEVELS[-1]['level']
+
+def even(value):
+    """
+    Rounds a dimension to the nearest even number, as required by the H.264 encoder.
+    """
+    return max(2, int(round(value / 2)) * 2)
+
+def plan_resolution_ladder(source, candidates):
+    """
+    Selects the renditions suitable for a source video out of the candidate resolutions.
+    Candidates above the source height are skipped to avoid upscaling; if the source
+    is smaller than every candidate, a single rendition at the source height is planned.
+    Widths follow the source aspect ratio and bitrates are capped at the source bitrate.
+    Audio is only declared if the source has an audio stream.
+    """
+    candidates = sorted(candidates, key=lambda res: res['height'])
+    selected = [res for res in candidates if res['height'] <= source['height']]
+    if not selected:
+        selected = [{**candidates[0], "height": source['height']}]
+    aspect_ratio = source['width'] / source['height']
+    has_audio = source.get('audio', True)
+    codecs_suffix = f",{AUDIO_CODEC}" if has_audio else ""
+    ladder = []
+    for res in selected:
+        height = even(res['height'])
+        width = even(height * aspect_ratio)
+        bitrate = res['bitrate']
+        if source.get('bitrate'):
+            bitrate = min(bitrate, source['bitrate'])
+        level = calc_h264_level(width, height, source.get('fps'))
+        ladder.append({
+            "width": width,
+            "height": height,
+            "fps": source.get('fps'),
+            "bitrate": bitrate,
+            "maxrate": int(bitrate * 1.1),
+            "level": level,
+            "audio": has_audio,
+            "codecs": f"{H264_PROFILE_CODEC_PREFIX}{level:02x}{codecs_suffix}",
+        })
+    return ladder
 
 def generate_playlist_basename(video_obj, height):
     """
@@ -27,21 +157,222 @@ def generate_playlist_basename(video_obj, height):
     """
     return f"{video_obj.pk}_{height}p"
 
-def generate_single_resolution_cmd(video_obj, index, resolution):
+def generate_audio_encoding_args():
+    """
+    Returns the audio encoding arguments shared by all renditions.
+    """
+    return ["-c:a", "aac", "-ar", str(AUDIO_SAMPLE_RATE), "-b:a", f"{AUDIO_BITRATE}k"]
+
+def generate_video_encoding_args(index, resolution):
+    """
+    Returns the video encoding arguments for the output video stream with the given index.
+    Renditions with a CRF value are encoded at constant quality, capped at their maxrate,
+    otherwise at their target bitrate.
+    Profile and level are set explicitly to match the codecs declared in the master playlist.
+    """
+    if resolution.get('crf') is not None:
+        rate_args = [f"-crf:v:{index}", str(resolution['crf'])]
+    else:
+        rate_args = [f"-b:v:{index}", f"{resolution['bitrate']}k"]
+    return [
+        f"-c:v:{index}", "libx264", *rate_args, f"-preset:v:{index}", resolution.get('preset', 'fast'),
+        f"-maxrate:v:{index}", f"{resolution['maxrate']}k", f"-bufsize:v:{index}", f"{resolution['maxrate'] * 2}k",
+        f"-profile:v:{index}", H264_PROFILE, f"-level:v:{index}", f"{resolution['level'] / 10:.1f}",
+        "-keyint_min", "48", "-g", "48", "-sc_threshold", "0",
+    ]
+
+def generate_hls_args(segment_format=MPEGTS, init_filename=None):
+    """
+    Returns the HLS muxer arguments shared by all renditions.
+    Fragmented MP4 (CMAF) segments need the name of the initialization segment,
+    which is written next to the playlist.
+    """
+    args = ["-hls_time", "4", "-hls_playlist_type", "vod"]
+    if segment_format == FMP4:
+        args.extend(["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", init_filename])
+    return args
+
+def generate_rendition_files_args(base_name, segment_format):
+    """
+    Returns the HLS muxer arguments naming the segments and the playlist of a rendition
+    (or of all renditions, if the base name contains the "%v" placeholder).
+    """
+    init_filename = f"{os.path.basename(base_name)}_init.mp4"
+    return [
+        *generate_hls_args(segment_format, init_filename),
+        "-hls_segment_filename", f"{base_name}_%03d{SEGMENT_EXTENSIONS[segment_format]}", f"{base_name}.m3u8",
+    ]
+
+def generate_single_resolution_cmd(video_obj, index, resolution, segment_format=MPEGTS, output_dir=None):
     """
     Returns a command to convert a video upload to a single selected resolution and bitrate.
+    The index designates the video stream within the output file.
+    Fragmented MP4 renditions contain no audio, which is converted separately by "generate_audio_rendition_cmd".
+    The files are written to the video files directory unless another output directory is given.
     """
-    base_name = f"{video_obj.video_files_abs_dir}/{generate_playlist_basename(video_obj, resolution['height'])}"
-    segment_filename = base_name + '_%03d.ts'
-    playlist_filename = base_name + '.m3u8'
+    base_name = f"{output_dir or video_obj.video_files_abs_dir}/{generate_playlist_basename(video_obj, resolution['height'])}"
+    audio_args = ["-an"] if segment_format == FMP4 else generate_audio_encoding_args()
     return [
         f"-filter:v:{index}", f"scale=w={resolution['width']}:h={resolution['height']}",
-        "-c:a", "aac", "-ar", "48000", "-b:a", "128",
-        f"-c:v:{index}", "libx264", f"-b:v:{index}", f"{resolution['bitrate']}k", "-preset", "fast",
-        "-keyint_min", "48", "-g", "48", "-sc_threshold", "0",
-        "-hls_time", "4", "-hls_playlist_type", "vod",
-        "-hls_segment_filename", segment_filename, playlist_filename,
+        *audio_args,
+        *generate_video_encoding_args(index, resolution),
+        *generate_rendition_files_args(base_name, segment_format),
+    ]
+
+def generate_audio_rendition_cmd(video_obj, output_dir=None):
+    """
+    Returns a command to convert the audio of a video upload to a separate fragmented MP4 rendition,
+    shared by all video renditions.
+    """
+    base_name = f"{output_dir or video_obj.video_files_abs_dir}/{video_obj.pk}_{AUDIO_RENDITION_NAME}"
+    return [
+        "-map", "0:a:0", "-vn",
+        *generate_audio_encoding_args(),
+        *generate_rendition_files_args(base_name, FMP4),
+    ]
+
+def generate_multi_resolution_cmd(video_obj, resolutions, segment_format=MPEGTS, output_dir=None):
+    """
+    Returns a command to convert a video upload to all selected resolutions and bitrates at once.
+    The source is decoded a single time and split into one scaled stream per resolution.
+    The HLS muxer writes all variant playlists, the master playlist is created from the planned renditions afterwards.
+    Fragmented MP4 renditions share a single separate audio rendition instead of containing the audio.
+    """
+    split_outputs = "".join(f"[v{i}]" for i in range(len(resolutions)))
+    filters = [f"[0:v]split={len(resolutions)}{split_outputs}"]
+    has_audio = any(res.get('audio', True) for res in resolutions)
+    stream_maps, stream_args = [], []
+    for i, res in enumerate(resolutions):
+        filters.append(f"[v{i}]scale=w={res['width']}:h={res['height']}[v{i}out]")
+        stream_args.extend(["-map", f"[v{i}out]"])
+        if segment_format == FMP4 and has_audio:
+            stream_maps.append(f"v:{i},agroup:{AUDIO_RENDITION_NAME},name:{res['height']}p")
+        elif res.get('audio', True):
+            stream_maps.append(f"v:{i},a:{i},name:{res['height']}p")
+            stream_args.extend(["-map", "0:a:0"])
+        else:
+            stream_maps.append(f"v:{i},name:{res['height']}p")
+        stream_args.extend(generate_video_encoding_args(i, res))
+    if segment_format == FMP4 and has_audio:
+        stream_maps.append(f"a:0,agroup:{AUDIO_RENDITION_NAME},name:{AUDIO_RENDITION_NAME}")
+        stream_args.extend(["-map", "0:a:0"])
+    return [
+        "-filter_complex", ";".join(filters),
+        *stream_args,
+        *generate_audio_encoding_args(),
+        "-f", "hls",
+        "-var_stream_map", " ".join(stream_maps),
+        *generate_rendition_files_args(f"{output_dir or video_obj.video_files_abs_dir}/{video_obj.pk}_%v", segment_format),
+    ]
+
+def plan_sample_times(duration):
+    """
+    Returns the start times of the samples encoded to analyse the complexity of a video,
+    spread over its duration. Short videos are sampled from the start only.
+    """
+    if not duration or duration < SAMPLE_COUNT * SAMPLE_DURATION * 2:
+        return [0]
+    return [round(duration * (index + 1) / (SAMPLE_COUNT + 1), 3) for index in range(SAMPLE_COUNT)]
+
+def generate_sample_encode_cmd(video_obj, resolution, preset, sample_times, output_path):
+    """
+    Returns a command encoding short samples of the video upload at the given resolution
+    and the preset's reference CRF in a single FFMPEG process, without any rate limit.
+    """
+    cmd = ["ffmpeg", "-y"]
+    for start in sample_times:
+        cmd.extend(["-ss", str(start), "-t", str(SAMPLE_DURATION), "-i", video_obj.video_upload.path])
+    inputs = "".join(f"[{index}:v]" for index in range(len(sample_times)))
+    filter_graph = f"{inputs}concat=n={len(sample_times)}:v=1:a=0,scale=w={resolution['width']}:h={resolution['height']}[out]"
+    return [
+        *cmd, "-filter_complex", filter_graph, "-map", "[out]",
+        "-c:v", "libx264", "-preset", preset['x264_preset'], "-crf", str(preset['crf']),
+        "-an", "-f", "matroska", output_path,
+    ]
+
+def apply_crf_values(resolutions, reference, sample_bitrate, preset):
+    """
+    Picks the CRF value of each rendition from the bitrate of the sample encode at the reference resolution.
+    The bitrate at the reference CRF is estimated for each rendition by its pixel count.
+    Renditions below their target bitrate keep the reference CRF, i.e. simple content gets smaller segments.
+    Above it, the CRF is raised (6 steps halving the bitrate) up to the preset's maximum,
+    so complex content stays close to its target instead of being constrained by the maxrate all the time.
+    The estimated bitrate is kept as average bitrate for the playlists.
+    """
+    reference_pixels = reference['width'] * reference['height']
+    planned = []
+    for res in resolutions:
+        estimate = sample_bitrate * (res['width'] * res['height'] / reference_pixels) ** 0.75
+        crf = preset['crf']
+        if estimate > res['bitrate']:
+            crf = min(round(preset['crf'] + 6 * math.log2(estimate / res['bitrate'])), preset['max_crf'])
+        planned.append({**res, "crf": crf, "average_bitrate": min(int(estimate), res['bitrate'])})
+    return planned
+
+def plan_artwork(source, duration):
+    """
+    Returns the poster time, the widths of the poster variants (without upscaling)
+    and the layout of the sprite sheets for a source of the given dimensions and duration.
+    """
+    duration = duration or 0
+    thumb_height = even(SPRITE_THUMB_WIDTH * source['height'] / source['width'])
+    return {
+        "poster_time": round(min(duration * 0.1, POSTER_MAX_TIME), 3),
+        "poster_widths": [width for width in POSTER_WIDTHS if width <= source['width']] or [even(source['width'])],
+        "thumb_width": SPRITE_THUMB_WIDTH,
+        "thumb_height": thumb_height,
+        "thumb_count": max(1, math.ceil(duration / SPRITE_INTERVAL)),
+        "duration": duration,
+    }
+
+def generate_artwork_cmd(video_obj, artwork):
+    """
+    Returns a command extracting the poster (as JPEG and resized WebP variants) and the sprite sheets
+    from the video upload in a single FFMPEG pass. Only key frames are decoded, which is sufficient
+    for still images and much faster than decoding the whole video.
+    """
+    widths = artwork['poster_widths']
+    poster_outputs = "".join(f"[p{width}]" for width in widths)
+    filters = [
+        "[0:v]split=2[poster][sprites]",
+        f"[poster]trim=start={artwork['poster_time']},setpts=PTS-STARTPTS,split={len(widths) + 1}[pfull]{poster_outputs}",
+        *(f"[p{width}]scale=w={width}:h=-2[poster{width}]" for width in widths),
+        f"[sprites]fps=1/{SPRITE_INTERVAL},scale=w={artwork['thumb_width']}:h={artwork['thumb_height']},"
+        f"tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sheets]",
     ]
+    output_dir = video_obj.artwork_abs_dir
+    cmd = ["ffmpeg", "-y", "-skip_frame", "nokey", "-i", video_obj.video_upload.path, "-filter_complex", ";".join(filters)]
+    cmd.extend(["-map", "[pfull]", "-frames:v", "1", "-q:v", "2", f"{output_dir}/poster.jpg"])
+    for width in widths:
+        cmd.extend(["-map", f"[poster{width}]", "-frames:v", "1", "-c:v", "libwebp", "-quality", "80", f"{output_dir}/poster_{width}w.webp"])
+    cmd.extend(["-map", "[sheets]", "-q:v", "4", f"{output_dir}/sprite_%03d.jpg"])
+    return cmd
+
+def format_vtt_time(seconds):
+    """
+    Formats seconds as a WebVTT timestamp (HH:MM:SS.mmm).
+    """
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+def generate_thumbnail_track(artwork):
+    """
+    Returns a WebVTT track assigning each interval of the video to its thumbnail within the sprite sheets,
+    using media fragments ("#xywh=") as supported by most web players.
+    """
+    lines = ["WEBVTT", ""]
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    width, height = artwork['thumb_width'], artwork['thumb_height']
+    for index in range(artwork['thumb_count']):
+        start = index * SPRITE_INTERVAL
+        end = min(start + SPRITE_INTERVAL, artwork['duration']) if artwork['duration'] else start + SPRITE_INTERVAL
+        position = index % per_sheet
+        x, y = (position % SPRITE_COLUMNS) * width, (position // SPRITE_COLUMNS) * height
+        lines.append(f"{format_vtt_time(start)} --> {format_vtt_time(end)}")
+        lines.append(f"sprite_{index // per_sheet + 1:03d}.jpg#xywh={x},{y},{width},{height}")
+        lines.append("")
+    return "\n".join(lines)
 
 def delete_source_video(video_obj):
     """
@@ -49,4 +380,30 @@ def delete_source_video(video_obj):
     """
     if video_obj.video_upload:
         if os.path.isfile(video_obj.video_upload.path):
-            os.remove(video_obj.video_upload.path)
\ No newline at end of file
+            os.remove(video_obj.video_upload.path)
+
+def write_upload_chunk(upload_obj, stream, start, length, read_size=1024 * 1024):
+    """
+    Writes a chunk of a resumable upload to its partial file, starting at the given byte position.
+    The request stream is copied in small blocks, so no chunk is ever held in memory as a whole.
+    Returns the number of bytes written, which may be lower than the announced length
+    if the client disconnected before sending the full chunk.
+    """
+    os.makedirs(os.path.dirname(upload_obj.partial_file_path), exist_ok=True)
+    written = 0
+    with open(upload_obj.partial_file_path, 'ab') as f:
+        f.truncate(start)
+        while written < length:
+            block = stream.read(min(read_size, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+    return written
+
+def delete_partial_upload(upload_obj):
+    """
+    Deletes the partial file associated with a resumable upload.
+    """
+    if os.path.isfile(upload_obj.partial_file_path):
+        os.remove(upload_obj.partial_file_path)
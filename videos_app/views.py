@@ -1,47 +1,214 @@
 from django.conf import settings
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django_filters.rest_framework import DjangoFilterBackend
+from django.utils.timezone import now
+from django.utils.cache import patch_cache_control
+from django.db.models import OuterRef, Subquery
 from rest_framework.response import Response
 from rest_framework import status, filters
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from .models import Video, VideoCompletion
-from .serializers import VideoSerializer, VideoCompletionSerializer
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, GenericViewSet
+from .models import Video, VideoUpload, VideoCompletion
+from .serializers import VideoSerializer, VideoUploadSerializer, VideoCompletionSerializer, VideoCompletionSyncSerializer
+from .serializers import get_requested_fields, includes_progress
+from .pagination import VideoCursorPagination
 from .permissions import IsOwnerOrStaff
+from .utils import write_upload_chunk
+from .progress import get_processing_progress
+from .cache import catalogue_cache_page
+from .conditional import ConditionalListMixin
+from .signing import is_signing_enabled, get_signing_interval_start
+from users_app.authentication import CachedTokenAuthentication
+from .buffer import is_write_behind_enabled, buffer_progress, get_buffered_progress, discard_buffered_progress
+import re
 
 CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+MAX_SYNC_ENTRIES = 500
 
-class VideoViewSet(ReadOnlyModelViewSet):
+def prepare_video_queryset(queryset, request):
+    """
+    Defers loading the description and the artwork paths if they are not among the requested fields
+    and annotates the current user's playback position if progress is included.
+    """
+    requested_fields = get_requested_fields(request)
+    if requested_fields is not None and 'description' not in requested_fields:
+        queryset = queryset.defer('description')
+    if requested_fields is not None and not {'poster_variants', 'thumbnail_track_url'} & requested_fields:
+        queryset = queryset.defer('artwork')
+    if includes_progress(request):
+        completions = VideoCompletion.objects.filter(user=request.user, video=OuterRef('pk'))
+        queryset = queryset.annotate(current_time=Subquery(completions.values('current_time')[:1]))
+    return queryset
+
+class VideoViewSet(ConditionalListMixin, ReadOnlyModelViewSet):
     """
     API endpoint for videos view.
+    The list is paginated if a page size is requested and supports selecting fields.
+    With "?include=progress", the playback progress of the current user is included.
+    Such responses are user-specific and therefore bypass the shared page cache.
+    The list supports conditional requests using ETag and Last-Modified.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     queryset = Video.objects.all()
     serializer_class = VideoSerializer
+    pagination_class = VideoCursorPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['processing_state']
     ordering_fields = ['created_at']
+    query_budgets = {'list': 4, 'retrieve': 2}
+
+    def get_queryset(self):
+        return prepare_video_queryset(super().get_queryset(), self.request)
+
+    def get_validator_querysets(self):
+        """
+        Extends the list validators by the current user's video completions if progress is included.
+        """
+        querysets = super().get_validator_querysets()
+        if includes_progress(self.request):
+            querysets.append((VideoCompletion.objects.filter(user=self.request.user), 'updated_at'))
+        return querysets
+
+    def get_validator_extras(self):
+        """
+        Extends the list validators by the start of the URL signing interval, since the signed playlist URLs
+        change with every interval, and the current user's buffered playback positions if progress is included.
+        """
+        extras = [get_signing_interval_start()] if is_signing_enabled() else []
+        if includes_progress(self.request):
+            extras.extend(entry['updated_at'] for entry in get_buffered_progress(self.request.user.pk).values())
+        return extras
+
+    def get_serializer_context(self):
+        """
+        Provides the current user's buffered playback positions if progress is included.
+        """
+        context = super().get_serializer_context()
+        if includes_progress(self.request):
+            context['buffered_progress'] = get_buffered_progress(self.request.user.pk)
+        return context
 
-    @method_decorator(cache_page(CACHE_TTL))
-    def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+    def get_list_response(self, request, *args, **kwargs):
+        if includes_progress(request):
+            response = super().get_list_response(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            return response
+        return self.cached_list(request, *args, **kwargs)
 
-    @method_decorator(cache_page(CACHE_TTL))
     def retrieve(self, request, *args, **kwargs):
+        if includes_progress(request):
+            response = super().retrieve(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            return response
+        return self.cached_retrieve(request, *args, **kwargs)
+
+    @method_decorator(catalogue_cache_page(CACHE_TTL))
+    def cached_list(self, request, *args, **kwargs):
+        return super().get_list_response(request, *args, **kwargs)
+
+    @method_decorator(catalogue_cache_page(CACHE_TTL))
+    def cached_retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def processing(self, request, *args, **kwargs):
+        """
+        Returns the conversion progress of a video and whether it is playable yet.
+        """
+        video = self.get_object()
+        return Response({
+            'id': video.pk,
+            'processing_state': video.processing_state,
+            'playable': video.is_playable,
+            'progress': get_processing_progress(video.pk),
+        }, status=status.HTTP_200_OK)
     
-class VideoCompletionViewSet(ModelViewSet):
+class VideoUploadViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
     """
-    API endpoint for video completions view.
+    API endpoint for resumable chunked uploads of source videos.
+    An upload is created with its total size, filled by PUT requests carrying byte ranges
+    and finalized to create the video instance.
     """
     authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+    serializer_class = VideoUploadSerializer
+
+    def get_queryset(self):
+        """
+        Filter queryset to return uploads of the current user only.
+        """
+        return VideoUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def get_offset_response(self, upload, status_code=status.HTTP_200_OK):
+        """
+        Returns the serialized upload, announcing the current offset in the "Upload-Offset" header as well.
+        """
+        serializer = self.get_serializer(upload)
+        return Response(serializer.data, status=status_code, headers={'Upload-Offset': str(upload.offset)})
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Returns the upload including the offset to resume from.
+        """
+        return self.get_offset_response(self.get_object())
+
+    def update(self, request, *args, **kwargs):
+        """
+        Writes the request body to the upload. The byte range is given by the "Content-Range" header
+        ("bytes start-end/size") and must start at the current offset of the upload.
+        """
+        upload = self.get_object()
+        if upload.is_finalized:
+            return Response({'error': 'This upload has already been finalized.'}, status=status.HTTP_409_CONFLICT)
+        match = CONTENT_RANGE_PATTERN.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if not match:
+            return Response({'error': 'A valid "Content-Range" header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, size = match.groups()
+        start, end = int(start), int(end)
+        if end < start or end >= upload.size or size not in ('*', str(upload.size)):
+            return Response({'error': 'The byte range does not match the upload size.'}, status=status.HTTP_400_BAD_REQUEST)
+        if start != upload.offset:
+            return self.get_offset_response(upload, status_code=status.HTTP_409_CONFLICT)
+        written = 0
+        if request.stream is not None:
+            written = write_upload_chunk(upload, request.stream, start, end - start + 1)
+        VideoUpload.objects.filter(pk=upload.pk, offset=start).update(offset=start + written, updated_at=now())
+        upload.refresh_from_db()
+        return self.get_offset_response(upload)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, *args, **kwargs):
+        """
+        Creates the video instance from a completely received upload.
+        """
+        upload = self.get_object()
+        if upload.is_finalized:
+            return Response({'error': 'This upload has already been finalized.'}, status=status.HTTP_409_CONFLICT)
+        if not upload.is_complete:
+            return self.get_offset_response(upload, status_code=status.HTTP_409_CONFLICT)
+        upload.create_video()
+        return self.get_offset_response(upload, status_code=status.HTTP_201_CREATED)
+
+class VideoCompletionViewSet(ConditionalListMixin, ModelViewSet):
+    """
+    API endpoint for video completions view.
+    The list supports conditional requests using ETag and Last-Modified.
+    """
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsOwnerOrStaff]
     serializer_class = VideoCompletionSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     ordering_fields = ['updated_at']
+    query_budgets = {'list': 3, 'create': 4}
 
     def get_queryset(self):
         """
@@ -52,18 +219,84 @@ class VideoCompletionViewSet(ModelViewSet):
             return VideoCompletion.objects.all()
         return VideoCompletion.objects.filter(user=current_user)
     
+    def get_validator_extras(self):
+        return [entry['updated_at'] for entry in get_buffered_progress(self.request.user.pk).values()]
+
+    def apply_buffered_progress(self, completions):
+        """
+        Applies the current user's buffered playback positions to the given video completions
+        and appends those which have not been written to the database yet.
+        """
+        buffered = get_buffered_progress(self.request.user.pk)
+        for completion in completions:
+            entry = buffered.pop(completion.video_id, None) if completion.user_id == self.request.user.pk else None
+            if entry:
+                completion.current_time, completion.updated_at = entry['current_time'], entry['updated_at']
+        for video_pk, entry in buffered.items():
+            completions.append(VideoCompletion(user=self.request.user, video_id=video_pk, **entry))
+        ordering = self.request.query_params.get('ordering')
+        if ordering in ('updated_at', '-updated_at'):
+            completions.sort(key=lambda completion: completion.updated_at, reverse=ordering.startswith('-'))
+        return completions
+
+    def get_list_response(self, request, *args, **kwargs):
+        if not is_write_behind_enabled():
+            return super().get_list_response(request, *args, **kwargs)
+        completions = self.apply_buffered_progress(list(self.filter_queryset(self.get_queryset())))
+        serializer = self.get_serializer(completions, many=True)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not is_write_behind_enabled():
+            return super().retrieve(request, *args, **kwargs)
+        completion = self.get_object()
+        buffered = get_buffered_progress(request.user.pk).get(completion.video_id)
+        if buffered and completion.user_id == request.user.pk:
+            completion.current_time, completion.updated_at = buffered['current_time'], buffered['updated_at']
+        return Response(self.get_serializer(completion).data)
+
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        """
+        Applies a batch of playback positions recorded offline by the client, e.g. after reconnecting.
+        Each entry is applied only if its "client_ts" is newer than the known position (last-writer-wins);
+        the response contains the status ("applied", "stale" or "invalid") and resulting position per entry.
+        """
+        serializer = VideoCompletionSyncSerializer(data=request.data, many=True, max_length=MAX_SYNC_ENTRIES)
+        serializer.is_valid(raise_exception=True)
+        results = VideoCompletion.sync_for_user(
+            request.user, serializer.validated_data, buffered=get_buffered_progress(request.user.pk)
+        )
+        applied = {result['video_id'] for result in results if result['status'] == 'applied'}
+        discard_buffered_progress(request.user.pk, *applied)
+        return Response(results, status=status.HTTP_200_OK)
+
+    def perform_update(self, serializer):
+        """
+        Discards a buffered playback position, which would otherwise overwrite the update on the next flush.
+        """
+        instance = serializer.save()
+        discard_buffered_progress(instance.user_id, instance.video_id)
+
     def create(self, request, *args, **kwargs):
         """
         Customing create method dynamically covering both creation und update of a
         video completion instance, depending on whether or not a video completion
         instance already exists for the requested combination of video and user.
+        If write-behind buffering is enabled, the playback position is buffered in Redis
+        and written to the database by the periodic flush instead. The "202 Accepted" response
+        then contains the video ID, current time and modification date of the buffered entry only.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        if is_write_behind_enabled():
+            video = serializer.validated_data['video']
+            entry = buffer_progress(request.user.pk, video.pk, serializer.validated_data['current_time'])
+            return Response({'video_id': video.pk, **entry}, status=status.HTTP_202_ACCEPTED)
         instance, created = VideoCompletion.objects.update_or_create(
             user=request.user,
             video=serializer.validated_data['video'],
-            defaults={'current_time': serializer.validated_data['current_time']}
+            defaults={'current_time': serializer.validated_data['current_time'], 'recorded_at': now()}
         )
         response_serializer = self.get_serializer(instance)
         headers = self.get_success_headers(response_serializer.data)